@@ -0,0 +1,119 @@
+"""
+Time to read the hashes of the blocks of a synthetic chain of 100k blocks (validation of the links of the whole chain,
+hash of each block) with the previous Block (hash calculated on each access) and the immutable Block
+(hash calculated once at the creation of the block), and check that a block can't be modified.
+Then time of the search of the last global model and of the updates added since (done for each message by the nodes)
+by scanning the chain and with the indexes of Blockchain.
+Run from the root of the repository: python -m benchmarks.bench_chain [n_blocks]
+"""
+import hashlib
+import pickle
+import sys
+import time
+
+from block import Block
+from blockchain import Blockchain
+
+
+class LegacyBlock:
+    # Previous implementation: the hash is calculated on each access
+    def __init__(self, index, model_type, storage_reference, calculated_hash, participants, previous_hash,
+                 layer_hashes=None):
+        self.index = index
+        self.model_type = model_type
+        self.storage_reference = storage_reference
+        self.calculated_hash = calculated_hash
+        self.participants = participants
+        self.previous_hash = previous_hash
+        self.layer_hashes = layer_hashes
+
+    @property
+    def current_hash(self):
+        block_string = (f"{self.index}{self.model_type}{self.storage_reference}"
+                        f"{self.calculated_hash}{self.participants}{self.previous_hash}")
+        return hashlib.sha256(block_string.encode()).hexdigest()
+
+
+def synthetic_chain(block_class, n_blocks):
+    blocks = [block_class(0, "", "", "", ["1"], "")]
+    for index in range(1, n_blocks):
+        model_type = "global_model" if index % 10 == 0 else "update"
+        calculated_hash = hashlib.sha256(str(index).encode()).hexdigest()
+        blocks.append(block_class(index, model_type, f"models/BFL/m{index}.npz", calculated_hash,
+                                  ["c0_1", "c0_2", "c0_3"], blocks[-1].current_hash))
+    return blocks
+
+
+def legacy_verify_chain(blocks):
+    # Same checks as Blockchain.verify_chain
+    for previous_block, block in zip(blocks, blocks[1:]):
+        if block.index != previous_block.index + 1 or block.previous_hash != previous_block.current_hash:
+            return False
+    return True
+
+
+def scan_last_global(blocks):
+    # Previous implementation of broadcast_model_to_clients and get_weights
+    updates = []
+    for block in blocks[::-1]:
+        if block.model_type == "update":
+            updates.append(block)
+        else:
+            break
+    for block in blocks[::-1]:
+        if block.model_type == "global_model" or block.model_type == "first_global_model":
+            return block, updates
+
+
+def index_last_global(blockchain):
+    return blockchain.last_global_block, blockchain.updates_since_global[::-1]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    n_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    blockchain = Blockchain()
+
+    legacy_blocks, legacy_creation_time = timed(synthetic_chain, LegacyBlock, n_blocks)
+    blocks, creation_time = timed(synthetic_chain, Block, n_blocks)
+    assert all(block.current_hash == legacy_block.current_hash for block, legacy_block in zip(blocks, legacy_blocks))
+
+    legacy_valid, legacy_verify_time = timed(legacy_verify_chain, legacy_blocks)
+    valid, verify_time = timed(blockchain.verify_chain, blocks)
+    assert legacy_valid and valid
+
+    _, legacy_read_time = timed(lambda: [block.current_hash for block in legacy_blocks])
+    _, read_time = timed(lambda: [block.current_hash for block in blocks])
+
+    # A block can't be modified after its creation, and a forged block breaks the chain
+    try:
+        blocks[1].calculated_hash = "0" * 64
+        raise AssertionError("the block must be immutable")
+    except AttributeError:
+        pass
+    forged = Block(1, "update", "forged.npz", "0" * 64, ["c0_1"], blocks[0].current_hash)
+    assert not blockchain.verify_chain([blocks[0], forged] + blocks[2:10])
+    assert pickle.loads(pickle.dumps(blocks[5])).current_hash == blocks[5].current_hash
+
+    for block in blocks[1:]:
+        blockchain.add_block(block)
+    assert blockchain.verify_chain()
+    repeat = 1000
+    scanned, scan_time = timed(lambda: [scan_last_global(blockchain.blocks) for _ in range(repeat)])
+    indexed, index_time = timed(lambda: [index_last_global(blockchain) for _ in range(repeat)])
+    assert scanned[0] == indexed[0]
+    assert blockchain.get_block_by_hash(blocks[-1].current_hash) is blocks[-1]
+
+    print(f"{n_blocks} blocks")
+    print(f"creation:\tprevious: {legacy_creation_time * 1000:.0f} ms\timmutable: {creation_time * 1000:.0f} ms")
+    print(f"verification of the chain:\tprevious: {legacy_verify_time * 1000:.0f} ms\t"
+          f"immutable: {verify_time * 1000:.0f} ms")
+    print(f"reading the hash of each block:\tprevious: {legacy_read_time * 1000:.0f} ms\t"
+          f"immutable: {read_time * 1000:.0f} ms")
+    print(f"last global model and updates since:\tscan of the chain: {scan_time / repeat * 1e6:.0f} us\t"
+          f"indexes: {index_time / repeat * 1e6:.1f} us")
@@ -0,0 +1,88 @@
+"""
+Cold start of a node from the log of its chain (chain_store.ChainLog): time to rebuild a chain of 50k blocks and its
+indexes with and without the checkpoint, compared with the parsing of the text file of save_chain_in_file,
+time to append the blocks with each fsync policy, and recovery of a record partially written by a crash.
+Run from the root of the repository: python -m benchmarks.bench_chain_store [n_blocks]
+"""
+import os
+import re
+import sys
+import tempfile
+import time
+
+from block import Block
+from blockchain import Blockchain
+from chain_store import ChainLog, CHECKPOINT_FILE, segment_name
+from benchmarks.bench_chain import synthetic_chain
+
+
+def write_chain(directory, blocks, **kwargs):
+    blockchain = Blockchain(ChainLog(directory, **kwargs))
+    start = time.perf_counter()
+    for block in blocks[1:]:
+        blockchain.add_block(block)
+    append_time = time.perf_counter() - start
+    blockchain.close()
+    return append_time
+
+
+def cold_start(directory):
+    start = time.perf_counter()
+    blockchain = Blockchain(ChainLog(directory))
+    return blockchain, time.perf_counter() - start
+
+
+def parse_text_chain(filename):
+    # Previous way to read a chain (model_evaluation.get_global_model_storage_reference), without the participants
+    with open(filename) as f:
+        content = f.read()
+    pattern = (r"prev_hash:\s*(\S*)\s*\n\s*index:\s*(\d+)\s*\n\s*model type:\s*(\S*)\s*\n\s*storage reference:\s*(\S*)"
+               r"\s*\n\s*calculated hash:\s*(\S*)")
+    return re.findall(pattern, content)
+
+
+if __name__ == "__main__":
+    n_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    blocks = synthetic_chain(Block, n_blocks)
+
+    with tempfile.TemporaryDirectory() as directory:
+        chain_directory = os.path.join(directory, "n1")
+        write_chain(chain_directory, blocks, fsync="never", checkpoint_every=1000)
+
+        blockchain, checkpoint_time = cold_start(chain_directory)
+        assert blockchain.len_chain == n_blocks and blockchain.last_block.current_hash == blocks[-1].current_hash
+        assert blockchain.last_global_block.current_hash == [b for b in blocks if b.model_type == "global_model"][-1].current_hash
+        assert blockchain.store.tail()["current_hash"] == blocks[-1].current_hash
+        blockchain.close()
+
+        # Without checkpoint all the records are checked (crc32)
+        os.remove(os.path.join(chain_directory, CHECKPOINT_FILE))
+        blockchain, scan_time = cold_start(chain_directory)
+        assert blockchain.len_chain == n_blocks
+
+        # Crash during the writing of a block: the incomplete record is removed at the start
+        with open(os.path.join(chain_directory, segment_name(blockchain.store.segment)), "ab") as f:
+            f.write(b"\x00\x00\x01\x00partial")
+        blockchain.store.file.close()
+        blockchain, _ = cold_start(chain_directory)
+        assert blockchain.len_chain == n_blocks
+        blockchain.close()
+
+        text_filename = os.path.join(directory, "node1.txt")
+        blockchain.save_chain_in_file(text_filename)
+        start = time.perf_counter()
+        parsed = parse_text_chain(text_filename)
+        text_time = time.perf_counter() - start
+        assert len(parsed) == n_blocks
+
+        append_times = {}
+        n_appends = min(n_blocks, 2000)
+        for fsync in ["never", "batch", "always"]:
+            append_times[fsync] = write_chain(os.path.join(directory, fsync), blocks[:n_appends], fsync=fsync)
+
+    print(f"{n_blocks} blocks")
+    print(f"cold start with the checkpoint:\t{checkpoint_time * 1000:.0f} ms")
+    print(f"cold start without the checkpoint (all the records checked):\t{scan_time * 1000:.0f} ms")
+    print(f"parsing of the text file of save_chain_in_file (regex, no Block built):\t{text_time * 1000:.0f} ms")
+    for fsync, append_time in append_times.items():
+        print(f"append, fsync {fsync}:\t{append_time / (n_appends - 1) * 1e6:.0f} us/block")
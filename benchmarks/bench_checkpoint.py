@@ -0,0 +1,68 @@
+"""
+Load time of a model saved in a .npz file (np.savez and np.savez_compressed) and in the memory-mapped checkpoint
+format (model_store.save_checkpoint): opening of the file, reading of all the layers, reading of a single layer,
+and conversion of a .npz file. The files are in the page cache (the same model is loaded repeatedly by the nodes).
+Run from the root of the repository: python -m benchmarks.bench_checkpoint [n_params]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from model_hash import hash_model
+from model_store import convert_npz, load_weights
+from benchmarks.bench_wire import mobilenet_like_weights
+
+
+def timed(function, *args, repeat=10):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(*args)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def read_all(filename):
+    # The weights are read (copied in the model of the node, as flower_client.evaluate does)
+    loaded_weights_dict = load_weights(filename)
+    return {name: np.array(loaded_weights_dict[name]) for name in loaded_weights_dict.keys()}
+
+
+def read_layer(filename, name):
+    return np.array(load_weights(filename)[name])
+
+
+def open_file(filename):
+    loaded_weights_dict = load_weights(filename)
+    return list(loaded_weights_dict.keys())
+
+
+if __name__ == "__main__":
+    n_params = int(sys.argv[1]) if len(sys.argv) > 1 else 3_500_000
+    weights = {f"layer{i}": w for i, w in enumerate(mobilenet_like_weights(n_params))}
+    weights["len_dataset"] = np.array(10)
+    last_layer = max(weights, key=lambda name: weights[name].size)
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = {
+            ".npz": os.path.join(directory, "model.npz"),
+            ".npz compressed": os.path.join(directory, "compressed.npz"),
+        }
+        np.savez(files[".npz"], **weights)
+        np.savez_compressed(files[".npz compressed"], **weights)
+        files[".ckpt"], conversion_time = timed(convert_npz, files[".npz"], repeat=3)
+
+        loaded = read_all(files[".ckpt"])
+        assert all(np.array_equal(loaded[name], weights[name]) and loaded[name].dtype == weights[name].dtype
+                   for name in weights)
+        assert hash_model(load_weights(files[".ckpt"])) == hash_model(weights)
+
+        print(f"{n_params} weights ({sum(w.nbytes for w in weights.values()) / 1e6:.1f} MB)")
+        print(f"conversion .npz -> .ckpt:\t{conversion_time * 1000:.1f} ms")
+        for format_name, filename in files.items():
+            _, open_time = timed(open_file, filename)
+            _, all_time = timed(read_all, filename)
+            _, layer_time = timed(read_layer, filename, last_layer)
+            print(f"{format_name}:\t{os.path.getsize(filename) / 1e6:.1f} MB\topen: {open_time * 1000:.2f} ms\t"
+                  f"all the layers: {all_time * 1000:.1f} ms\tlargest layer: {layer_time * 1000:.2f} ms")
@@ -0,0 +1,56 @@
+"""
+Bytes on the wire and time of the broadcast of the global model, full or as a compressed delta,
+over rounds of a simulated training of a 3.5M-parameter model.
+Run from the root of the repository: python -m benchmarks.bench_compression
+"""
+import time
+
+import numpy as np
+
+from going_modular.compression import encode_delta, apply_delta
+from transport import encode_message, payload_size
+from benchmarks.bench_wire import mobilenet_like_weights
+
+
+CODECS = {
+    "full": None,
+    "delta": {},
+    "delta zlib": {"entropy": "zlib"},
+    "delta fp16": {"quantization": "fp16"},
+    "delta top-10% fp16": {"ratio": 0.1, "quantization": "fp16"},
+    "delta top-1% int8 zlib": {"ratio": 0.01, "quantization": "int8", "entropy": "zlib"},
+}
+
+
+def simulate_rounds(n_rounds=25, seed=42):
+    # Consecutive global models differ only slightly: a small update on each round
+    rng = np.random.default_rng(seed)
+    weights = mobilenet_like_weights()
+    models = [weights]
+    for _ in range(n_rounds - 1):
+        models.append([w + rng.normal(0, 1e-3, w.shape).astype(w.dtype) * (rng.random(w.shape) < 0.2)
+                       for w in models[-1]])
+    return models
+
+
+if __name__ == "__main__":
+    models = simulate_rounds()
+    for name, codec in CODECS.items():
+        client_view = None
+        total_bytes, total_time = 0, 0.
+        for weights in models:
+            start = time.perf_counter()
+            if codec is None or client_view is None:
+                message = {"type": "global_model", "value": weights}
+                new_view = weights
+            else:
+                delta = encode_delta(weights, client_view, **codec)
+                message = {"type": "global_model", "delta": delta}
+                new_view = apply_delta(client_view, delta)
+            total_bytes += payload_size(encode_message(message))
+            total_time += time.perf_counter() - start
+            client_view = new_view
+
+        error = max(float(np.max(np.abs(a - b))) for a, b in zip(client_view, models[-1]))
+        print(f"{name}:\t{total_bytes / len(models) / 1e6:.2f} MB/round\t"
+              f"{total_time / len(models) * 1000:.0f} ms/round\tmax error: {error:.2e}")
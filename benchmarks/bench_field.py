@@ -0,0 +1,58 @@
+"""
+Time of a round of secret sharing for a cluster (sharing by each client, sums of the shares, reconstruction of the mean
+by the node) and error of the reconstruction, on floats (additif, shamir) and over the prime field.
+Run from the root of the repository: python -m benchmarks.bench_field [n_weights]
+"""
+import copy
+import sys
+import time
+
+import numpy as np
+
+from going_modular.security import apply_smpc, sum_shares, aggregate_shamir, aggregate_field
+
+
+def aggregate_additif(secret_list):
+    # Same as the aggregation of the node (flwr aggregate with the same weight for each client)
+    return [np.mean([secret[layer] for secret in secret_list], axis=0) for layer in range(len(secret_list[0]))]
+
+
+def run_round(client_weights, type_ss, threshold=3):
+    n_clients = len(client_weights)
+    timings = {}
+
+    start = time.perf_counter()
+    shares = [apply_smpc(weights, n_clients, type_ss, threshold) for weights in client_weights]
+    secret_shape = shares[0][1]
+    timings["sharing"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    secret_list = [sum_shares([shares[j][0][i] for j in range(n_clients)], type_ss) for i in range(n_clients)]
+    timings["sums"] = time.perf_counter() - start
+
+    secret_list = copy.deepcopy(secret_list)
+    start = time.perf_counter()
+    if type_ss == "additif":
+        result = aggregate_additif(secret_list)
+    elif type_ss == "shamir":
+        result = aggregate_shamir(secret_list, secret_shape, threshold)
+    else:
+        result = aggregate_field(secret_list, secret_shape, type_ss, threshold)
+    timings["reconstruction"] = time.perf_counter() - start
+
+    return result, timings
+
+
+if __name__ == "__main__":
+    n_weights = int(sys.argv[1]) if len(sys.argv) > 1 else 2_200_000
+    n_clients = 4
+    rng = np.random.default_rng(42)
+    client_weights = [[rng.normal(0, 0.1, n_weights).astype(np.float32)] for _ in range(n_clients)]
+    mean = np.mean([weights[0] for weights in client_weights], axis=0)
+
+    print(f"{n_clients} clients, {n_weights} weights")
+    for type_ss in ["additif", "additif_field", "shamir", "shamir_field"]:
+        result, timings = run_round(client_weights, type_ss)
+        error = float(np.max(np.abs(result[0] - mean)))
+        print(f"{type_ss}:\t" + "\t".join(f"{name}: {value * 1000:.0f} ms" for name, value in timings.items())
+              + f"\tmax error: {error:.2e}")
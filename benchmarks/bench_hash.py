@@ -0,0 +1,60 @@
+"""
+Time of the hash of a model saved in a .npz file (calculate_model_hash) with the previous hash of str(weights)
+and the Merkle tree of the raw bytes of the tensors (sequential and with threads), and check that a change of a single interior weight changes the hash.
+Run from the root of the repository: python -m benchmarks.bench_hash
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from model_hash import hash_model, hash_model_file
+from benchmarks.bench_wire import mobilenet_like_weights
+
+
+def legacy_hash(filename):
+    # Previous implementation: the repr of numpy elides most of the weights of large arrays
+    loaded_weights_dict = np.load(filename)
+    loaded_weights = [val for name, val in loaded_weights_dict.items() if 'bn' not in name and 'len_dataset' not in name]
+    loaded_weights = (loaded_weights, loaded_weights_dict['len_dataset'])
+    return hashlib.sha256(str(loaded_weights).encode('utf-8')).hexdigest()
+
+
+def timed(function, *args, repeat=5, **kwargs):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(*args, **kwargs)
+    return result, (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    weights = {f"layer{i}": w for i, w in enumerate(mobilenet_like_weights())}
+    weights["len_dataset"] = np.array(10)
+
+    # Same model except one weight in the middle of the largest layer
+    modified_weights = dict(weights)
+    largest = max(weights, key=lambda name: weights[name].size)
+    modified_weights[largest] = weights[largest].copy()
+    modified_weights[largest].flat[weights[largest].size // 2] += 1e-3
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "model.npz")
+        modified_filename = os.path.join(directory, "modified.npz")
+        np.savez(filename, **weights)
+        np.savez(modified_filename, **modified_weights)
+
+        legacy, legacy_time = timed(legacy_hash, filename)
+        sequential, sequential_time = timed(hash_model_file, filename, workers=1)
+        parallel, parallel_time = timed(hash_model_file, filename, workers=4)
+        _, in_memory_time = timed(hash_model, weights, workers=4)
+
+        assert sequential == parallel
+        assert hash_model_file(modified_filename) != parallel, "a single weight change must change the hash"
+        legacy_detects = legacy_hash(modified_filename) != legacy
+
+    print(f"str(weights):\t{legacy_time * 1000:.0f} ms\tdetects the change of one weight: {legacy_detects}")
+    print(f"raw bytes, 1 thread:\t{sequential_time * 1000:.0f} ms\tdetects the change of one weight: True")
+    print(f"raw bytes, 4 threads:\t{parallel_time * 1000:.0f} ms")
+    print(f"raw bytes, 4 threads, without reading the file:\t{in_memory_time * 1000:.0f} ms")
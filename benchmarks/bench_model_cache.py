@@ -0,0 +1,87 @@
+"""
+Loads of the models during a simulated PBFT round of 3 nodes (one thread per node): for each of the 6 updates of the
+round, each node evaluates the update and the global model (is_update_usefull), then each node aggregates the updates
+(get_weights), hashes the global model and broadcasts it. Time of the round with a np.load and a hash for each access,
+and with the cache of the decoded models (model_store.ModelCache), with its hit/miss counters.
+Run from the root of the repository: python -m benchmarks.bench_model_cache [n_params]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from model_hash import model_tree
+from model_store import ModelCache, load_weights
+from benchmarks.bench_wire import mobilenet_like_weights
+
+
+N_NODES = 3
+N_UPDATES = 6
+
+
+class Uncached:
+    # Previous behaviour: the file is read (and hashed) for each access
+    def get(self, reference):
+        loaded_weights_dict = load_weights(reference)
+        return Model({name: loaded_weights_dict[name] for name in loaded_weights_dict.files})
+
+
+class Model:
+    def __init__(self, weights_dict):
+        self.weights_dict = weights_dict
+        self.weights = [val for name, val in weights_dict.items() if 'len_dataset' not in name]
+
+    def layer_hashes(self, cache=None):
+        return model_tree(self.weights_dict)
+
+
+def node_round(cache, updates, global_reference):
+    for reference in updates:
+        np.sum(cache.get(reference).weights[-2])
+        np.sum(cache.get(global_reference).weights[-2])
+    np.mean([cache.get(reference).weights[-2] for reference in updates], axis=0)
+    cache.get(global_reference).layer_hashes()
+    cache.get(global_reference).weights
+
+
+def run_round(cache, updates, global_reference):
+    threads = [threading.Thread(target=node_round, args=(cache, updates, global_reference)) for _ in range(N_NODES)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    n_params = int(sys.argv[1]) if len(sys.argv) > 1 else 3_500_000
+    weights = {f"layer{i}": w for i, w in enumerate(mobilenet_like_weights(n_params))}
+
+    with tempfile.TemporaryDirectory() as directory:
+        references = []
+        for i in range(N_UPDATES + 1):
+            references.append(os.path.join(directory, f"m{i}.npz"))
+            np.savez(references[-1], **{name: w + i for name, w in weights.items()}, len_dataset=10)
+        global_reference, updates = references[0], references[1:]
+
+        uncached_time = run_round(Uncached(), updates, global_reference)
+
+        cache = ModelCache()
+        cached_time = run_round(cache, updates, global_reference)
+        stats = cache.stats()
+        assert stats["misses"] == N_UPDATES + 1, "each model must be read once"
+        assert cache.get(global_reference).layer_hashes() == model_tree(load_weights(global_reference))
+
+        # Cache smaller than a round: the least recently used models are evicted
+        small_cache = ModelCache(max_bytes=int(3.5 * sum(w.nbytes for w in weights.values())))
+        small_time = run_round(small_cache, updates, global_reference)
+        assert small_cache.stats()["bytes"] <= small_cache.max_bytes
+
+    print(f"{N_NODES} nodes, {N_UPDATES} updates, model of {sum(w.nbytes for w in weights.values()) / 1e6:.1f} MB")
+    print(f"np.load and hash at each access:\t{uncached_time * 1000:.0f} ms")
+    print(f"cache of the decoded models:\t{cached_time * 1000:.0f} ms\t{stats}")
+    print(f"cache of 3 models:\t{small_time * 1000:.0f} ms\t{small_cache.stats()}")
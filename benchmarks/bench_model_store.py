@@ -0,0 +1,91 @@
+"""
+Disk usage and load time of the models written during a simulated BFL run (3 nodes, 2 clusters per node, 25 rounds
+like config.py): a .npz file per model (with the temp.npz written by each node to validate the global model) and the
+content-addressed store (model_store.ModelStore).
+The training is simulated: all the layers change at each round ("fine-tuning"), or only the classifier ("frozen
+backbone"). Each round every node loads each update twice (evaluation and aggregation), the global model once per
+update (evaluation) and once to broadcast it.
+Run from the root of the repository: python -m benchmarks.bench_model_store [n_rounds] [n_params]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from model_hash import model_tree, tree_root
+from model_store import ModelStore, directory_size, load_weights
+from benchmarks.bench_wire import mobilenet_like_weights
+
+
+N_NODES = 3
+N_CLUSTERS = 2
+
+
+def simulate(directory, use_store, n_rounds, global_weights, trainable):
+    rng = np.random.default_rng(0)
+    store = ModelStore(os.path.join(directory, "store")) if use_store else None
+    load_time = 0
+
+    def save(weights_dict, filename):
+        if store is not None:
+            return store.put(weights_dict)[0]
+        with open(filename, "wb") as f:
+            np.savez(f, **weights_dict)
+        return filename
+
+    def load_all(reference):
+        # The weights are read (copied in the model of the node)
+        loaded_weights_dict = load_weights(reference)
+        return [np.array(val) for name, val in loaded_weights_dict.items() if 'len_dataset' not in name]
+
+    global_reference = save({**global_weights, "len_dataset": 0}, os.path.join(directory, "m0.npz"))
+    for round_i in range(n_rounds):
+        updates = []
+        for cluster in range(N_NODES * N_CLUSTERS):
+            update = {name: w + rng.normal(0, 1e-3, w.shape).astype(w.dtype) if name in trainable else w
+                      for name, w in global_weights.items()}
+            updates.append(save({**update, "len_dataset": 10}, os.path.join(directory, f"u{round_i}_{cluster}.npz")))
+
+        start = time.perf_counter()
+        for _ in range(N_NODES):
+            for reference in updates:
+                load_all(reference)
+                load_all(global_reference)
+            aggregated = [np.mean(layers, axis=0) for layers in zip(*[load_all(reference) for reference in updates])]
+        load_time += time.perf_counter() - start
+
+        global_weights = {name: layer.astype(global_weights[name].dtype)
+                          for name, layer in zip(global_weights, aggregated)}
+        global_reference = save({**global_weights, "len_dataset": 10}, os.path.join(directory, f"g{round_i}.npz"))
+
+        # Validation of the global model by the other nodes
+        for node in range(1, N_NODES):
+            if store is None:
+                save({**global_weights, "len_dataset": 10}, os.path.join(directory, f"n{node + 1}temp.npz"))
+            else:
+                assert tree_root(model_tree({**global_weights, "len_dataset": 10})) in global_reference
+
+        start = time.perf_counter()
+        for _ in range(N_NODES):
+            load_all(global_reference)
+        load_time += time.perf_counter() - start
+
+    return directory_size(directory), load_time
+
+
+if __name__ == "__main__":
+    n_rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 25
+    n_params = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000_000
+    global_weights = {f"layer{i}": w for i, w in enumerate(mobilenet_like_weights(n_params))}
+    names = list(global_weights)
+    model_size = sum(w.nbytes for w in global_weights.values())
+
+    print(f"{n_rounds} rounds, {N_NODES} nodes, {N_CLUSTERS} clusters per node, model of {model_size / 1e6:.1f} MB")
+    for scenario, trainable in [("fine-tuning", names), ("frozen backbone", names[-2:])]:
+        for use_store in [False, True]:
+            with tempfile.TemporaryDirectory() as directory:
+                disk_usage, load_time = simulate(directory, use_store, n_rounds, global_weights, set(trainable))
+            print(f"{scenario}, {'content-addressed store' if use_store else '.npz per model'}:\t"
+                  f"disk usage: {disk_usage / 1e6:.0f} MB\tload time: {load_time:.2f} s")
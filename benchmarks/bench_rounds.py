@@ -0,0 +1,189 @@
+"""
+Wall time of the BFL rounds outside of the training and the evaluations (which take the same time before and after):
+the fixed waits of the previous round driver for the settings of config.py (10 s before the first global model, ts
+after it, 5 s per client and ts per cluster, ts per node and per round; the 10 s of each prepare overlapped them), and
+the time of the event-driven rounds where the consensus is run by the PBFTProtocol of each node (Ed25519 signatures,
+messages delivered in order by one thread per pair of nodes after LATENCY, the updates evaluated as useful after
+EVALUATION_TIME as the evaluation of a model, one at a time by node) and the driver waits for the blocks added by all
+the nodes (round_events).
+The updates are proposed one at a time (PBFT window of 1 block), all the updates of a round at once (window of
+pbft_window blocks), or in batches of BATCH_SIZE updates, with 2 to 8 clusters per node; with the number of
+messages (signed and verified) per update.
+Run from the root of the repository: python -m benchmarks.bench_rounds [n_rounds]
+"""
+import contextlib
+import logging
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from blockchain import Blockchain
+from config import settings
+from protocols.pbft_protocol import PBFTProtocol
+from round_events import round_events
+from signatures import SignatureVerifier, generate_private_key, message_digest, sign
+
+
+BATCH_SIZE = 6  # updates per block of the batched configuration (pbft_batch_size)
+EVALUATION_TIME = 0.02  # seconds
+LATENCY = 0.01  # seconds
+
+
+class SimulatedNode:
+    # The parts of node.Node used by PBFTProtocol, the messages are delivered in the process
+    def __init__(self, id, network, window, batch_size=1):
+        self.id = id
+        self.network = network
+        self.private_key = generate_private_key("ed25519")
+        self.verifier = SignatureVerifier()
+        self.peers = {}
+        self.global_params_directory = ""
+        self.evaluation_lock = threading.Lock()
+        self.blockchain = Blockchain()
+        self.consensus_protocol = PBFTProtocol(node=self, blockchain=self.blockchain, window=window,
+                                               batch_size=batch_size, batch_delay=settings["pbft_batch_delay"])
+
+    def handle_message(self, message):
+        self.consensus_protocol.handle_message(message)
+
+    def on_block_added(self, block):
+        pass
+
+    def verify_model_layers(self, block):
+        # The models are not written, their hashes are part of the evaluation time
+        return []
+
+    def is_update_usefull(self, model_directory, participants):
+        # The model of a node is evaluated by one thread at a time
+        with self.evaluation_lock:
+            time.sleep(EVALUATION_TIME)
+        return True
+
+    def signed_message(self, message):
+        return dict(message, signature=sign(self.private_key, message_digest(message, self.id)), id=self.id)
+
+    def broadcast_message(self, message):
+        signed_message = self.signed_message(message)
+        for peer_id in self.peers:
+            self.network.send(self.id, peer_id, signed_message)
+
+    def send_message(self, peer_id, message):
+        self.network.send(self.id, peer_id, self.signed_message(message))
+
+    def verify_signature(self, signature, message, public_key, sender):
+        return self.verifier.verify(public_key, signature, message_digest(message, sender))
+
+    def request(self, model_type, participants):
+        message = {"id": self.id, "type": "request",
+                   "content": {"storage_reference": f"models/BFL/{uuid.uuid4().hex[:8]}.npz",
+                               "model_type": model_type, "calculated_hash": "0" * 64, "layer_hashes": None,
+                               "participants": participants}}
+        return self.consensus_protocol.handle_message(message)
+
+
+class Network:
+    # One queue and one thread per pair of nodes, like a connection of transport.ConnectionPool
+    def __init__(self):
+        self.nodes = {}
+        self.queues = {}
+        self.messages = 0
+
+    def send(self, sender, receiver, message):
+        self.messages += 1
+        if (sender, receiver) not in self.queues:
+            self.queues[(sender, receiver)] = queue.Queue()
+            threading.Thread(target=self.deliver, args=(self.queues[(sender, receiver)], self.nodes[receiver]),
+                             daemon=True).start()
+        self.queues[(sender, receiver)].put((time.perf_counter() + LATENCY, message))
+
+    def deliver(self, messages, node):
+        while True:
+            arrival, message = messages.get()
+            time.sleep(max(0.0, arrival - time.perf_counter()))
+            node.handle_message(message)
+            messages.task_done()
+
+    def join(self):
+        # Wait for the messages still in flight (the commits received after the block is added)
+        for messages in list(self.queues.values()):
+            messages.join()
+
+
+def fixed_waits(n_rounds):
+    # Time (s) of the sleeps of the previous driver of main_bfl and of PBFTProtocol.prepare
+    n_nodes = settings["number_of_nodes"]
+    n_clusters = settings["number_of_clients_per_node"] // settings["min_number_of_clients_in_cluster"]
+    per_node = n_clusters * (settings["min_number_of_clients_in_cluster"] * 5 + settings["ts"]) + settings["ts"]
+    return 10 + settings["ts"] + n_rounds * (n_nodes * per_node + settings["ts"])
+
+
+def event_driven_rounds(n_rounds, n_clusters, window, batch_size=1):
+    network = Network()
+    nodes = [SimulatedNode(f"n{i + 1}", network, window, batch_size) for i in range(settings["number_of_nodes"])]
+    for node in nodes:
+        network.nodes[node.id] = node
+        node.peers = {peer.id: {"public_key": peer.private_key.public_key()} for peer in nodes if peer is not node}
+
+    timeout = settings["round_timeout"]
+
+    def wait_chains(length):
+        assert round_events.wait_until(lambda: all(node.blockchain.len_chain >= length for node in nodes), timeout,
+                                       f"block {length - 1}")
+
+    start = time.perf_counter()
+    nodes[0].request("first_global_model", ["1", "2"])
+    wait_chains(2)
+    for _ in range(n_rounds):
+        length = nodes[0].blockchain.len_chain
+        for node in nodes:
+            for cluster in range(n_clusters):
+                node.request("update", [f"c{node.id}_{cluster}"])
+                length += 1
+                if window == 1:
+                    # One block at a time
+                    wait_chains(length)
+
+        wait_chains(length)
+
+        nodes[0].request("global_model", ["1", "2"])
+        wait_chains(nodes[0].blockchain.len_chain + 1)
+
+    elapsed = time.perf_counter() - start
+    network.join()
+    assert all(node.blockchain.verify_chain() for node in nodes)
+    assert len({node.blockchain.last_block.current_hash for node in nodes}) == 1
+    return elapsed, network.messages / (n_rounds * len(nodes) * n_clusters)
+
+
+if __name__ == "__main__":
+    n_rounds = int(sys.argv[1]) if len(sys.argv) > 1 else settings["n_rounds"]
+    with tempfile.TemporaryDirectory() as directory:
+        # PBFTProtocol writes its votes in results/BFL/output.txt
+        os.chdir(directory)
+        os.makedirs("results/BFL")
+        logging.disable(logging.WARNING)
+        cluster_counts = [2, 4, 8]
+        configurations = {
+            "window of 1 block": (1, 1),
+            f"window of {settings['pbft_window']} blocks": (settings["pbft_window"], 1),
+            f"window of {settings['pbft_window']} blocks, batches of {BATCH_SIZE} updates":
+                (settings["pbft_window"], BATCH_SIZE),
+        }
+        results = {}
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for name, configuration in configurations.items():
+                for n_clusters in cluster_counts:
+                    results[(name, n_clusters)] = event_driven_rounds(n_rounds, n_clusters, *configuration)
+
+    print(f"{n_rounds} rounds, {settings['number_of_nodes']} nodes, latency: {LATENCY} s, "
+          f"evaluation of an update: {EVALUATION_TIME} s")
+    print(f"previous driver, fixed waits (2 clusters per node): {fixed_waits(n_rounds):.0f} s")
+    print("event-driven rounds: s (messages per update)\t" + "\t".join(f"{n} clusters per node"
+                                                                      for n in cluster_counts))
+    for name in configurations:
+        print(f"{name}:\t" + "\t".join(f"{results[(name, n)][0]:.2f} ({results[(name, n)][1]:.1f})"
+                                        for n in cluster_counts))
@@ -0,0 +1,125 @@
+"""
+Throughput of Shamir's secret sharing (apply_smpc with type_ss="shamir") in weights/s,
+with the previous implementation (one polynomial evaluated at a time in Python) and the vectorized one,
+then time of the reconstruction by the node (aggregate_shamir) with one Lagrange interpolation per weight
+and with the precomputed coefficients.
+Run from the root of the repository: python -m benchmarks.bench_security [n_weights]
+"""
+import copy
+import sys
+import time
+
+import numpy as np
+
+from going_modular import security
+from going_modular.security import (apply_smpc, combine_shares_node, decrypt_shamir_node, generate_secret_shamir,
+                                    sum_shares)
+
+
+def legacy_calculate_y(x, poly):
+    return sum([poly[i] * x ** i for i in range(len(poly))])
+
+
+def legacy_apply_poly(S, N, K):
+    # Previous implementation: list comprehension per weight and evaluation point by point
+    poly = np.array([[S[i]] + [0] * (K - 1) for i in range(len(S))])
+    poly[:, 1:] = np.random.randint(1, 996, np.shape(poly[:, 1:])) + 1
+    points = np.array([
+        [
+            (x, legacy_calculate_y(x, poly[i])) for x in range(1, N + 1)
+        ] for i in range(len(S))
+    ]).T
+    return points
+
+
+def legacy_decrypt_shamir_node(secret_dic_final, secret_shape, m):
+    # Previous implementation: one Lagrange interpolation per weight
+    x_combine = list(secret_dic_final.keys())
+    y_combine = list(secret_dic_final.values())
+    decrypted_result = []
+    for layer in range(len(y_combine[0])):
+        list_x = []
+        list_y = []
+        for i in range(m):
+            y = y_combine[i][layer]
+            x = np.ones(y.shape) * x_combine[i]
+            list_x.append(x)
+            list_y.append(y)
+
+        all_x_layer = np.array(list_x).T
+        all_y_layer = np.array(list_y).T
+
+        decrypted_result.append(
+            np.round(
+                [generate_secret_shamir(all_x_layer[i], all_y_layer[i], m) for i in range(len(all_x_layer))],
+                4).reshape(secret_shape[layer]) / len(x_combine)
+        )
+
+    return decrypted_result
+
+
+def cluster_shares(weights, n_clients, threshold):
+    """
+    Sums of the shares sent to the node by the clients of a cluster (secret_list of aggregate_shamir)
+    """
+    shares = [apply_smpc(weights, n_clients, "shamir", threshold)[0] for _ in range(n_clients)]
+    return [sum_shares([shares[j][i] for j in range(n_clients)], "shamir") for i in range(n_clients)]
+
+
+def bench_reconstruction(decrypt, secret_list, secret_shape, m, **kwargs):
+    # combine_shares_node sums the shares in place, so it is given a copy
+    start = time.perf_counter()
+    result = decrypt(combine_shares_node(copy.deepcopy(secret_list)), secret_shape, m, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_sharing(weights, n_shares, threshold, seed=0):
+    np.random.seed(seed)
+    start = time.perf_counter()
+    shares, _ = apply_smpc(weights, n_shares, "shamir", threshold)
+    return shares, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    n_weights = int(sys.argv[1]) if len(sys.argv) > 1 else 2_200_000
+    n_shares, threshold = 4, 3
+    rng = np.random.default_rng(42)
+    weights = [rng.normal(0, 0.1, n_weights).astype(np.float32)]
+    # The previous implementation needs minutes for a whole model, it is measured on a sample
+    sample = [weights[0][:min(n_weights, 100_000)]]
+
+    vectorized_apply_poly = security.apply_poly
+    security.apply_poly = legacy_apply_poly
+    legacy_shares, legacy_time = bench_sharing(sample, n_shares, threshold)
+    security.apply_poly = vectorized_apply_poly
+
+    # Same shares for the same seed
+    shares, _ = bench_sharing(sample, n_shares, threshold)
+    assert all(x == legacy_x and np.array_equal(y[0], legacy_y[0])
+               for (x, y), (legacy_x, legacy_y) in zip(shares, legacy_shares))
+
+    _, vectorized_time = bench_sharing(weights, n_shares, threshold)
+
+    print(f"{n_shares} shares, threshold {threshold}")
+    print(f"previous implementation:\t{sample[0].size / legacy_time:.0f} weights/s")
+    print(f"vectorized implementation:\t{n_weights / vectorized_time:.0f} weights/s "
+          f"({n_weights} weights in {vectorized_time:.2f} s)")
+
+    # Reconstruction by the node
+    secret_shape = [w.shape for w in weights]
+    secret_list = cluster_shares(weights, n_shares, threshold)
+    sample_list = [{x: [y[0][:sample[0].size]] for x, y in sums.items()} for sums in secret_list]
+
+    legacy_result, legacy_time = bench_reconstruction(legacy_decrypt_shamir_node, sample_list, [sample[0].shape],
+                                                      threshold)
+    result, _ = bench_reconstruction(decrypt_shamir_node, sample_list, [sample[0].shape], threshold)
+    assert np.allclose(result[0], legacy_result[0], atol=1e-3)
+
+    _, vectorized_time = bench_reconstruction(decrypt_shamir_node, secret_list, secret_shape, threshold)
+    _, chunked_time = bench_reconstruction(decrypt_shamir_node, secret_list, secret_shape, threshold,
+                                           chunk_size=100_000)
+    print(f"reconstruction, previous implementation:\t{sample[0].size / legacy_time:.0f} weights/s")
+    print(f"reconstruction, Lagrange coefficients:\t{n_weights / vectorized_time:.0f} weights/s "
+          f"({n_weights} weights in {vectorized_time * 1000:.0f} ms)")
+    print(f"reconstruction, chunks of 100000 weights:\t{n_weights / chunked_time:.0f} weights/s "
+          f"({n_weights} weights in {chunked_time * 1000:.0f} ms)")
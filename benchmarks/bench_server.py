@@ -0,0 +1,75 @@
+"""
+Load test of the two server modes: replay the messages of a PBFT round and measure the handling latency.
+Run from the root of the repository: python -m benchmarks.bench_server [n_nodes] [recording.pkl]
+A recording is a pickled list of the messages received by a node during a round; without it a round is generated.
+"""
+import hashlib
+import json
+import pickle
+import sys
+import threading
+import time
+
+import numpy as np
+
+from transport import ConnectionPool, start_server
+
+
+def generate_pbft_round(n_nodes, n_blocks):
+    """
+    Messages received by one node during a round: the pre-prepare, prepare and commit of each block from each peer
+    """
+    messages = []
+    for index in range(1, n_blocks + 1):
+        content = {"index": index, "model_type": "update", "storage_reference": f"models/BFL/m{index}.npz",
+                   "calculated_hash": "0" * 64, "participants": ["c0_1", "c0_2", "c0_3"],
+                   "previous_hash": "0" * 64, "current_hash": "0" * 64}
+        for message_type in ["pre-prepare", "prepare", "commit"]:
+            for peer in range(1, n_nodes):
+                messages.append({"type": message_type, "content": content, "signature": "0" * 344, "id": f"n{peer}"})
+
+    return messages
+
+
+def replay(mode, port, messages):
+    latencies = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def handle_message(message):
+        # Stand-in for the signature check and the bookkeeping of a PBFT message
+        for _ in range(200):
+            hashlib.sha256(json.dumps(message["content"]).encode()).hexdigest()
+
+        with lock:
+            latencies.append(time.perf_counter() - message["sent_at"])
+            if len(latencies) == len(messages):
+                done.set()
+
+    threading.Thread(target=start_server, args=("127.0.0.1", port, handle_message, mode, mode), daemon=True).start()
+    time.sleep(0.5)
+
+    # One connection per peer, all the peers send at the same time
+    pools = {message["id"]: ConnectionPool() for message in messages}
+    for message in messages:
+        pools[message["id"]].send(("127.0.0.1", port), {**message, "sent_at": time.perf_counter()})
+
+    done.wait(timeout=120)
+    for pool in pools.values():
+        pool.close()
+
+    return np.array(latencies) * 1000
+
+
+if __name__ == "__main__":
+    n_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "rb") as f:
+            recorded_messages = pickle.load(f)
+    else:
+        recorded_messages = generate_pbft_round(n_nodes, n_blocks=10)
+
+    for i, mode in enumerate(["thread", "asyncio"]):
+        latencies = replay(mode, 6900 + i, recorded_messages)
+        print(f"{mode}:\t{len(latencies)} messages\t"
+              f"p50: {np.percentile(latencies, 50):.2f} ms\tp99: {np.percentile(latencies, 99):.2f} ms")
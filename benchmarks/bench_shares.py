@@ -0,0 +1,87 @@
+"""
+Bytes of the shares sent by the clients of a cluster (to the other clients and to the node) during a round,
+with the full weights or the compressed updates, wall time of the round and error of the model rebuilt by the node.
+Run from the root of the repository: python -m benchmarks.bench_shares [additif|additif_seed|shamir|...]
+"""
+import sys
+import time
+
+import numpy as np
+
+from going_modular.compression import cluster_seed, compress_update, decompress_update, pack_share, unpack_share
+from going_modular.security import apply_smpc, sum_shares, aggregate_shamir, aggregate_field
+from transport import encode_message, payload_size
+from benchmarks.bench_wire import mobilenet_like_weights
+
+
+CODECS = {
+    "full weights": None,
+    "fixed point": {},
+    "fixed point zlib": {"entropy": "zlib"},
+    "10% fixed point zlib": {"ratio": 0.1, "entropy": "zlib"},
+    "1% fixed point zlib": {"ratio": 0.01, "entropy": "zlib"},
+}
+
+
+def run_round(global_weights, client_weights, type_ss, codec, threshold=3):
+    participants = [f"c0_{i + 1}" for i in range(len(client_weights))]
+    base_id = "0" * 64
+    seed = cluster_seed(participants, base_id)
+    entropy = codec.get("entropy") if codec is not None else None
+
+    # Sharing by each client
+    bytes_sent = 0
+    received = [[] for _ in participants]
+    for i, weights in enumerate(client_weights):
+        if codec is None:
+            secret = weights
+        else:
+            update = [w - g for w, g in zip(weights, global_weights)]
+            secret, _ = compress_update(update, seed, codec.get("ratio"), codec.get("frac_bits", 16))
+
+        shares, list_shapes = apply_smpc(secret, len(participants), type_ss, threshold)
+        received[i].append(shares.pop())
+        others = [j for j in range(len(participants)) if j != i]
+        for j, share in zip(others, shares):
+            message = {"type": "frag_weights", "value": pack_share(share, entropy)}
+            bytes_sent += payload_size(encode_message(message))
+            received[j].append(unpack_share(message["value"]))
+
+    # Sum of the shares by each client, sent to the node
+    sums = []
+    for i in range(len(participants)):
+        message = {"type": "frag_weights", "id": participants[i], "list_shapes": list_shapes,
+                   "value": pack_share(sum_shares(received[i], type_ss), entropy)}
+        bytes_sent += payload_size(encode_message(message))
+        sums.append(unpack_share(message["value"]))
+
+    # Reconstruction of the mean by the node
+    if type_ss in ["additif", "additif_seed"]:
+        aggregated = [np.mean([s[layer] for s in sums], axis=0) for layer in range(len(sums[0]))]
+    elif type_ss == "shamir":
+        aggregated = aggregate_shamir(sums, list_shapes, threshold)
+    else:
+        aggregated = aggregate_field(sums, list_shapes, type_ss, threshold)
+
+    if codec is not None:
+        aggregated = decompress_update(aggregated, global_weights, seed, codec.get("ratio"),
+                                       codec.get("frac_bits", 16))
+
+    return bytes_sent, aggregated
+
+
+if __name__ == "__main__":
+    type_ss = sys.argv[1] if len(sys.argv) > 1 else "additif"
+    rng = np.random.default_rng(42)
+    global_weights = mobilenet_like_weights()
+    client_weights = [[w + rng.normal(0, 1e-3, w.shape).astype(w.dtype) for w in global_weights] for _ in range(3)]
+    mean = [np.mean(layers, axis=0) for layers in zip(*client_weights)]
+
+    for name, codec in CODECS.items():
+        start = time.perf_counter()
+        bytes_sent, aggregated = run_round(global_weights, client_weights, type_ss, codec)
+        round_time = time.perf_counter() - start
+        # With a ratio < 1 the coordinates not kept stay at the global model (they are sent in the next rounds)
+        error = max(float(np.max(np.abs(a - b))) for a, b in zip(aggregated, mean))
+        print(f"{type_ss} {name}:\t{bytes_sent / 1e6:.2f} MB/round\t{round_time:.2f} s/round\t"
+              f"max error: {error:.2e}")
@@ -0,0 +1,95 @@
+"""
+PBFT messages handled per second (signature of the sender and verification by the receiver) for one block vs the
+number of nodes: the primary broadcasts the pre-prepare, then each node broadcasts a prepare and a commit.
+Previous implementation (RSA, the broadcast signed again for each peer), broadcast signed once with RSA and Ed25519
+keys, and verification of the messages received by signatures.SignatureVerifier (its cache of the verified
+signatures is measured with each message received twice).
+The signatures are computed in this process for all the nodes, the time is the total CPU time of the block.
+Then the time to sign (and verify) a commit vs the size of the block: json of the whole message vs the fixed-size
+digest of signatures.message_digest.
+Run from the root of the repository: python -m benchmarks.bench_signatures
+"""
+import hashlib
+import json
+import time
+
+from signatures import SignatureVerifier, generate_private_key, message_digest, sign, verify
+
+
+def block_content(n_layers=160, n_participants=3):
+    layer_hashes = {f"layer{i}": hashlib.sha256(str(i).encode()).hexdigest() for i in range(n_layers)}
+    return {"index": 12, "model_type": "update", "storage_reference": "models/BFL/m12_1700000000_0123abcd.npz",
+            "previous_hash": "0" * 64, "calculated_hash": "1" * 64,
+            "participants": [f"c0_{i}" for i in range(n_participants)],
+            "layer_hashes": layer_hashes, "current_hash": "2" * 64}
+
+
+def broadcasts(n_nodes):
+    # (sender, message) of the broadcasts of a block
+    content = block_content()
+    messages = [(0, {"type": "pre-prepare", "content": content})]
+    messages += [(node, {"type": "prepare", "content": content}) for node in range(n_nodes)]
+    messages += [(node, {"type": "commit", "content": {**content, "usefull": True}}) for node in range(n_nodes)]
+    return messages
+
+
+def run_block(keys, sign_once, verifier=None, resend=1):
+    n_nodes = len(keys)
+    received = []
+    for sender, message in broadcasts(n_nodes):
+        if sign_once:
+            signature = sign(keys[sender], json.dumps(message).encode())
+            received += [(sender, message, signature)] * (n_nodes - 1)
+        else:
+            received += [(sender, message, sign(keys[sender], json.dumps(message).encode()))
+                         for _ in range(n_nodes - 1)]
+
+    items = [(keys[sender].public_key(), signature, json.dumps(message).encode())
+             for sender, message, signature in received for _ in range(resend)]
+    if verifier is None:
+        for item in items:
+            verify(*item)
+    else:
+        assert all([verifier.verify(*item) for item in items])
+
+    return len(items)
+
+
+def messages_per_second(n_nodes, key_type, sign_once, cached=False, resend=1):
+    keys = [generate_private_key(key_type) for _ in range(n_nodes)]
+    verifier = SignatureVerifier() if cached else None
+    start = time.perf_counter()
+    n_messages = run_block(keys, sign_once, verifier, resend)
+    return n_messages / (time.perf_counter() - start)
+
+
+def sign_and_verify_time(key, message, digest, repeat=200):
+    # Time (ms) to encode and sign a message, then encode it again and verify it
+    encode = (lambda: message_digest(message, "n1")) if digest else (lambda: json.dumps(message).encode())
+    start = time.perf_counter()
+    for _ in range(repeat):
+        signature = sign(key, encode())
+        verify(key.public_key(), signature, encode())
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+if __name__ == "__main__":
+    configurations = {
+        "RSA, signed for each peer (previous)": ("rsa", False, False, 1),
+        "RSA, signed once": ("rsa", True, False, 1),
+        "Ed25519, signed once": ("ed25519", True, False, 1),
+        "Ed25519, signed once, verifier": ("ed25519", True, True, 1),
+        "Ed25519, signed once, verifier, messages received twice": ("ed25519", True, True, 2),
+    }
+    node_counts = [4, 7, 10, 16]
+    print("messages/s\t" + "\t".join(f"{n} nodes" for n in node_counts))
+    for name, configuration in configurations.items():
+        print(f"{name}:\t" + "\t".join(f"{messages_per_second(n, *configuration):.0f}" for n in node_counts))
+
+    key = generate_private_key("ed25519")
+    sizes = [(10, 3), (160, 3), (1000, 100), (10000, 1000)]
+    print("\nms per commit (Ed25519)\t" + "\t".join(f"{l} layers/{p} participants" for l, p in sizes))
+    for name, digest in [("json of the message (previous)", False), ("digest", True)]:
+        times = [sign_and_verify_time(key, {"type": "commit", "content": {**block_content(l, p), "usefull": True}},
+                                      digest) for l, p in sizes]
+        print(f"{name}:\t" + "\t".join(f"{t:.3f}" for t in times))
@@ -0,0 +1,73 @@
+"""
+Benchmark of the messaging layer shared by the nodes and the clients.
+Run from the root of the repository: python -m benchmarks.bench_transport
+"""
+import socket
+import threading
+import time
+
+from transport import ConnectionPool, encode_message, send_frame, start_server
+
+
+def legacy_send(address, message):
+    # Previous behaviour: one TCP connection per message
+    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    client_socket.connect(address)
+    send_frame(client_socket, encode_message(message))
+    client_socket.close()
+
+
+def wait_for(counter, expected, timeout=60):
+    start = time.time()
+    while counter[0] < expected and time.time() - start < timeout:
+        time.sleep(0.001)
+
+
+def bench_messages_per_sec(address, counter, n_messages, message):
+    results = {}
+
+    counter[0] = 0
+    start = time.perf_counter()
+    for _ in range(n_messages):
+        legacy_send(address, message)
+    wait_for(counter, n_messages)
+    results["one socket per message"] = n_messages / (time.perf_counter() - start)
+
+    pool = ConnectionPool()
+    counter[0] = 0
+    start = time.perf_counter()
+    for _ in range(n_messages):
+        pool.send(address, message)
+    pool.flush()
+    wait_for(counter, n_messages)
+    results["connection pool"] = n_messages / (time.perf_counter() - start)
+    pool.close()
+
+    return results
+
+
+if __name__ == "__main__":
+    host, port = "127.0.0.1", 6999
+    counter = [0]
+    lock = threading.Lock()
+
+    def handle_message(message):
+        with lock:
+            counter[0] += 1
+
+    threading.Thread(target=start_server, args=(host, port, handle_message, "bench"), daemon=True).start()
+    time.sleep(0.5)
+
+    # A PBFT message (pre-prepare/prepare/commit) is a small dictionary
+    pbft_message = {
+        "type": "prepare",
+        "content": {"index": 1, "model_type": "update", "storage_reference": "models/BFL/m1.npz",
+                    "calculated_hash": "0" * 64, "participants": ["c0_1", "c0_2", "c0_3"],
+                    "previous_hash": "0" * 64, "current_hash": "0" * 64},
+        "signature": "0" * 344,
+        "id": "n1"
+    }
+
+    for n_messages in [1000, 5000]:
+        for name, value in bench_messages_per_sec((host, port), counter, n_messages, pbft_message).items():
+            print(f"{n_messages} messages\t{name}:\t{value:.0f} messages/s")
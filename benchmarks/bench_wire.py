@@ -0,0 +1,155 @@
+"""
+Throughput of the transfer of a 3.5M-parameter model (MobileNet-like layers) for the frag_weights and
+global_model messages, with the previous format (nested pickle, data += packet) and the framed binary format,
+then CPU time and peak memory of the reception of a global model by a client.
+Run from the root of the repository: python -m benchmarks.bench_wire
+"""
+import pickle
+import socket
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+from transport import ConnectionPool, FrameReader, encode_message, send_frame, start_server
+
+
+def mobilenet_like_weights(n_params=3_500_000):
+    shapes = []
+    channels = 32
+    while sum(int(np.prod(shape)) for shape in shapes) < n_params - 1_281_000:
+        shapes += [(channels, 1, 3, 3), (channels * 2, channels, 1, 1), (channels * 2,)]
+        channels = min(channels * 2, 512)
+    shapes += [(1000, 1280), (1000,)]
+    return [np.random.randn(*shape).astype(np.float32) for shape in shapes]
+
+
+def legacy_server(port, received):
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind(("127.0.0.1", port))
+    server_socket.listen(5)
+    while True:
+        client_socket, addr = server_socket.accept()
+        data_length = int.from_bytes(client_socket.recv(4), byteorder='big')
+        data = b''
+        while len(data) < data_length:
+            packet = client_socket.recv(data_length - len(data))
+            if not packet:
+                break
+            data += packet
+        message = pickle.loads(data)
+        message["value"] = pickle.loads(message["value"])
+        received.append(message)
+        client_socket.close()
+
+
+def legacy_send(port, message):
+    message = {**message, "value": pickle.dumps(message["value"])}
+    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    client_socket.connect(("127.0.0.1", port))
+    serialized_message = pickle.dumps(message)
+    client_socket.send(len(serialized_message).to_bytes(4, byteorder='big'))
+    client_socket.send(serialized_message)
+    client_socket.close()
+
+
+def legacy_receive(sock):
+    data_length = int.from_bytes(sock.recv(4), byteorder='big')
+    data = b''
+    while len(data) < data_length:
+        packet = sock.recv(data_length - len(data))
+        if not packet:
+            break
+        data += packet
+    message = pickle.loads(data)
+    message["value"] = pickle.loads(message["value"])
+    return message
+
+
+def bench_receive(message):
+    """
+    CPU time and peak memory (traced by tracemalloc) of the receiver of one message
+    """
+    results = {}
+    legacy_message = {**message, "value": pickle.dumps(message["value"])}
+    legacy_payload = pickle.dumps(legacy_message)
+
+    def legacy_sender(sock):
+        sock.sendall(len(legacy_payload).to_bytes(4, byteorder='big'))
+        sock.sendall(legacy_payload)
+
+    def framed_sender(sock):
+        send_frame(sock, encode_message(message))
+
+    receivers = {"data += packet": (legacy_sender, legacy_receive),
+                 "FrameReader": (framed_sender, lambda sock: FrameReader(sock).read_frame())}
+    for name, (sender, receiver) in receivers.items():
+        sender_socket, receiver_socket = socket.socketpair()
+        thread = threading.Thread(target=sender, args=(sender_socket,))
+        tracemalloc.start()
+        start = time.process_time()
+        thread.start()
+        receiver(receiver_socket)
+        cpu_time = time.process_time() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        thread.join()
+        sender_socket.close()
+        receiver_socket.close()
+        results[name] = (cpu_time, peak / 1e6)
+
+    return results
+
+
+def wait_for(received, expected, timeout=300):
+    start = time.time()
+    while len(received) < expected and time.time() - start < timeout:
+        time.sleep(0.001)
+
+
+if __name__ == "__main__":
+    weights = mobilenet_like_weights()
+    n_params = sum(w.size for w in weights)
+    size_mb = sum(w.nbytes for w in weights) / 1e6
+    n_messages = 20
+
+    messages = {
+        "frag_weights": {"type": "frag_weights", "id": "c0_1", "value": weights,
+                         "list_shapes": [w.shape for w in weights]},
+        "global_model": {"type": "global_model", "value": weights},
+    }
+
+    legacy_received, framed_received = [], []
+    threading.Thread(target=legacy_server, args=(6920, legacy_received), daemon=True).start()
+    threading.Thread(target=start_server, args=("127.0.0.1", 6921, framed_received.append, "bench"),
+                     daemon=True).start()
+    time.sleep(0.5)
+
+    pool = ConnectionPool()
+    print(f"Model: {n_params} parameters ({size_mb:.1f} MB)")
+    for name, message in messages.items():
+        legacy_received.clear()
+        start = time.perf_counter()
+        for _ in range(n_messages):
+            legacy_send(6920, message)
+        wait_for(legacy_received, n_messages)
+        legacy_time = time.perf_counter() - start
+
+        framed_received.clear()
+        start = time.perf_counter()
+        for _ in range(n_messages):
+            pool.send(("127.0.0.1", 6921), message)
+        wait_for(framed_received, n_messages)
+        framed_time = time.perf_counter() - start
+
+        assert np.array_equal(framed_received[-1]["value"][-1], weights[-1])
+        print(f"{name}:\tnested pickle: {n_messages * size_mb / legacy_time:.0f} MB/s\t"
+              f"framed binary: {n_messages * size_mb / framed_time:.0f} MB/s")
+
+    pool.close()
+
+    # The sender is in the same process, so its memory is included (pickle.dumps for the previous format)
+    for name, (cpu_time, peak) in bench_receive(messages["global_model"]).items():
+        print(f"global_model reception with {name}:\tCPU: {cpu_time * 1000:.0f} ms\tpeak memory: {peak:.0f} MB")
@@ -1,43 +1,102 @@
 import hashlib
+from types import MappingProxyType
 
 
-class Block: 
-    def __init__(self, index, model_type, storage_reference, calculated_hash, participants, previous_hash):
-        self.index = index
-        self.model_type = model_type
-        self.storage_reference = storage_reference
-        self.calculated_hash = calculated_hash
-        self.participants = participants
-        self.previous_hash = previous_hash
-
-    @property
-    def current_hash(self):
-        """
-        Calculate and return the current hash on each access
-        :return:
-        """
-        block_string = (f"{self.index}{self.model_type}{self.storage_reference}"
-                        f"{self.calculated_hash}{self.participants}{self.previous_hash}")
-        return hashlib.sha256(block_string.encode()).hexdigest()
+CONTAINERS = (list, tuple, dict, MappingProxyType)
+
+
+def freeze(value):
+    # Immutable copy of a field: the lists become tuples and the dictionaries read-only mappings, at any depth
+    if isinstance(value, (list, tuple)):
+        return tuple([freeze(item) if isinstance(item, CONTAINERS) else item for item in value])
+
+    if isinstance(value, (dict, MappingProxyType)):
+        return MappingProxyType({key: freeze(item) if isinstance(item, CONTAINERS) else item
+                                 for key, item in value.items()})
+
+    return value
+
+
+def thaw(value):
+    # Field of a block as in the messages (lists and dictionaries)
+    if isinstance(value, tuple):
+        return [thaw(item) if isinstance(item, CONTAINERS) else item for item in value]
+
+    if isinstance(value, MappingProxyType):
+        return {key: thaw(item) if isinstance(item, CONTAINERS) else item for key, item in value.items()}
+
+    return value
+
+
+class Block:
+    """
+    Immutable record of the chain: the fields can't be changed after the creation of the block,
+    so its hash is calculated once in the constructor instead of on each access.
+    The fields are frozen at any depth (e.g. the lists of the fields of a batch of PBFT), so they can't be changed
+    through a list or a dictionary given to the constructor either.
+    """
+    __slots__ = ("index", "model_type", "storage_reference", "calculated_hash", "participants", "previous_hash",
+                 "layer_hashes", "current_hash")
+
+    def __init__(self, index, model_type, storage_reference, calculated_hash, participants, previous_hash,
+                 layer_hashes=None):
+        if isinstance(storage_reference, CONTAINERS):
+            storage_reference = freeze(storage_reference)
+        if isinstance(calculated_hash, CONTAINERS):
+            calculated_hash = freeze(calculated_hash)
+        if isinstance(participants, CONTAINERS):
+            participants = freeze(participants)
+        # The hash is calculated from the lists of the fields, as in the messages (and the previous blocks)
+        block_string = (f"{index}{model_type}{thaw(storage_reference)}"
+                        f"{thaw(calculated_hash)}{thaw(participants)}{previous_hash}")
+
+        init = object.__setattr__
+        init(self, "index", index)
+        init(self, "model_type", model_type)
+        init(self, "storage_reference", storage_reference)
+        init(self, "calculated_hash", calculated_hash)  # root of the Merkle tree of the model (see model_hash.py)
+        init(self, "participants", participants)
+        init(self, "previous_hash", previous_hash)
+        # hashes of the layers of the model (name -> hash), their root is calculated_hash
+        init(self, "layer_hashes", freeze(layer_hashes) if layer_hashes is not None else None)
+        init(self, "current_hash", hashlib.sha256(block_string.encode()).hexdigest())
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Block is immutable, can't set {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Block is immutable, can't delete {name}")
+
+    def __reduce__(self):
+        # The slots can't be restored by setattr, the block is rebuilt by the constructor
+        return Block, (self.index, self.model_type, thaw(self.storage_reference), thaw(self.calculated_hash),
+                       thaw(self.participants), self.previous_hash, thaw(self.layer_hashes))
 
     def __str__(self):
         return f"================\n" \
                f"prev_hash:\t {self.previous_hash}\n" \
                f"index:\t\t {self.index}\n" \
                f"model_type:\t\t {self.model_type}\n" \
-               f"storage_reference:\t\t {self.storage_reference}\n" \
-               f"calculated_hash:\t\t {self.calculated_hash}\n" \
-               f"participants:\t\t {self.participants}\n" \
+               f"storage_reference:\t\t {thaw(self.storage_reference)}\n" \
+               f"calculated_hash:\t\t {thaw(self.calculated_hash)}\n" \
+               f"participants:\t\t {thaw(self.participants)}\n" \
                f"Hash:\t\t {self.current_hash}\n"
-    
+
     def to_dict(self):
         # Convert the attributes of the block into a dictionary
         return {
             "index": self.index,
-            "storage_reference": self.storage_reference,
+            "storage_reference": thaw(self.storage_reference),
             "model_type": self.model_type,
             "previous_hash": self.previous_hash,
-            "calculated_hash": self.calculated_hash,
-            "participants": self.participants,
+            "calculated_hash": thaw(self.calculated_hash),
+            "participants": thaw(self.participants),
+            "layer_hashes": thaw(self.layer_hashes),
             "current_hash": self.current_hash
         }
+
+    @classmethod
+    def from_dict(cls, data):
+        # Rebuild a block from the dictionary of to_dict
+        return cls(data["index"], data["model_type"], data["storage_reference"], data["calculated_hash"],
+                   data["participants"], data["previous_hash"], data.get("layer_hashes"))
@@ -1,39 +1,129 @@
+import logging
+
 from block import Block
-import numpy as np 
-import hashlib
+from model_hash import model_tree, tree_root
+from model_store import load_weights
 
 
 class Blockchain:
-    def __init__(self):
+    def __init__(self, store=None):
+        """
+        :param store: ChainLog (see chain_store.py) where the blocks are written, the chain is loaded from it
+        if it is not empty, or None to keep the chain only in memory
+        """
         self.blocks = []
+        self.store = store
+
+        # Indexes updated by add_block, so the nodes don't scan the chain for each message
+        self.last_global_block = None  # last block of a global model (global_model or first_global_model)
+        self.updates_since_global = []  # update blocks added after the last global model, in the order of the chain
+        self.blocks_by_participant = {}  # participant -> list of the blocks where it participates
+        self.blocks_by_storage = {}  # storage reference -> block
+        self.blocks_by_hash = {}  # current_hash -> block
+
+        if store is not None and self.load_store():
+            return
+
         self.add_genesis_block()
 
     def add_block(self, block):
-        self.blocks.append(block)    
+        if self.store is not None:
+            self.store.append(block)
+
+        self.blocks.append(block)
+        self.index_block(block)
+
+    def load_store(self):
+        """
+        Function to rebuild the chain and its indexes from the records of the store (the models are not read again)
+        :return: True if the store contained a chain
+        """
+        for record in self.store.load():
+            block = Block.from_dict(record)
+            if block.current_hash != record["current_hash"]:
+                raise ValueError(f"Block {block.index} of {self.store.directory}: hash doesn't match its content")
+
+            self.blocks.append(block)
+            self.index_block(block)
+
+        if not self.verify_chain():
+            raise ValueError(f"The chain of {self.store.directory} is not valid")
+
+        return len(self.blocks) > 0
+
+    def index_block(self, block):
+        if block.model_type in ["global_model", "first_global_model"]:
+            self.last_global_block = block
+            self.updates_since_global = []
+
+        elif block.model_type == "update":
+            self.updates_since_global.append(block)
+
+        for participant in block.participants or []:
+            self.blocks_by_participant.setdefault(participant, []).append(block)
+
+        self.blocks_by_storage[block.storage_reference] = block
+        self.blocks_by_hash[block.current_hash] = block
+
+    @property
+    def last_block(self):
+        return self.blocks[-1]
+
+    def get_blocks_of_participant(self, participant):
+        return self.blocks_by_participant.get(participant, [])
+
+    def get_block_by_storage(self, storage_reference):
+        return self.blocks_by_storage.get(storage_reference)
+
+    def get_block_by_hash(self, block_hash):
+        return self.blocks_by_hash.get(block_hash)
 
     def is_valid_block(self, block, hash):
-        loaded_weights_dict = np.load(block.storage_reference)
-        loaded_weights = [val for name, val in loaded_weights_dict.items() if name != 'len_dataset']
-        loaded_weights = (loaded_weights, loaded_weights_dict[f'len_dataset'])
+        loaded_weights_dict = load_weights(block.storage_reference)
+        layer_hashes = model_tree({name: loaded_weights_dict[name] for name in loaded_weights_dict.keys()
+                                   if 'bn' not in name})
 
-        hash_model = hashlib.sha256()
-        hash_model.update(str(loaded_weights).encode('utf-8'))
-        hash_model = hash_model.hexdigest()
+        if block.layer_hashes is not None and layer_hashes != block.layer_hashes:
+            return False
 
-        if block.cryptographic_hash == hash and block.calculated_hash == hash_model: 
+        if block.current_hash == hash and block.calculated_hash == tree_root(layer_hashes): 
             return True
 
         else: 
             return False
 
+    def verify_chain(self, blocks=None):
+        """
+        Function to validate a whole chain in one pass: the index of each block follows the previous one and
+        its previous_hash is the hash of the previous block.
+        The blocks are immutable, so their hashes (calculated at their creation) are read without being calculated again
+        :param blocks: list of the blocks to verify (the blocks of this chain by default)
+        :return: True if the chain is valid
+        """
+        previous_block = None
+        for block in self.blocks if blocks is None else blocks:
+            if previous_block is not None and (block.index != previous_block.index + 1
+                                               or block.previous_hash != previous_block.current_hash):
+                logging.warning("Block %s: not linked to the previous block", block.index)
+                return False
+
+            previous_block = block
+
+        return True
+
     def add_genesis_block(self):
         genesis_block = Block(0, "", "", "", ["1"], "")
-        self.blocks.append(genesis_block)
+        self.add_block(genesis_block)
   
     @property
     def len_chain(self): 
         return len(self.blocks)
 
+    def close(self):
+        # Write the checkpoint of the store and close its last segment
+        if self.store is not None:
+            self.store.close()
+
     def print_blockchain(self):
         # Print the contents of the blockchain
         for block in self.blocks:
@@ -0,0 +1,251 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from array import array
+
+
+# %% ///////////////////////////////////////////// Segment log //////////////////////////////////////////////////////////
+# The blocks of a chain are appended to segment files (000000.log, 000001.log, ...) of about SEGMENT_SIZE bytes.
+# A record is the length of the payload (4 B), its crc32 (4 B) and the payload (the json of Block.to_dict):
+# | length (4 B) | crc32 (4 B) | payload |
+# Every checkpoint_every blocks, the position of each record is saved in the checkpoint file (written in a temporary
+# file then renamed), so at the start of a node the records before the checkpoint are read without being checked
+# and only the records written after are checked (a record partially written by a crash is removed).
+# A position is the number of the segment (high bits) and the offset of the record in the segment (low bits).
+RECORD_STRUCT = struct.Struct("!II")
+CHECKPOINT_STRUCT = struct.Struct("!4sQI")  # magic, number of records, crc32 of the positions
+CHECKPOINT_MAGIC = b"BCKP"
+CHECKPOINT_FILE = "checkpoint.idx"
+SEGMENT_SIZE = 64 * 2 ** 20
+OFFSET_BITS = 40
+
+FSYNC_POLICIES = ["always", "batch", "never"]
+
+
+def segment_name(number):
+    return f"{number:06d}.log"
+
+
+def encode_position(segment, offset):
+    return (segment << OFFSET_BITS) | offset
+
+
+def decode_position(position):
+    return position >> OFFSET_BITS, position & ((1 << OFFSET_BITS) - 1)
+
+
+class ChainLog:
+    """
+    Durable append-only log of the blocks of a chain, written through by Blockchain.add_block.
+    """
+    def __init__(self, directory, fsync="batch", fsync_every=100, checkpoint_every=1000, segment_size=SEGMENT_SIZE,
+                 read_only=False):
+        """
+        :param directory: directory of the segments and of the checkpoint
+        :param fsync: "always" (fsync after each block), "batch" (fsync every fsync_every blocks and at each
+        checkpoint) or "never" (the system writes the files when it wants, a crash of the machine can lose blocks)
+        :param fsync_every: number of blocks between two fsync with the "batch" policy
+        :param checkpoint_every: number of blocks between two checkpoints
+        :param segment_size: size (bytes) from which a new segment is started
+        :param read_only: True to read the log of another process (e.g. the chain of a running node) without writing
+        or truncating its files, the blocks can't be appended
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, not {fsync}")
+
+        self.directory = directory
+        self.fsync = fsync
+        self.fsync_every = fsync_every
+        self.checkpoint_every = checkpoint_every
+        self.segment_size = segment_size
+        self.read_only = read_only
+
+        self.positions = array("Q")  # position of each record
+        self.segment = 0  # number of the segment where the records are appended
+        self.file = None
+        self.unsynced = 0  # number of records written since the last fsync
+        self.lock = threading.Lock()
+
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self.positions)
+
+    # %% Start
+    def load(self):
+        """
+        Function to read the records of the log at the start of a node, and open the last segment to append the blocks.
+        The segments are memory-mapped; the records after the checkpoint are checked and the log is truncated after
+        the last complete record (in read-only mode, the records after it are ignored).
+        :return: list of the records (dictionaries of Block.to_dict) in the order of the chain
+        """
+        with self.lock:
+            self.positions = self.read_checkpoint()
+            payloads = []
+            segment, offset = 0, 0
+
+            # Records of the checkpoint (not checked)
+            mapped = {}
+            for position in self.positions:
+                segment, offset = decode_position(position)
+                if segment not in mapped:
+                    mapped[segment] = self.map_segment(segment)
+
+                length, _ = RECORD_STRUCT.unpack_from(mapped[segment], offset)
+                start = offset + RECORD_STRUCT.size
+                payloads.append(mapped[segment][start:start + length])
+                offset = start + length
+
+            for view in mapped.values():
+                view.close()
+
+            # Records written after the checkpoint
+            while os.path.exists(self.segment_path(segment)):
+                offset = self.scan_segment(segment, offset, payloads)
+                if not os.path.exists(self.segment_path(segment + 1)):
+                    break
+                segment, offset = segment + 1, 0
+
+            self.segment = segment
+            if not self.read_only:
+                self.file = open(self.segment_path(segment), "ab")
+
+            # The records are decoded by a single call of the json parser
+            return json.loads(b"[" + b",".join(payloads) + b"]")
+
+    def scan_segment(self, segment, offset, payloads):
+        # Check the records of a segment from offset, truncate the segment after the last complete record (unless the
+        # log is read-only)
+        with open(self.segment_path(segment), "rb" if self.read_only else "r+b") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size > offset:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    while offset + RECORD_STRUCT.size <= size:
+                        length, crc = RECORD_STRUCT.unpack_from(view, offset)
+                        start = offset + RECORD_STRUCT.size
+                        payload = view[start:start + length]
+                        if len(payload) != length or zlib.crc32(payload) != crc:
+                            break
+
+                        payloads.append(payload)
+                        self.positions.append(encode_position(segment, offset))
+                        offset = start + length
+
+            if size != offset and self.read_only:
+                # The record may be being written by the node
+                print(f"Chain log {self.directory}: record incomplete at {segment_name(segment)}:{offset}, "
+                      f"{size - offset} bytes ignored")
+
+            elif size != offset:
+                print(f"Chain log {self.directory}: record incomplete at {segment_name(segment)}:{offset}, "
+                      f"{size - offset} bytes removed")
+                f.truncate(offset)
+
+        return offset
+
+    def map_segment(self, segment):
+        with open(self.segment_path(segment), "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, segment_name(segment))
+
+    # %% Writing
+    def append(self, block):
+        """
+        Function to write a block at the end of the log
+        :param block: the Block
+        """
+        if self.read_only:
+            raise ValueError(f"Chain log {self.directory} is read-only")
+
+        payload = json.dumps(block.to_dict(), separators=(",", ":")).encode()
+        record = RECORD_STRUCT.pack(len(payload), zlib.crc32(payload)) + payload
+
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.segment_path(self.segment), "ab")
+
+            offset = self.file.tell()
+            if offset and offset + len(record) > self.segment_size:
+                self.sync()
+                self.file.close()
+                self.segment += 1
+                self.file = open(self.segment_path(self.segment), "ab")
+                offset = 0
+
+            self.file.write(record)
+            self.file.flush()
+            self.positions.append(encode_position(self.segment, offset))
+            self.unsynced += 1
+
+            if self.fsync == "always" or (self.fsync == "batch" and self.unsynced >= self.fsync_every):
+                self.sync()
+
+            if len(self.positions) % self.checkpoint_every == 0:
+                self.write_checkpoint()
+
+    def sync(self):
+        if self.file is not None and self.unsynced and self.fsync != "never":
+            os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def write_checkpoint(self):
+        # The records of the checkpoint must be on the disk before the checkpoint
+        self.sync()
+        data = self.positions.tobytes()
+        temp_path = os.path.join(self.directory, CHECKPOINT_FILE + ".tmp")
+        with open(temp_path, "wb") as f:
+            f.write(CHECKPOINT_STRUCT.pack(CHECKPOINT_MAGIC, len(self.positions), zlib.crc32(data)))
+            f.write(data)
+            f.flush()
+            if self.fsync != "never":
+                os.fsync(f.fileno())
+
+        os.replace(temp_path, os.path.join(self.directory, CHECKPOINT_FILE))
+
+    def read_checkpoint(self):
+        positions = array("Q")
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        if not os.path.exists(path):
+            return positions
+
+        with open(path, "rb") as f:
+            header = f.read(CHECKPOINT_STRUCT.size)
+            data = f.read()
+
+        if len(header) == CHECKPOINT_STRUCT.size:
+            magic, count, crc = CHECKPOINT_STRUCT.unpack(header)
+            if magic == CHECKPOINT_MAGIC and len(data) == count * positions.itemsize and zlib.crc32(data) == crc:
+                positions.frombytes(data)
+                return positions
+
+        print(f"Chain log {self.directory}: checkpoint invalid, all the records are checked")
+        return positions
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.write_checkpoint()
+                self.file.close()
+                self.file = None
+
+    # %% Reading
+    def read(self, index):
+        """
+        Function to read one record (O(1), from its position)
+        :param index: index of the record in the chain (negative to count from the end)
+        :return: the record (dictionary of Block.to_dict)
+        """
+        segment, offset = decode_position(self.positions[index])
+        with open(self.segment_path(segment), "rb") as f:
+            f.seek(offset)
+            length, _ = RECORD_STRUCT.unpack(f.read(RECORD_STRUCT.size))
+            return json.loads(f.read(length))
+
+    def tail(self):
+        return self.read(-1) if self.positions else None
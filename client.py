@@ -1,15 +1,15 @@
-import pickle
 # import random
 from sklearn.model_selection import train_test_split
 
-import socket
-
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization
 
 from flowerclient import FlowerClient
-from node import get_keys, start_server
-from going_modular.security import apply_smpc, sum_shares
+from node import get_keys
+from transport import ConnectionPool, start_server
+from round_events import round_events
+from going_modular.security import apply_smpc, ShareAccumulator
+from going_modular.compression import apply_delta, cluster_seed, compress_update, pack_share, unpack_share
 
 
 def save_nodes_chain(nodes):
@@ -18,10 +18,13 @@ def save_nodes_chain(nodes):
 
 
 class Client:
-    def __init__(self, id, host, port, train, test, save_results, type_ss="additif", threshold=3, m=3, **kwargs):
+    def __init__(self, id, host, port, train, test, save_results, type_ss="additif", threshold=3, m=3,
+                 server_mode="thread", update_compression=None, **kwargs):
         self.id = id
         self.host = host
         self.port = port
+        self.server_mode = server_mode
+        self.listening = False
 
         self.type_ss = type_ss
         self.threshold = threshold
@@ -29,12 +32,20 @@ class Client:
         self.list_shapes = None
 
         self.global_model_weights = None
+        self.global_model_id = None  # version of the global model (used by the node as the base of the next delta)
 
-        self.frag_weights = []
+        self.frag_weights = ShareAccumulator(type_ss)  # sum of the shares received (and of the share kept)
         self.sum_dataset_number = 0
 
+        # Compression of the update before the secret sharing: {"ratio", "frac_bits", "entropy"} or None
+        # (see going_modular.compression.compress_update)
+        self.update_compression = update_compression
+        self.update_base = None  # global model used as the reference of the compressed update
+        self.update_residual = None  # part of the previous updates not sent yet (error feedback)
+
         self.node = {}
         self.connections = {}
+        self.pool = ConnectionPool()
 
         self.save_results = save_results
         private_key_path = f"keys/{id}_private_key.pem"
@@ -59,46 +70,43 @@ class Client:
             )
 
     def start_server(self):
-        start_server(self.host, self.port, self.handle_message, self.id)
-
-    def handle_message(self, client_socket):
-        data_length_bytes = client_socket.recv(4)
-        if not data_length_bytes:
-            return  # No data received, possibly handle this case as an error or log it
-        data_length = int.from_bytes(data_length_bytes, byteorder='big')
-
-        # Now read exactly data_length bytes
-        data = b''
-        while len(data) < data_length:
-            packet = client_socket.recv(data_length - len(data))
-            if not packet:
-                break  # Connection closed, handle this case if necessary
-            data += packet
-
-        if len(data) < data_length:
-            # Log this situation as an error or handle it appropriately
-            print("Data was truncated or connection was closed prematurely.")
-            return
-        
-        message = pickle.loads(data)
+        start_server(self.host, self.port, self.handle_message, self.id, mode=self.server_mode,
+                     on_listen=self.on_listen)
+
+    def on_listen(self):
+        self.listening = True
+        round_events.notify()
 
+    def handle_message(self, message):
         message_type = message.get("type")
 
         if message_type == "frag_weights":
-            weights = pickle.loads(message.get("value"))
-            self.frag_weights.append(weights)
+            weights = unpack_share(message.get("value"))
+            self.frag_weights.add(weights)
+            round_events.notify()
 
         elif message_type == "global_model":
-            weights = pickle.loads(message.get("value"))
+            if "delta" in message:
+                if message.get("base_id") != self.global_model_id:
+                    # We don't have the base of the delta, the node will send the full model
+                    self.acknowledge_global_model(None)
+                    return
+
+                weights = apply_delta(self.global_model_weights, message.get("delta"))
+            else:
+                weights = message.get("value")
+
             self.global_model_weights = weights
+            self.global_model_id = message.get("view_id")
+            self.acknowledge_global_model(self.global_model_id)
+            round_events.notify()
 
         elif message_type == "first_global_model":
-            weights = pickle.loads(message.get("value"))
+            weights = message.get("value")
             self.global_model_weights = weights
             
             print(f"client {self.id} received the global model")
-
-        client_socket.close()
+            round_events.notify()
 
     def train(self):        
         res, metrics = self.flower_client.fit(self.global_model_weights, self.id, {})
@@ -111,12 +119,36 @@ class Client:
                     f"train: {metrics['train_loss']} {metrics['train_acc']} "
                     f"val: {metrics['val_loss']} {metrics['val_acc']} "
                     f"test: {test_metrics['test_loss']} {test_metrics['test_acc']}\n")
+        secret = self.compress_update(res)
         # Apply SMPC (warning : list_shapes is initialized only after the first training)
-        encrypted_lists, self.list_shapes = apply_smpc(res, len(self.connections) + 1, self.type_ss, self.threshold)
+        encrypted_lists, self.list_shapes = apply_smpc(secret, len(self.connections) + 1, self.type_ss, self.threshold)
         # we keep the last share of the secret for this client and send the others to the other clients
-        self.frag_weights.append(encrypted_lists.pop())
+        self.frag_weights.add(encrypted_lists.pop())
         return encrypted_lists
 
+    def compress_update(self, weights):
+        """
+        function to compress the update (weights - global model) before the secret sharing.
+        The sparse mask is derived from the members of the cluster and the global model, so it is the same for
+        all the clients of the cluster and their shares can still be summed.
+        :param weights: list of tensors of the trained model
+        :return: the secret to share (the weights if the compression is disabled)
+        """
+        self.update_base = None
+        if self.update_compression is None or self.global_model_id is None:
+            return weights
+
+        self.update_base = self.global_model_id.split("_")[0]  # hash of the block of the global model
+        update = [w - g for w, g in zip(weights, self.global_model_weights)]
+        if self.update_residual is not None:
+            update = [u + r for u, r in zip(update, self.update_residual)]
+
+        seed = cluster_seed([self.id] + list(self.connections.keys()), self.update_base)
+        secret, self.update_residual = compress_update(update, seed, self.update_compression.get("ratio"),
+                                                       self.update_compression.get("frac_bits", 16))
+
+        return secret
+
     def send_frag_clients(self, frag_weights):
         """
         function to send the shares of the secret to the other clients
@@ -125,42 +157,29 @@ class Client:
         for i, (k, v) in enumerate(self.connections.items()):
             address = v.get('address')
 
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_socket.connect(('127.0.0.1', address))
-
-            serialized_data = pickle.dumps(frag_weights[i])
-
-            message = {"type": "frag_weights", "value": serialized_data}
-
-            # print("message", message)
-            serialized_message = pickle.dumps(message)
+            message = {"type": "frag_weights", "value": pack_share(frag_weights[i], self.share_entropy)}
 
-            # Send the length of the message first
-            client_socket.send(len(serialized_message).to_bytes(4, byteorder='big'))
-            client_socket.send(serialized_message)
-
-            # close the socket after sending
-            client_socket.close()
+            self.pool.send(('127.0.0.1', address), message)
 
     def send_frag_node(self):
         address = self.node.get('address')
 
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client_socket.connect(('127.0.0.1', address))
-
-        serialized_data = pickle.dumps(self.sum_weights)  # The values summed on the client side and sent to the node.
-        message = {"type": "frag_weights", "id": self.id, "value": serialized_data, "list_shapes": self.list_shapes}
+        # The values summed on the client side and sent to the node.
+        message = {"type": "frag_weights", "id": self.id, "value": pack_share(self.sum_weights, self.share_entropy),
+                   "list_shapes": self.list_shapes, "base_id": self.update_base}
 
-        serialized_message = pickle.dumps(message)
+        self.pool.send(('127.0.0.1', address), message)
 
-        # Send the length of the message first
-        client_socket.send(len(serialized_message).to_bytes(4, byteorder='big'))
-        client_socket.send(serialized_message)
+        self.frag_weights.reset()
 
-        # Close the socket after sending
-        client_socket.close()
+    def acknowledge_global_model(self, view_id):
+        message = {"type": "global_model_ack", "id": self.id, "view_id": view_id}
+        self.pool.send(('127.0.0.1', self.node.get('address')), message)
 
-        self.frag_weights = []
+    @property
+    def shares_received(self):
+        # The shares of the other clients of the cluster were received (and the share kept by the client was added)
+        return self.frag_weights.count == len(self.connections) + 1
 
     def reset_connections(self):
         self.connections = {}
@@ -183,9 +202,14 @@ class Client:
 
         self.node = {"address": address, "public_key": public_key}
 
+    @property
+    def share_entropy(self):
+        # entropy coding of the shares on the wire (only with the update compression)
+        return self.update_compression.get("entropy") if self.update_base is not None else None
+
     @property
     def sum_weights(self):
-        return sum_shares(self.frag_weights, self.type_ss)
+        return self.frag_weights.result()
 
     def get_keys(self, private_key_path, public_key_path):
         self.private_key, self.public_key = get_keys(private_key_path, public_key_path)
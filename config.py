@@ -19,8 +19,39 @@ settings = {
     "step_size": 3,
     "gamma": 0.5,
     "diff_privacy": False,
-    "secret_sharing": "additif",  # "additif" or "shamir"
+    # "additif" or "shamir" (floats), "additif_field" or "shamir_field" (prime field),
+    # "additif_seed" (additif where the random shares are sent as seeds)
+    "secret_sharing": "additif",
     "k": 3,
     "m": 3,
-    "ts": 20
+    "shamir_chunk_size": None,  # maximum number of weights reconstructed at once by the nodes (None: no limit)
+    "ts": 20,
+    # Maximum time (seconds) to wait for an event of a round of main_bfl (shares, consensus, global model) before
+    # continuing, the rounds advance as soon as the events happen
+    "round_timeout": 300,
+    "server_mode": "thread",  # "thread" or "asyncio"
+    # Delta broadcast of the global model, e.g. {"ratio": 0.1, "quantization": "fp16", "entropy": "zlib"}, or None
+    "broadcast_compression": None,
+    # Compression of the updates of the clients before the secret sharing,
+    # e.g. {"ratio": 0.1, "frac_bits": 16, "entropy": "zlib"}, or None
+    "update_compression": None,
+    # Durable log of the chain of each node, e.g. {"directory": "results/BFL/chains", "fsync": "batch"}
+    # (fsync: "always", "batch" or "never"), or None to keep the chain only in memory
+    "chain_storage": None,
+    # Directory of the content-addressed store of the models (e.g. "models/store"), or None for a .npz file per model
+    "model_store": None,
+    # Format of the models saved in files when there is no model store: "npz" or "ckpt" (memory-mapped checkpoint)
+    "model_format": "npz",
+    # Maximum size (bytes) of the decoded models kept in memory by the nodes of the process
+    "model_cache_bytes": 2 ** 30,
+    # Evaluation of the global model by the nodes in the background as soon as it is committed
+    "precompute_evaluation": False,
+    # Keys of the nodes to sign the messages: "rsa" (RSA-2048 PSS) or "ed25519" (faster signatures)
+    "key_type": "rsa",
+    # Number of blocks in consensus at the same time (PBFT watermark window)
+    "pbft_window": 8,
+    # Updates of the clusters proposed together in one block: maximum number of updates of a block (1: one block per
+    # update) and maximum time (seconds) an update waits for the other updates of its block
+    "pbft_batch_size": 1,
+    "pbft_batch_delay": 0.5
 }
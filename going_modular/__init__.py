@@ -1,5 +1,6 @@
 from .utils import *
 from .security import *
+from .compression import *
 from .model import *
 from .data_setup import *
 from .engine import *
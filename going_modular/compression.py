@@ -0,0 +1,318 @@
+import hashlib
+import json
+import zlib
+
+import numpy as np
+
+# Optional entropy coders (pip install zstandard / lz4), zlib is always available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+
+# %% ////////////////////////////////////////////// Entropy coding /////////////////////////////////////////////////////
+def entropy_encode(array, entropy=None):
+    """
+    Function to compress the bytes of an array with a lossless entropy coder
+    :param array: the array to compress
+    :param entropy: the coder to use (None, "zlib", "zstd" or "lz4")
+    :return: the array unchanged if entropy is None, else the compressed bytes as an array of uint8
+    (so it is sent as a raw buffer by the transport)
+    """
+    if entropy is None:
+        return array
+
+    data = np.ascontiguousarray(array).tobytes()
+    if entropy == "zlib":
+        compressed = zlib.compress(data, 6)
+
+    elif entropy == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package")
+        compressed = zstandard.ZstdCompressor(level=3).compress(data)
+
+    elif entropy == "lz4":
+        if lz4_frame is None:
+            raise ImportError("lz4 compression requires the lz4 package")
+        compressed = lz4_frame.compress(data)
+
+    else:
+        raise ValueError("Entropy coder not recognized")
+
+    return np.frombuffer(compressed, dtype=np.uint8)
+
+
+def entropy_decode(data, dtype, entropy=None):
+    """
+    Function to decompress an array compressed by entropy_encode
+    :param data: the array returned by entropy_encode
+    :param dtype: the dtype of the original array
+    :param entropy: the coder used
+    :return: the original array (flattened)
+    """
+    if entropy is None:
+        return data
+
+    if entropy == "zlib":
+        raw = zlib.decompress(data)
+
+    elif entropy == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+
+    elif entropy == "lz4":
+        if lz4_frame is None:
+            raise ImportError("lz4 compression requires the lz4 package")
+        raw = lz4_frame.decompress(data)
+
+    else:
+        raise ValueError("Entropy coder not recognized")
+
+    return np.frombuffer(raw, dtype=dtype)
+
+
+# %% ////////////////////////////////////////////// Quantization ///////////////////////////////////////////////////////
+def quantize(values, quantization=None):
+    """
+    Function to quantize the values of a tensor
+    :param values: the values to quantize
+    :param quantization: None, "fp16" or "int8" (symmetric, one scale per tensor)
+    :return: the quantized values and the scale (None if not used)
+    """
+    if quantization is None:
+        return values, None
+
+    elif quantization == "fp16":
+        return values.astype(np.float16), None
+
+    elif quantization == "int8":
+        max_value = float(np.max(np.abs(values))) if values.size else 0.
+        scale = max_value / 127 if max_value > 0 else 1.
+        return np.round(values / scale).astype(np.int8), scale
+
+    else:
+        raise ValueError("Quantization not recognized")
+
+
+def dequantize(values, scale=None, dtype=np.float32):
+    if scale is not None:
+        return (values.astype(dtype) * scale).astype(dtype)
+
+    return values.astype(dtype)
+
+
+# %% ////////////////////////////////////////////// Delta of models /////////////////////////////////////////////////////
+def encode_layer(values, ratio=None, quantization=None, entropy=None):
+    """
+    Function to compress a tensor (for example the difference between two versions of a layer)
+    :param values: the tensor to compress
+    :param ratio: fraction of the values to keep (the ones with the largest magnitude), None to keep all the values
+    :param quantization: quantization of the kept values (None, "fp16" or "int8")
+    :param entropy: entropy coder applied on the indices and the values (None, "zlib", "zstd" or "lz4")
+    :return: a dictionary with the compressed tensor
+    """
+    flat = values.ravel()
+    encoded = {"shape": values.shape, "dtype": values.dtype.str, "quantization": quantization, "entropy": entropy}
+
+    if ratio is not None and ratio < 1:
+        # top-k sparsification: we keep the k values of largest magnitude
+        k = max(1, int(ratio * flat.size))
+        indices = np.sort(np.argpartition(np.abs(flat), -k)[-k:])
+        flat = flat[indices]
+        # The gaps between sorted indices are small, so they are easier to compress than the indices
+        gaps = np.diff(indices, prepend=0).astype(np.uint32)
+        encoded["indices"] = entropy_encode(gaps, entropy)
+
+    quantized, encoded["scale"] = quantize(flat, quantization)
+    encoded["values_dtype"] = quantized.dtype.str
+    encoded["values"] = entropy_encode(quantized, entropy)
+
+    return encoded
+
+
+def decode_layer(encoded):
+    """
+    Function to decompress a tensor compressed by encode_layer
+    :param encoded: the dictionary returned by encode_layer
+    :return: the tensor (dense)
+    """
+    dtype = np.dtype(encoded["dtype"])
+    values = entropy_decode(encoded["values"], encoded["values_dtype"], encoded["entropy"])
+    values = dequantize(values, encoded["scale"], dtype)
+
+    if "indices" not in encoded:
+        return values.reshape(encoded["shape"])
+
+    indices = np.cumsum(entropy_decode(encoded["indices"], np.uint32, encoded["entropy"]), dtype=np.int64)
+    dense = np.zeros(int(np.prod(encoded["shape"])), dtype=dtype)
+    dense[indices] = values
+
+    return dense.reshape(encoded["shape"])
+
+
+def encode_delta(new_layers, base_layers, ratio=None, quantization=None, entropy=None):
+    """
+    Function to compress the difference between two versions of a model
+    :param new_layers: list of tensors of the new model
+    :param base_layers: list of tensors of the model known by the receiver
+    :return: list of compressed layers (the non floating point layers are sent entirely)
+    """
+    encoded_layers = []
+    for new, base in zip(new_layers, base_layers):
+        if np.issubdtype(new.dtype, np.floating):
+            encoded_layers.append(encode_layer(new - base, ratio, quantization, entropy))
+        else:
+            encoded_layers.append({"full": new})
+
+    return encoded_layers
+
+
+def apply_delta(base_layers, encoded_layers):
+    """
+    Function to rebuild a model from the model known by the receiver and a compressed difference
+    :param base_layers: list of tensors of the model known by the receiver
+    :param encoded_layers: list returned by encode_delta
+    :return: list of tensors of the new model (as seen by the receiver, so with the error of the lossy codecs)
+    """
+    new_layers = []
+    for base, encoded in zip(base_layers, encoded_layers):
+        if "full" in encoded:
+            new_layers.append(encoded["full"])
+        else:
+            new_layers.append((base + decode_layer(encoded)).astype(base.dtype))
+
+    return new_layers
+
+
+# %% ////////////////////////////////////////////// Updates of the clients ////////////////////////////////////////////
+# The update of a client (trained model - global model) is compressed before the secret sharing:
+# only a sparse set of coordinates, the same for all the clients of a cluster, is kept and quantized in fixed point.
+# The sum of the fixed-point integers of the clients is exactly the fixed-point sum of their updates,
+# so the additive (or Shamir) sharing and the reconstruction on the node are unchanged.
+def cluster_seed(participants, base_id):
+    """
+    Function to derive the seed of the sparse mask of a cluster, known by all its members without any message
+    :param participants: ids of the clients of the cluster
+    :param base_id: id of the global model used as the reference of the updates
+    :return: the seed (int)
+    """
+    key = json.dumps([sorted(participants), base_id]).encode()
+    return int.from_bytes(hashlib.sha256(key).digest()[:8], byteorder='big')
+
+
+def sparse_masks(shapes, seed, ratio=None):
+    """
+    Function to generate the coordinates kept for each layer
+    :param shapes: shapes of the layers
+    :param seed: the seed of the cluster (see cluster_seed)
+    :param ratio: fraction of the coordinates kept, None to keep all the coordinates
+    :return: list of sorted indices (or None when all the coordinates are kept)
+    """
+    if ratio is None or ratio >= 1:
+        return [None for _ in shapes]
+
+    rng = np.random.default_rng(seed)
+    masks = []
+    for shape in shapes:
+        size = int(np.prod(shape))
+        k = max(1, int(ratio * size))
+        masks.append(np.sort(rng.choice(size, size=k, replace=False)))
+
+    return masks
+
+
+def compress_update(update_layers, seed, ratio=None, frac_bits=16):
+    """
+    Function to compress the update of a client before the secret sharing
+    :param update_layers: list of tensors of the update (with the residual of the previous rounds)
+    :param seed: the seed of the cluster (see cluster_seed)
+    :param ratio: fraction of the coordinates kept
+    :param frac_bits: number of bits of the fractional part of the fixed-point encoding
+    :return: the list of int64 vectors to share and the residual (what was not sent, to add to the next update)
+    """
+    masks = sparse_masks([layer.shape for layer in update_layers], seed, ratio)
+    values, residual = [], []
+    for layer, mask in zip(update_layers, masks):
+        flat = layer.astype(np.float64).ravel()
+        kept = flat if mask is None else flat[mask]
+        quantized = np.round(kept * 2 ** frac_bits).astype(np.int64)
+
+        error = flat.copy()
+        if mask is None:
+            error -= quantized / 2 ** frac_bits
+        else:
+            error[mask] -= quantized / 2 ** frac_bits
+
+        values.append(quantized)
+        residual.append(error.reshape(layer.shape))
+
+    return values, residual
+
+
+def decompress_update(values, reference_layers, seed, ratio=None, frac_bits=16):
+    """
+    Function to rebuild the model from the aggregated compressed updates
+    :param values: list of aggregated vectors (mean of the fixed-point vectors of the clients)
+    :param reference_layers: list of tensors of the global model used as the reference of the updates
+    :param seed: the seed of the cluster (see cluster_seed)
+    :return: the list of tensors of the model
+    """
+    masks = sparse_masks([layer.shape for layer in reference_layers], seed, ratio)
+    layers = []
+    for value, reference, mask in zip(values, reference_layers, masks):
+        delta = np.zeros(reference.size, dtype=np.float64)
+        if mask is None:
+            delta += np.ravel(value) / 2 ** frac_bits
+        else:
+            delta[mask] = np.ravel(value) / 2 ** frac_bits
+
+        layer = reference.astype(np.float64) + delta.reshape(reference.shape)
+        if not np.issubdtype(reference.dtype, np.floating):
+            layer = np.round(layer)
+        layers.append(layer.astype(reference.dtype))
+
+    return layers
+
+
+def pack_share(share, entropy=None):
+    """
+    Function to apply the entropy coding on a share before sending it
+    :param share: list of tensors (additive sharing), (x, list of tensors) or {x: list of tensors} (Shamir sharing)
+    :param entropy: the coder (None, "zlib", "zstd" or "lz4")
+    :return: the share where each tensor is replaced by a dictionary with its compressed bytes
+    """
+    if entropy is None or (isinstance(share, dict) and "seed" in share):
+        return share
+
+    if isinstance(share, dict):
+        return {x: pack_share(layers, entropy) for x, layers in share.items()}
+
+    if isinstance(share, tuple):
+        return share[0], pack_share(share[1], entropy)
+
+    return [{"data": entropy_encode(layer, entropy), "dtype": layer.dtype.str, "shape": layer.shape,
+             "entropy": entropy} for layer in share]
+
+
+def unpack_share(share):
+    """
+    Function to decode a share packed by pack_share (a share that is not packed is returned unchanged)
+    """
+    if isinstance(share, dict) and "seed" in share:
+        return share
+
+    if isinstance(share, dict):
+        return {x: unpack_share(layers) for x, layers in share.items()}
+
+    if isinstance(share, tuple):
+        return share[0], unpack_share(share[1])
+
+    return [entropy_decode(layer["data"], layer["dtype"], layer["entropy"]).reshape(layer["shape"]).copy()
+            if isinstance(layer, dict) else layer for layer in share]
@@ -1,3 +1,6 @@
+import secrets
+import threading
+
 import numpy as np
 
 # For the differential privacy
@@ -57,19 +60,89 @@ def apply_additif(input_list, n_shares=3):
     return encrypted_list
 
 
+# Functions for additif secret sharing where the random shares are sent as seeds:
+# the n - 1 random shares are generated by a PRG (PCG64) and only their seeds are sent, the receiver expands them.
+# The PRG is used in counter mode (one generator for each chunk of each layer) so a share can be expanded chunk
+# by chunk with the same values whatever the order.
+SEED_CHUNK_SIZE = 2 ** 20
+
+
+def is_seed_share(share):
+    return isinstance(share, dict) and "seed" in share
+
+
+def expand_seed_chunk(seed, layer, chunk, size):
+    """
+    Function to generate the values of a chunk of a layer of a share represented by a seed
+    :param seed: the seed of the share
+    :param layer: index of the layer
+    :param chunk: index of the chunk in the layer
+    :param size: number of values of the chunk
+    :return: the values of the chunk (same distribution as the shares of encrypt_tensor)
+    """
+    rng = np.random.Generator(np.random.PCG64([seed, layer, chunk]))
+    return rng.integers(-5, 5, size=size)
+
+
+def add_seed_share(decrypted_list, share, sign=1):
+    """
+    Function to add (or subtract) in place a share represented by a seed, one chunk at a time
+    :param decrypted_list: list of tensors where the share is added
+    :param share: the share {"seed": seed, "shapes": shapes of the layers}
+    :param sign: 1 to add the share, -1 to subtract it
+    """
+    operation = np.add if sign > 0 else np.subtract
+    for layer, tensor in enumerate(decrypted_list):
+        flat = tensor.reshape(-1)
+        for chunk, start in enumerate(range(0, flat.size, SEED_CHUNK_SIZE)):
+            end = min(start + SEED_CHUNK_SIZE, flat.size)
+            values = expand_seed_chunk(share["seed"], layer, chunk, end - start)
+            operation(flat[start:end], values, out=flat[start:end])
+
+
+def apply_additif_seed(input_list, n_shares=3):
+    """
+    Function to apply additif secret sharing where the n - 1 random shares are represented by seeds
+    :param input_list: The secret to share (a list of tensors)
+    :param n_shares: the number of parts to divide the secret (so the number of participants)
+    :return: the list of shares: n - 1 shares {"seed": seed, "shapes": shapes} and the last share (list of tensors)
+    """
+    shapes = [np.shape(weights_layer) for weights_layer in input_list]
+    encrypted_list = [{"seed": secrets.randbits(64), "shapes": shapes} for _ in range(n_shares - 1)]
+
+    # The last part is the secret minus the random shares
+    last_share = [np.array(weights_layer, dtype=np.result_type(weights_layer, np.int64))
+                  for weights_layer in input_list]
+    for share in encrypted_list:
+        add_seed_share(last_share, share, sign=-1)
+
+    encrypted_list.append(last_share)
+    return encrypted_list
+
+
 # Functions for shamir secret sharing
 def calculate_y(x, poly):
     """
     Function to calculate the value of y from a polynomial and a value of x:
     y = poly[0] + x*poly[1] + x^2*poly[2] + ...
+    The evaluation is vectorized: x can be an array of abscissas and poly a matrix with one polynomial per row,
+    the powers of x are computed once (Vandermonde matrix) for all the polynomials.
 
-    :param x: the value of x
-    :param poly: the list of coefficients of the polynomial
+    :param x: the value of x (or an array of N values)
+    :param poly: the list of coefficients of the polynomial (or a matrix of shape (n_polynomials, degree + 1))
 
-    :return: the value of y
+    :return: the value of y (or an array of shape (N, n_polynomials))
     """
-    y = sum([poly[i] * x ** i for i in range(len(poly))])
-    return y
+    poly = np.asarray(poly)
+    powers = np.vander(np.atleast_1d(x), poly.shape[-1], increasing=True)  # powers[j, i] = x_j ** i
+
+    # The terms are added in the order of the degrees (like the sum of the previous implementation)
+    # so the values are identical to the scalar evaluation
+    y = 0
+    for i in range(poly.shape[-1]):
+        y = y + np.multiply.outer(powers[:, i], poly[..., i])
+
+    return y[0] if np.ndim(x) == 0 else y
 
 
 def apply_shamir(input_list, n_shares=2, k=3):
@@ -101,17 +174,18 @@ def apply_poly(S, N, K):
     # A tensor of polynomials to store the coefficients of each polynomial
     # The element i of the column 0 corresponds to the constant of the polynomial i which is the secret S_i
     # that we want to encrypt
-    poly = np.array([[S[i]] + [0] * (K - 1) for i in range(len(S))])
+    S = np.asarray(S)
+    poly = np.zeros((len(S), K), dtype=np.result_type(S.dtype, np.int64))
+    poly[:, 0] = S
 
     # Chose randomly K - 1 numbers for each row except the first column which is the secret
     poly[:, 1:] = np.random.randint(1, 996, np.shape(poly[:, 1:])) + 1
 
-    # Generate N points for each polynomial we created
-    points = np.array([
-        [
-            (x, calculate_y(x, poly[i])) for x in range(1, N + 1)
-        ] for i in range(len(S))
-    ]).T
+    # Generate N points for each polynomial we created: points[0] are the x and points[1] the y, of shape (N, len(S))
+    list_x = np.arange(1, N + 1)
+    points = np.empty((2, N, len(S)), dtype=poly.dtype)
+    points[0] = list_x[:, None]
+    points[1] = calculate_y(list_x, poly)
     return points
 
 
@@ -127,6 +201,9 @@ def apply_smpc(input_list, n_shares=2, type_ss="additif", threshold=3):
     if type_ss == "additif":
         return apply_additif(input_list, n_shares), None
 
+    elif type_ss == "additif_seed":
+        return apply_additif_seed(input_list, n_shares), None
+
     elif type_ss == "shamir":
         secret_shape = [weights_layer.shape for weights_layer in input_list]
 
@@ -137,28 +214,99 @@ def apply_smpc(input_list, n_shares=2, type_ss="additif", threshold=3):
         list_shares = [(list_x[id_client], encrypted_result[id_client])for id_client in indices]
         return list_shares, secret_shape
 
+    elif type_ss in ["additif_field", "shamir_field"]:
+        return apply_field(input_list, n_shares, type_ss, threshold)
+
     else:
         raise ValueError("Type of secret sharing not recognized")
 
 
 # %% Functions to sum the parts (SMPC)
+class ShareAccumulator:
+    """
+    Sum of the shares received by an entity (a client or the node for a cluster).
+    Each share is added in place to a preallocated buffer for each layer as soon as it is received,
+    so only the sum is kept in memory (and not all the shares) and it is ready when the last share is received.
+    The shares can be a list of tensors (additif), a seed (additif_seed), a tuple (x, list of tensors) (Shamir share)
+    or a dictionary {x: list of tensors} (sums of Shamir shares sent to the node).
+    """
+    def __init__(self, type_ss="additif"):
+        self.type_ss = type_ss
+        # In the field the values are summed on uint64 (each value is lower than p < 2^32, so the sum of less than
+        # 2^32 shares can't overflow) and reduced modulo p in result(), else on float64
+        self.dtype = np.uint64 if type_ss in ["additif_field", "shamir_field"] else np.float64
+        self.lock = threading.Lock()
+        self.sums = None
+        self.count = 0
+
+    def reset(self):
+        with self.lock:
+            self.sums = None
+            self.count = 0
+
+    def add_layers(self, sums, list_weights):
+        if sums is None:
+            return [np.array(weights_layer, dtype=self.dtype) for weights_layer in list_weights]
+
+        for sum_layer, weights_layer in zip(sums, list_weights):
+            np.add(sum_layer, weights_layer, out=sum_layer)
+
+        return sums
+
+    def add(self, share):
+        """
+        Function to add a share to the sum
+        :param share: the share received
+        """
+        with self.lock:
+            if is_seed_share(share):
+                if self.sums is None:
+                    self.sums = [np.zeros(shape, dtype=self.dtype) for shape in share["shapes"]]
+                add_seed_share(self.sums, share)
+
+            elif isinstance(share, tuple):
+                x, list_weights = share
+                self.sums = {} if self.sums is None else self.sums
+                self.sums[x] = self.add_layers(self.sums.get(x), list_weights)
+
+            elif isinstance(share, dict):
+                self.sums = {} if self.sums is None else self.sums
+                for x, list_weights in share.items():
+                    self.sums[x] = self.add_layers(self.sums.get(x), list_weights)
+
+            else:
+                self.sums = self.add_layers(self.sums, share)
+
+            self.count += 1
+
+    def result(self):
+        """
+        Function to get the sum of the shares received
+        :return: list of tensors, or dictionary {x: list of tensors} for Shamir's secret sharing
+        """
+        with self.lock:
+            if self.dtype != np.uint64:
+                return self.sums
+
+            if isinstance(self.sums, dict):
+                return {x: [layer % FIELD_PRIME for layer in list_weights] for x, list_weights in self.sums.items()}
+
+            return [layer % FIELD_PRIME for layer in self.sums]
+
+
 def sum_shares_additif(encrypted_list):
     """
     Function to sum the parts received by an entity when the secret sharing algorithm used is additif.
+    The shares represented by a seed (see apply_additif_seed) are expanded and added one chunk at a time.
     :param encrypted_list: list of shares to sum
     :return: the sum of the parts received
     so decrypted_list[layer] = sum([weights_1[layer], weights_2[layer], ..., weights_n[layer]])
     """
-    decrypted_list = []
-    n_shares = len(encrypted_list)
-
-    for layer in range(len(encrypted_list[0])):  # for each layer
-        # We sum each part of the given layer
-        sum_array = sum([encrypted_list[i][layer] for i in range(n_shares)])
+    accumulator = ShareAccumulator("additif")
+    for share in encrypted_list:
+        accumulator.add(share)
 
-        decrypted_list.append(sum_array)
-
-    return decrypted_list
+    return accumulator.result()
 
 
 def sum_shares_shamir(encrypted_list):
@@ -168,15 +316,11 @@ def sum_shares_shamir(encrypted_list):
     :param encrypted_list: list of shares to sum where each element is a tuple (x, y) with x an abscissa and all y received for this x.
     :return: the sum of the parts received so result_som[x] = sum([y_1, y_2, ..., y_n])
     """
-    result_som = {}  # sum for a given client
-    for (x, list_weights) in encrypted_list:
-        if x in result_som:
-            for layer in range(len(list_weights)):
-                result_som[x][layer] += list_weights[layer]
-        else:
-            result_som[x] = list_weights
+    accumulator = ShareAccumulator("shamir")
+    for share in encrypted_list:
+        accumulator.add(share)
 
-    return result_som
+    return accumulator.result()
 
 
 def sum_shares(encrypted_list, type_ss="additif"):
@@ -186,12 +330,15 @@ def sum_shares(encrypted_list, type_ss="additif"):
     :param type_ss: type of secret sharing algorithm used
     :return: the sum of the parts received
     """
-    if type_ss == "additif":
+    if type_ss in ["additif", "additif_seed"]:
         return sum_shares_additif(encrypted_list)
 
     elif type_ss == "shamir":
         return sum_shares_shamir(encrypted_list)
 
+    elif type_ss in ["additif_field", "shamir_field"]:
+        return sum_shares_field(encrypted_list, type_ss)
+
     else:
         raise ValueError("Type of secret sharing not recognized")
 
@@ -230,60 +377,268 @@ def combine_shares_node(secret_list):
     :param secret_list: list of shares of each client, so secret_list[id_client][x][layer]
     :return: dictionary of the secret, so secret_dic_final[x][layer]
     """
-    secret_dic_final = {}
-    for id_client in range(len(secret_list)):
-        for x, list_weights in secret_list[id_client].items():
-            if x in secret_dic_final:
-                for layer in range(len(list_weights)):
-                    secret_dic_final[x][layer] += list_weights[layer]
-            else:
-                secret_dic_final[x] = list_weights
-    return secret_dic_final
+    accumulator = ShareAccumulator("shamir")
+    for secret in secret_list:
+        accumulator.add(secret)
+
+    return accumulator.result()
+
 
+def lagrange_coefficients(x):
+    """
+    Function to compute the Lagrange basis polynomials at x=0 for the given abscissas,
+    so the secret is sum(coefficients[i] * y[i]) (see generate_secret_shamir)
+    :param x: list of the m abscissas used for the reconstruction
+    :return: array of the m coefficients
+    """
+    x = np.asarray(x, dtype=np.float64)
+    coefficients = np.ones(len(x))
+    for i in range(len(x)):
+        for j in range(len(x)):
+            if i != j:
+                coefficients[i] *= -x[j] / (x[i] - x[j])  # L_i(x=0)
+
+    return coefficients
 
-def decrypt_shamir_node(secret_dic_final, secret_shape, m):
+
+def decrypt_shamir_node(secret_dic_final, secret_shape, m, chunk_size=None):
     """
-    Function to decrypt the secret on the node side with Shamir secret sharing
+    Function to decrypt the secret on the node side with Shamir secret sharing.
+    The x are the same for all the weights, so the Lagrange coefficients are computed once
+    and the secret is a matrix-vector product between the coefficients and the y of all the weights.
     :param secret_dic_final: dictionary of the secret, so secret_dic_final[x][layer]
     :param secret_shape: list of shapes of the layers
     :param m: number of shares to use for the reconstruction of the secret
+    :param chunk_size: None to reconstruct all the layers with one product (the y of the m shares are copied in one
+    matrix), or the maximum number of weights reconstructed at once to bound the memory used for very large models
     :return: list of the decrypted secret, so decrypted_result[layer]  = weights_layer
     """
     x_combine = list(secret_dic_final.keys())
     y_combine = list(secret_dic_final.values())
+    coefficients = lagrange_coefficients(x_combine[:m])
+
+    if chunk_size is None:
+        # One matrix of shape (m, number of weights) for all the layers
+        all_y = np.array([np.concatenate([np.ravel(y_layer) for y_layer in y_combine[i]]) for i in range(m)],
+                         dtype=np.float64)
+        secrets = np.split(coefficients @ all_y, np.cumsum([np.size(y_layer) for y_layer in y_combine[0]])[:-1])
+
+    else:
+        secrets = []
+        for layer in range(len(y_combine[0])):
+            size = np.size(y_combine[0][layer])
+            secret = np.empty(size, dtype=np.float64)
+            for start in range(0, size, chunk_size):
+                end = min(start + chunk_size, size)
+                chunk_y = np.array([np.ravel(y_combine[i][layer])[start:end] for i in range(m)], dtype=np.float64)
+                secret[start:end] = coefficients @ chunk_y
+            secrets.append(secret)
+
     decrypted_result = []
-    for layer in range(len(y_combine[0])):
-        list_x = []
-        list_y = []
-        for i in range(m):  # (len(x_combine)):
-            y = y_combine[i][layer]
-            x = np.ones(y.shape) * x_combine[i]
-            list_x.append(x)
-            list_y.append(y)
-
-        all_x_layer = np.array(list_x).T
-        all_y_layer = np.array(list_y).T
-
-        decrypted_result.append(
-            np.round(
-                [generate_secret_shamir(all_x_layer[i], all_y_layer[i], m) for i in range(len(all_x_layer))],
-                4).reshape(secret_shape[layer]) / len(x_combine)
-        )
+    for layer, secret in enumerate(secrets):
+        decrypted_result.append(np.round(secret, 4).reshape(secret_shape[layer]) / len(x_combine))
 
     return decrypted_result
 
 
-def aggregate_shamir(secret_list, secret_shape, m):
+def aggregate_shamir(secret_list, secret_shape, m, chunk_size=None):
     """
 
     :param secret_list: list of shares of each client, so secret_list[id_client][x][layer]
     :param secret_shape: list of shapes of the layers
     :param m: number of shares to use for the reconstruction of the secret
+    :param chunk_size: maximum number of weights reconstructed at once, None for no limit (see decrypt_shamir_node)
     :return: dictionary of the secret, so secret_dic_final[x] = [y1, y2, y3, y4] if we have 4 layers.
     where x is the value of the x coordinate, and y1, y2, y3, y4 are the values of the y coordinate for each layer
     """
     secret_dic_final = combine_shares_node(secret_list)
-    return decrypt_shamir_node(secret_dic_final, secret_shape, m)
+    return decrypt_shamir_node(secret_dic_final, secret_shape, m, chunk_size)
+
+
+# %% ////////////////////////////////////////////// SMPC over a prime field ///////////////////////////////////////////
+# The weights are encoded in fixed point (round(w * 2^frac_bits)) as integers modulo a prime, and the shares are
+# computed with modular arithmetic on uint64 arrays, so the reconstruction is exact.
+# With p < 2^32 the product of two elements of the field fits in a uint64.
+# The decoded values are signed: the sum of the secrets of a cluster must be in ]-p/2, p/2[,
+# so |sum of the weights| < 2^14 with the default 16 bits of fractional part.
+FIELD_PRIME = 2 ** 31 - 1
+FRAC_BITS = 16
+
+
+def encode_field(values, frac_bits=FRAC_BITS):
+    """
+    Function to encode a tensor in the field
+    :param values: the tensor to encode (the tensors of integers are encoded without scaling)
+    :param frac_bits: number of bits of the fractional part of the fixed-point encoding
+    :return: the tensor of uint64 and the number of bits of the fractional part used
+    """
+    values = np.asarray(values)
+    if not np.issubdtype(values.dtype, np.floating):
+        frac_bits = 0
+
+    integers = np.round(values.astype(np.float64) * 2 ** frac_bits).astype(np.int64)
+    return (integers % FIELD_PRIME).astype(np.uint64), frac_bits
+
+
+def decode_field(values, frac_bits=FRAC_BITS):
+    """
+    Function to decode a tensor of the field (the values greater than p/2 are the negative values)
+    :param values: the tensor of uint64
+    :param frac_bits: number of bits of the fractional part of the fixed-point encoding
+    :return: the tensor of float64
+    """
+    integers = (np.asarray(values) % FIELD_PRIME).astype(np.int64)
+    integers = np.where(integers > FIELD_PRIME // 2, integers - FIELD_PRIME, integers)
+    return integers / 2 ** frac_bits
+
+
+def encrypt_tensor_field(secret, n_shares=3):
+    """
+    Function to encrypt a tensor of the field with additif secret sharing
+    :param secret: the tensor of uint64 to encrypt
+    :param n_shares: the number of parts to divide the secret (so the number of participants)
+    :return: the list of shares where each share is a tensor of uint64, uniformly distributed in the field
+    """
+    shares = [np.random.randint(0, FIELD_PRIME, size=secret.shape, dtype=np.uint64) for _ in range(n_shares - 1)]
+
+    # The sum of the n - 1 masks is lower than (n - 1) * p, so only one modulo is needed
+    masks = sum(shares)
+    shares.append((secret + np.uint64((n_shares - 1) * FIELD_PRIME) - masks) % FIELD_PRIME)
+
+    return shares
+
+
+def apply_poly_field(S, N, K):
+    """
+    Function to perform Shamir's secret sharing in the field
+    :param S: The secret to share (a flat tensor of uint64)
+    :param N: the number of parts to divide the secret (so the number of participants)
+    :param K: the minimum number of parts to reconstruct the secret (with a polynomial of order K-1)
+    :return: array of shape (N, len(S)), the y of the points x = 1, ..., N
+    """
+    coefficients = np.random.randint(0, FIELD_PRIME, size=(K - 1, len(S)), dtype=np.uint64)
+
+    points = np.empty((N, len(S)), dtype=np.uint64)
+    for x in range(1, N + 1):
+        # Horner: y = (((a_{K-1} * x + a_{K-2}) * x + ...) * x + S) mod p
+        # bound is an upper bound of y, the modulo is only applied when the next step could exceed 2^64
+        y = np.zeros(len(S), dtype=np.uint64)
+        bound = 0
+        for coefficient in list(coefficients[::-1]) + [S]:
+            if (bound * x + FIELD_PRIME) >= 2 ** 64:
+                y %= FIELD_PRIME
+                bound = FIELD_PRIME
+            y = y * np.uint64(x) + coefficient
+            bound = bound * x + FIELD_PRIME
+        points[x - 1] = y % FIELD_PRIME
+
+    return points
+
+
+def apply_field(input_list, n_shares=3, type_ss="additif_field", threshold=3):
+    """
+    Function to apply the secret sharing in the field
+    :param input_list: list of tensors to share
+    :param n_shares: the number of parts to divide the secret (so the number of participants)
+    :param type_ss: "additif_field" or "shamir_field"
+    :param threshold: the minimum number of parts to reconstruct the secret with Shamir's secret sharing
+    :return: the list of shares for each client (a list of tensors for additif_field and (x, list of tensors) for
+    shamir_field) and the information to decode the secret: {"shapes": shapes of the layers, "frac_bits": [...]}
+    """
+    secret_info = {"shapes": [], "frac_bits": []}
+    list_clients = [[] for _ in range(n_shares)]
+    for weights_layer in input_list:
+        encoded, frac_bits = encode_field(weights_layer)
+        secret_info["shapes"].append(np.shape(weights_layer))
+        secret_info["frac_bits"].append(frac_bits)
+
+        if type_ss == "additif_field":
+            encrypted_layer = encrypt_tensor_field(encoded, n_shares)
+        else:
+            encrypted_layer = apply_poly_field(encoded.ravel(), n_shares, threshold)
+
+        for i in range(n_shares):
+            list_clients[i].append(encrypted_layer[i])
+
+    if type_ss == "shamir_field":
+        list_clients = [(i + 1, list_clients[i]) for i in range(n_shares)]
+
+    return list_clients, secret_info
+
+
+def sum_shares_field(encrypted_list, type_ss="additif_field"):
+    """
+    Function to sum the parts received by an entity in the field
+    :param encrypted_list: list of shares to sum (see sum_shares_additif and sum_shares_shamir)
+    :param type_ss: "additif_field" or "shamir_field"
+    :return: the sum of the parts received (modulo p)
+    """
+    accumulator = ShareAccumulator(type_ss)
+    for share in encrypted_list:
+        accumulator.add(share)
+
+    return accumulator.result()
+
+
+def lagrange_coefficients_field(x):
+    """
+    Function to compute the Lagrange basis polynomials at x=0 in the field
+    :param x: list of the abscissas used for the reconstruction
+    :return: list of the coefficients (int)
+    """
+    coefficients = []
+    for i in range(len(x)):
+        coefficient = 1
+        for j in range(len(x)):
+            if i != j:
+                coefficient = coefficient * x[j] * pow(x[j] - x[i], -1, FIELD_PRIME) % FIELD_PRIME
+        coefficients.append(coefficient)
+
+    return coefficients
+
+
+def decrypt_field(secret_sum, secret_info, type_ss="additif_field", m=3, n_secrets=1):
+    """
+    Function to reconstruct the mean of the secrets of a cluster from the sum of the shares of the clients
+    :param secret_sum: sum of the secrets (additif_field) or dictionary {x: sum of the y} (shamir_field)
+    :param secret_info: information to decode the secret (see apply_field)
+    :param type_ss: "additif_field" or "shamir_field"
+    :param m: number of shares to use for the reconstruction of the secret with Shamir's secret sharing
+    :param n_secrets: number of secrets summed (used with additif_field, with shamir_field it is the number of x)
+    :return: list of the mean of the secrets, so decrypted_result[layer] = weights_layer
+    """
+    n_layers = len(secret_info["shapes"])
+    if type_ss == "additif_field":
+        sums = secret_sum
+
+    else:
+        x_combine = list(secret_sum.keys())
+        coefficients = lagrange_coefficients_field(x_combine[:m])
+        sums = []
+        for layer in range(n_layers):
+            secret = np.zeros(np.size(secret_sum[x_combine[0]][layer]), dtype=np.uint64)
+            for coefficient, x in zip(coefficients, x_combine[:m]):
+                secret = (secret + np.uint64(coefficient) * (secret_sum[x][layer] % FIELD_PRIME)) % FIELD_PRIME
+            sums.append(secret.reshape(secret_info["shapes"][layer]))
+        n_secrets = len(x_combine)
+
+    return [decode_field(sums[layer], secret_info["frac_bits"][layer]) / n_secrets for layer in range(n_layers)]
+
+
+def aggregate_field(secret_list, secret_info, type_ss="additif_field", m=3):
+    """
+    Function to reconstruct the mean of the secrets of a cluster on the node side
+    :param secret_list: list of the sums of shares of each client (see sum_shares_field)
+    :param secret_info: information to decode the secret (see apply_field)
+    :param type_ss: "additif_field" or "shamir_field"
+    :param m: number of shares to use for the reconstruction of the secret with Shamir's secret sharing
+    :return: list of the mean of the secrets, so decrypted_result[layer] = weights_layer
+    """
+    accumulator = ShareAccumulator(type_ss)
+    for secret in secret_list:
+        accumulator.add(secret)
+
+    return decrypt_field(accumulator.result(), secret_info, type_ss, m, accumulator.count)
 
 
 # %% /////////////////////////////////////// Poisoning //////////////////////////////////////////////////////
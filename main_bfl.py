@@ -5,6 +5,7 @@ import json
 
 from node import Node
 from client import Client
+from round_events import round_events
 
 from going_modular.utils import initialize_parameters
 from going_modular.data_setup import load_dataset
@@ -23,7 +24,11 @@ def train_client(client_obj):
     training_barrier.wait()  # Wait here until all clients have trained
 
 
-def create_nodes(test_sets, number_of_nodes, save_results, coef_usefull=1.2, tolerance_ceil=0.1, ss_type="additif", m=3, **kwargs):
+def create_nodes(test_sets, number_of_nodes, save_results, coef_usefull=1.2, tolerance_ceil=0.1, ss_type="additif", m=3,
+                 server_mode="thread", broadcast_compression=None, update_compression=None,
+                 shamir_chunk_size=None, chain_storage=None, model_store=None, model_format="npz",
+                 model_cache_bytes=None, precompute_evaluation=False, key_type="rsa", pbft_window=8, pbft_batch_size=1,
+                 pbft_batch_delay=0.5, **kwargs):
     list_nodes = []
     for num_node in range(number_of_nodes):
         list_nodes.append(
@@ -37,6 +42,19 @@ def create_nodes(test_sets, number_of_nodes, save_results, coef_usefull=1.2, tol
                 tolerance_ceil=tolerance_ceil,
                 ss_type=ss_type,
                 m=m,
+                server_mode=server_mode,
+                broadcast_compression=broadcast_compression,
+                update_compression=update_compression,
+                shamir_chunk_size=shamir_chunk_size,
+                chain_storage=chain_storage,
+                model_store=model_store,
+                model_format=model_format,
+                model_cache_bytes=model_cache_bytes,
+                precompute_evaluation=precompute_evaluation,
+                key_type=key_type,
+                pbft_window=pbft_window,
+                pbft_batch_size=pbft_batch_size,
+                pbft_batch_delay=pbft_batch_delay,
                 save_results=save_results,
                 **kwargs
             )
@@ -46,7 +64,7 @@ def create_nodes(test_sets, number_of_nodes, save_results, coef_usefull=1.2, tol
 
 
 def create_clients(train_sets, test_sets, node, number_of_clients, save_results, type_ss="additif", threshold=3, m=3,
-                   **kwargs):
+                   server_mode="thread", update_compression=None, **kwargs):
     dict_clients = {}
     for num_client in range(number_of_clients):
         dataset_index = node * number_of_clients + num_client
@@ -59,6 +77,8 @@ def create_clients(train_sets, test_sets, node, number_of_clients, save_results,
             type_ss=type_ss,
             threshold=threshold,
             m=m,
+            server_mode=server_mode,
+            update_compression=update_compression,
             save_results=save_results,
             **kwargs
         )
@@ -81,6 +101,31 @@ def cluster_generation(list_nodes, list_clients, min_number_of_clients_in_cluste
                         list_clients[num_node][client_id_1].add_connections(client_id_2, list_clients[num_node][client_id_2].port)
 
 
+def wait_updates_decided(nodes, decided_before, number_of_blocks, timeout):
+    # Wait until the blocks of the updates are committed or rejected by all the nodes
+    return round_events.wait_until(
+        lambda: all(len(node.consensus_protocol.decided) >= decided + number_of_blocks
+                    for node, decided in zip(nodes, decided_before)),
+        timeout, f"the consensus on {number_of_blocks} update(s)")
+
+
+def wait_global_model(nodes, clients, global_index, timeout):
+    # Wait until the global model of index global_index is in the chain of all the nodes and received by their clients
+    def global_model_received():
+        for node, node_clients in zip(nodes, clients):
+            block = node.blockchain.last_global_block
+            if block is None or block.index < global_index:
+                return False
+
+            for client in node_clients.values():
+                if client.global_model_id is None or client.global_model_id.split("_")[0] != block.current_hash:
+                    return False
+
+        return True
+
+    return round_events.wait_until(global_model_received, timeout, "the global model")
+
+
 # todo:
 #  Gérer l'attente : attendre de recevoir les parts de k clients pour un cluster pour commencer shamir (pour le moment on attend les min_number_of_clients_in_cluster shares)
 #  Ajouter le checksum pour verifier la non altération des shares du smpc.
@@ -125,7 +170,13 @@ if __name__ == "__main__":
     nodes = create_nodes(
         node_test_sets, settings['number_of_nodes'], save_results=settings['save_results'],
         coef_usefull=settings['coef_usefull'], tolerance_ceil=settings['tolerance_ceil'], 
-        ss_type=settings['secret_sharing'], m=settings['m'],
+        ss_type=settings['secret_sharing'], m=settings['m'], server_mode=settings['server_mode'],
+        broadcast_compression=settings['broadcast_compression'], update_compression=settings['update_compression'],
+        shamir_chunk_size=settings['shamir_chunk_size'], chain_storage=settings['chain_storage'],
+        model_store=settings['model_store'], model_format=settings['model_format'],
+        model_cache_bytes=settings['model_cache_bytes'], precompute_evaluation=settings['precompute_evaluation'],
+        key_type=settings['key_type'], pbft_window=settings['pbft_window'],
+        pbft_batch_size=settings['pbft_batch_size'], pbft_batch_delay=settings['pbft_batch_delay'],
         dp=settings['diff_privacy'], model_choice=settings['arch'], batch_size=settings['batch_size'],
         classes=list_classes, choice_loss=settings['choice_loss'], choice_optimizer=settings['choice_optimizer'],
         choice_scheduler=settings['choice_scheduler'],  save_figure=None, matrix_path=settings['matrix_path'],
@@ -139,6 +190,7 @@ if __name__ == "__main__":
         node_clients = create_clients(
             client_train_sets, client_test_sets, i, settings['number_of_clients_per_node'],
             type_ss=settings['secret_sharing'], m=settings['m'], threshold=settings['k'],
+            server_mode=settings['server_mode'], update_compression=settings['update_compression'],
             save_results=settings['save_results'], dp=settings['diff_privacy'], model_choice=settings['arch'],
             batch_size=settings['batch_size'], epochs=settings['n_epochs'], classes=list_classes,
             learning_rate=settings['lr'], choice_loss=settings['choice_loss'],
@@ -171,9 +223,15 @@ if __name__ == "__main__":
         for client in clients[i].values(): 
             threading.Thread(target=client.start_server).start()
 
+    # The rounds advance on the events of the nodes and clients, round_timeout only guards against a failure
+    timeout = settings['round_timeout']
+    start_time = time.time()
+    entities = nodes + [client for node_clients in clients for client in node_clients.values()]
+    round_events.wait_until(lambda: all(entity.listening for entity in entities), timeout, "the servers")
+
     nodes[0].create_first_global_model_request()
 
-    time.sleep(settings['ts'])
+    wait_global_model(nodes, clients, 1, timeout)
 
     # training and SMPC
     for round_i in range(settings['n_rounds']):
@@ -184,6 +242,10 @@ if __name__ == "__main__":
         with open("results/BFL/output.txt", "a") as f:
             f.write(f"### ROUND {round_i + 1} ###\n")
 
+        # The updates of the clusters are in consensus at the same time (see PBFTProtocol), while the next nodes train
+        decided_before = [len(node.consensus_protocol.decided) for node in nodes]
+        number_of_updates = sum(len(node.clusters) for node in nodes)
+
         # ## training ###
         for i in range(settings['number_of_nodes']):
             print(f"Node {i + 1} : Training\n")
@@ -199,24 +261,26 @@ if __name__ == "__main__":
             print(f"Node {i + 1} : SMPC\n")
             
             for cluster in nodes[i].clusters:
-                for client_id in cluster.keys():
-                    if client_id in ['tot', 'count']:
-                        continue
-                    client = clients[i][client_id]
-                    client.send_frag_node()
-                    time.sleep(5)
+                cluster_clients = [clients[i][client_id] for client_id in cluster.keys()
+                                   if client_id not in ['tot', 'count']]
+                round_events.wait_until(lambda: all(client.shares_received for client in cluster_clients), timeout,
+                                        "the shares of the cluster")
 
-                time.sleep(settings['ts'])
+                for client in cluster_clients:
+                    client.send_frag_node()
 
-            time.sleep(settings['ts'])
+        wait_updates_decided(nodes, decided_before, number_of_updates, timeout)
 
-        nodes[0].create_global_model()
+        global_index = nodes[0].blockchain.len_chain
+        if nodes[0].create_global_model() is not None:
+            wait_global_model(nodes, clients, global_index, timeout)
 
-        time.sleep(settings['ts'])
+        print(f"Round {round_i + 1} done after {time.time() - start_time:.1f} s")
 
     nodes[0].blockchain.print_blockchain()
 
     for i in range(settings['number_of_nodes']):
         nodes[i].blockchain.save_chain_in_file(settings['save_results'] + f"node{i + 1}.txt")
+        nodes[i].blockchain.close()
 
-    print("This is the end")
+    print(f"This is the end ({time.time() - start_time:.1f} s)")
@@ -2,9 +2,7 @@ import logging
 import numpy as np
 import threading
 import os
-import pickle
 import time
-import socket
 import json
 import torch
 
@@ -15,7 +13,8 @@ from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization
 
 from flowerclient import FlowerClient
-from node import get_keys, start_server
+from node import get_keys
+from transport import ConnectionPool, start_server
 from going_modular.security import sum_shares
 
 from going_modular.utils import initialize_parameters
@@ -66,37 +65,15 @@ class Client:
         # same
         start_server(self.host, self.port, self.handle_message, self.id)
 
-    def handle_message(self, client_socket):
-        data_length_bytes = client_socket.recv(4)
-        if not data_length_bytes:
-            return  # No data received, possibly handle this case as an error or log it
-        data_length = int.from_bytes(data_length_bytes, byteorder='big')
-
-        # Now read exactly data_length bytes
-        data = b''
-        while len(data) < data_length:
-            packet = client_socket.recv(data_length - len(data))
-            if not packet:
-                break  # Connection closed, handle this case if necessary
-            data += packet
-
-        if len(data) < data_length:
-            # Log this situation as an error or handle it appropriately
-            print("Data was truncated or connection was closed prematurely.")
-            return
-
-        message = pickle.loads(data)
-
+    def handle_message(self, message):
         message_type = message.get("type")
 
         # No if message_type == "frag_weights" because no SMPC.
         if message_type == "global_model":
             print("received_value")
-            weights = pickle.loads(message.get("value"))
+            weights = message.get("value")
             self.flower_client.set_parameters(weights)
 
-        client_socket.close()
-
     def train(self):
         old_params = self.flower_client.get_parameters({})
         res = old_params[:]
@@ -139,6 +116,7 @@ class Node:
         self.port = port
 
         self.clients = {}
+        self.pool = ConnectionPool()
 
         self.global_params_directory = ""
 
@@ -160,27 +138,7 @@ class Node:
         # same
         start_server(self.host, self.port, self.handle_message, self.id)
 
-    def handle_message(self, client_socket):
-        # First, read the length of the data
-        data_length_bytes = client_socket.recv(4)
-        if not data_length_bytes:
-            return  # No data received, possibly handle this case as an error or log it
-        data_length = int.from_bytes(data_length_bytes, byteorder='big')
-
-        # Now read exactly data_length bytes
-        data = b''
-        while len(data) < data_length:
-            packet = client_socket.recv(data_length - len(data))
-            if not packet:
-                break  # Connection closed, handle this case if necessary
-            data += packet
-
-        if len(data) < data_length:
-            # Log this situation as an error or handle it appropriately
-            print("Data was truncated or connection was closed prematurely.")
-            return
-
-        message = pickle.loads(data)
+    def handle_message(self, message):
         message_type = message.get("type")
 
         if message_type == "frag_weights":
@@ -189,8 +147,6 @@ class Node:
         else:
             print("in else")
 
-        client_socket.close()
-
     def get_weights(self, len_dataset=10):
         # same
         params_list = []
@@ -220,24 +176,10 @@ class Node:
         loaded_weights = torch.load(filename)
 
         print("len(self.clients)", len(self.clients))
-        for k, v in self.clients.items():
-            print("sending to client", k)
-            address = v.get('address')
-
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_socket.connect(('127.0.0.1', address[1]))
-
-            serialized_data = pickle.dumps(loaded_weights)
-            message = {"type": "global_model", "value": serialized_data}
-
-            serialized_message = pickle.dumps(message)
-
-            # Send the length of the message first
-            client_socket.send(len(serialized_message).to_bytes(4, byteorder='big'))
-            client_socket.send(serialized_message)
-
-            # Close the socket after sending
-            client_socket.close()
+        message = {"type": "global_model", "value": loaded_weights}
+        print("sending to clients", list(self.clients.keys()))
+        addresses = [('127.0.0.1', v.get('address')[1]) for v in self.clients.values()]
+        self.pool.broadcast(addresses, message)
 
     def create_first_global_model(self):
 
@@ -5,18 +5,25 @@ import torch
 import json
 
 from going_modular.data_setup import load_dataset
-from going_modular.utils import choice_device, np
+from going_modular.utils import choice_device
+from chain_store import ChainLog
+from model_store import CHECKPOINT_SUFFIX, load_weights
 from flowerclient import FlowerClient
 
 
 # %%
 def get_model_files(dir_model, training_approach="CFL"):
     all_files = os.listdir(dir_model)
-    model_files = [file for file in all_files if file.endswith('.npz') or (file.endswith('.pth') and training_approach == "scratch")]
+    model_files = [file for file in all_files if file.endswith('.npz') or file.endswith(CHECKPOINT_SUFFIX)
+                   or (file.endswith('.pth') and training_approach == "scratch")]
     return model_files
 
 
 def get_global_model_storage_reference(file_path):
+    if os.path.isdir(file_path):
+        # Chain log of a node (see chain_store.ChainLog)
+        return get_global_model_storage_reference_log(file_path)
+
     with open(file_path, 'r') as ff:
         content = ff.read()
 
@@ -29,6 +36,16 @@ def get_global_model_storage_reference(file_path):
     return matches[-1] if matches else None
 
 
+def get_global_model_storage_reference_log(directory):
+    # The log may be the one of a running node: it is read without writing a checkpoint or truncating a record
+    records = ChainLog(directory, read_only=True).load()
+    for record in records[::-1]:
+        if record["model_type"] == "global_model":
+            return record["storage_reference"]
+
+    return None
+
+
 # %%
 if __name__ == '__main__':
     # %%
@@ -78,9 +95,9 @@ if __name__ == '__main__':
     evaluation = []
 
     for model_file in model_list:
-        if model_file.endswith('.npz'):
+        if model_file.endswith('.npz') or model_file.endswith(CHECKPOINT_SUFFIX):
             print(model_file)
-            loaded_weights_dict = np.load(config['save_model'] + model_file, allow_pickle=True)
+            loaded_weights_dict = load_weights(config['save_model'] + model_file)
         else:
             # Torch model
             loaded_weights_dict = torch.load(config['save_model'] + model_file)
@@ -116,7 +133,7 @@ if __name__ == '__main__':
     if training_approach == "BFL":
         model_file = get_global_model_storage_reference(path_nodetxt)
 
-        loaded_weights_dict = np.load(model_file, allow_pickle=True)
+        loaded_weights_dict = load_weights(model_file)
         loaded_weights = [val for key, val in loaded_weights_dict.items() if 'len_dataset' not in key]
         metrics = flower_client.evaluate(loaded_weights, {'name': 'global_test_model_file_best_'})
         print(metrics)
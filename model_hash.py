@@ -0,0 +1,134 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+# The commitment of a model is a Merkle tree:
+#   - the leaves are the chunks of CHUNK_SIZE bytes of each tensor,
+#   - the hash of a layer is the hash of its name, dtype, shape and the hashes of its chunks,
+#   - the root (calculated_hash of the blocks) is the hash of the hashes of the layers in the order of the names.
+# The hashes of the layers are stored in the blocks, so the nodes verify the model of a block layer by layer and report
+# the layers that don't match (see Node.verify_model_layers). A prefix byte separates the levels of the tree.
+# The raw bytes of the tensors are given to the hasher without any copy, and hashlib releases the GIL on large
+# buffers, so the layers can be hashed in parallel by threads with the same result.
+CHUNK_SIZE = 4 * 2 ** 20
+
+
+def tensor_bytes(array):
+    array = np.ascontiguousarray(array)
+    return memoryview(array).cast('B') if array.ndim else memoryview(array.tobytes())
+
+
+def hash_chunk(data):
+    hash_leaf = hashlib.sha256(b'\x00')
+    hash_leaf.update(data)
+    return hash_leaf.digest()
+
+
+def hash_chunks(array):
+    """
+    Function to hash the chunks of a tensor (the leaves of the tree)
+    :param array: the tensor
+    :return: list of the digests (bytes) of the chunks
+    """
+    data = tensor_bytes(array)
+    return [hash_chunk(data[start:start + CHUNK_SIZE]) for start in range(0, max(len(data), 1), CHUNK_SIZE)]
+
+
+def layer_root(name, dtype, shape, chunk_digests):
+    """
+    Function to compute the hash of a layer from the hashes of its chunks
+    :return: the digest (bytes)
+    """
+    header = json.dumps([name, np.dtype(dtype).str, list(shape)]).encode()
+
+    hash_layer = hashlib.sha256(b'\x01')
+    hash_layer.update(len(header).to_bytes(8, byteorder='big'))
+    hash_layer.update(header)
+    for digest in chunk_digests:
+        hash_layer.update(digest)
+    return hash_layer.digest()
+
+
+def hash_tensor(name, array):
+    """
+    Function to hash a tensor
+    :param name: name of the tensor in the model
+    :param array: the tensor (numpy array)
+    :return: the hash of the layer (hexadecimal string)
+    """
+    array = np.asarray(array)
+    return layer_root(name, array.dtype, array.shape, hash_chunks(array)).hex()
+
+
+def tree_root(layer_hashes):
+    """
+    Function to compute the root of the tree from the hashes of the layers
+    :param layer_hashes: dictionary name -> hash of the layer (hexadecimal string)
+    :return: the hash of the model (hexadecimal string)
+    """
+    hash_root = hashlib.sha256(b'\x02')
+    for name in sorted(layer_hashes):
+        hash_root.update(bytes.fromhex(layer_hashes[name]))
+    return hash_root.hexdigest()
+
+
+def model_tree(named_weights, workers=4):
+    """
+    Function to compute the hashes of the layers of a model
+    :param named_weights: dictionary (or list of pairs) name -> tensor
+    :param workers: number of threads hashing the layers (1 to hash them in the current thread)
+    :return: dictionary name -> hash of the layer (hexadecimal string)
+    """
+    items = [(name, np.asarray(array)) for name, array in dict(named_weights).items()]
+
+    def hash_item(item):
+        name, array = item
+        return name, hash_tensor(name, array)
+
+    if workers > 1 and len(items) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(executor.map(hash_item, items))
+
+    return dict(hash_item(item) for item in items)
+
+
+def hash_model(named_weights, workers=4):
+    """
+    Function to hash the tensors of a model
+    :return: the hash of the model, root of the tree (hexadecimal string)
+    """
+    return tree_root(model_tree(named_weights, workers))
+
+
+def load_named_weights(filename):
+    # The batch normalization layers are not part of the commitment (their statistics are not aggregated)
+    with np.load(filename) as loaded_weights_dict:
+        return {name: loaded_weights_dict[name] for name in loaded_weights_dict.files if 'bn' not in name}
+
+
+def model_tree_file(filename, workers=4):
+    """
+    Function to compute the hashes of the layers of a model saved in a .npz file
+    :return: dictionary name -> hash of the layer (hexadecimal string)
+    """
+    return model_tree(load_named_weights(filename), workers)
+
+
+def hash_model_file(filename, workers=4):
+    """
+    Function to hash a model saved in a .npz file, used for the creation and the validation of the blocks
+    :param filename: path of the .npz file
+    :return: the hash of the model (hexadecimal string)
+    """
+    return tree_root(model_tree_file(filename, workers))
+
+
+# %% Verification
+def verify_tree(layer_hashes, root):
+    """
+    Function to verify that the hashes of the layers stored in a block match its calculated_hash
+    """
+    return tree_root(layer_hashes) == root
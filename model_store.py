@@ -0,0 +1,377 @@
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from model_hash import model_tree, tree_root
+
+
+# %% ////////////////////////////////////////// Content-addressed store ///////////////////////////////////////////////
+# Each tensor is saved once in objects/<2 first characters of its hash>/<hash of the layer>.npy, the hash of the layer
+# being the one of the Merkle tree of the model (see model_hash.py). A model is a manifest (manifests/<root>.json)
+# giving the hash of each of its layers, its path is the storage reference of the block.
+# So a layer identical in several models (frozen layers, len_dataset, a global model validated by several nodes)
+# is written once, and the tensors are memory-mapped (read-only) and shared by all the loads of the process.
+# The mappings of the tensors loaded recently are kept open (LRU, bounded by their size), a mapping evicted is closed
+# when the last model using it is deleted.
+MANIFEST_SUFFIX = ".json"
+MAPPED_OBJECTS_BYTES = 2 ** 30
+
+stores = {}  # directory -> ModelStore, shared by the nodes of the process
+stores_lock = threading.Lock()
+
+
+class ModelStore:
+    def __init__(self, directory, max_mapped_bytes=MAPPED_OBJECTS_BYTES):
+        """
+        :param directory: directory of the store (objects/ and manifests/)
+        :param max_mapped_bytes: maximum number of bytes of the memory-mapped tensors kept open
+        """
+        self.directory = directory
+        self.objects_directory = os.path.join(directory, "objects")
+        self.manifests_directory = os.path.join(directory, "manifests")
+        os.makedirs(self.objects_directory, exist_ok=True)
+        os.makedirs(self.manifests_directory, exist_ok=True)
+
+        # hash of the layer -> memory-mapped tensor, from the least to the most recently used
+        self.objects = OrderedDict()
+        self.mapped_bytes = 0
+        self.max_mapped_bytes = max_mapped_bytes
+        self.lock = threading.Lock()
+
+    def object_path(self, layer_hash):
+        return os.path.join(self.objects_directory, layer_hash[:2], layer_hash + ".npy")
+
+    def put(self, weights_dict):
+        """
+        Function to save a model, only the layers not already in the store are written
+        :param weights_dict: dictionary name -> tensor of the model
+        :return: the storage reference of the model (path of its manifest) and the hashes of its layers
+        (without the batch normalization layers, as in the blocks)
+        """
+        weights_dict = {name: np.asarray(array) for name, array in weights_dict.items()}
+        manifest = model_tree(weights_dict)
+
+        for name, layer_hash in manifest.items():
+            path = self.object_path(layer_hash)
+            if not os.path.exists(path):
+                write_atomic(path, lambda f: np.save(f, weights_dict[name], allow_pickle=False))
+
+        reference = os.path.join(self.manifests_directory, tree_root(manifest) + MANIFEST_SUFFIX)
+        if not os.path.exists(reference):
+            write_atomic(reference, lambda f: f.write(json.dumps({"layers": manifest}).encode()))
+
+        return reference, {name: layer_hash for name, layer_hash in manifest.items() if 'bn' not in name}
+
+    def manifest(self, reference):
+        """
+        :return: dictionary name -> hash of the layer of the model
+        """
+        with open(reference, "rb") as f:
+            return json.load(f)["layers"]
+
+    def load(self, reference):
+        """
+        Function to load a model from its manifest
+        :param reference: storage reference of the model (path of its manifest)
+        :return: dictionary name -> tensor, the tensors are read-only and memory-mapped
+        """
+        return {name: self.load_object(layer_hash) for name, layer_hash in self.manifest(reference).items()}
+
+    def load_object(self, layer_hash):
+        with self.lock:
+            array = self.objects.get(layer_hash)
+            if array is not None:
+                self.objects.move_to_end(layer_hash)
+                return array
+
+        array = np.load(self.object_path(layer_hash), mmap_mode="r")
+        with self.lock:
+            if layer_hash in self.objects:
+                # Mapped by another thread in the meantime
+                self.objects.move_to_end(layer_hash)
+                return self.objects[layer_hash]
+
+            self.objects[layer_hash] = array
+            self.mapped_bytes += array.nbytes
+            while self.mapped_bytes > self.max_mapped_bytes and len(self.objects) > 1:
+                _, evicted = self.objects.popitem(last=False)
+                self.mapped_bytes -= evicted.nbytes
+
+        return array
+
+    def disk_usage(self):
+        """
+        :return: the number of bytes of the objects and of the manifests of the store
+        """
+        return directory_size(self.directory)
+
+
+def write_atomic(path, write):
+    # The file is written in a temporary file then renamed, so a file of the store is always complete
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as f:
+        write(f)
+    os.replace(temp_path, path)
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(directory) for name in names)
+
+
+def get_store(directory):
+    """
+    :return: the ModelStore of the directory, the same one for all the nodes of the process
+    """
+    directory = os.path.normpath(directory)
+    with stores_lock:
+        if directory not in stores:
+            stores[directory] = ModelStore(directory)
+        return stores[directory]
+
+
+def is_manifest(reference):
+    return reference.endswith(MANIFEST_SUFFIX)
+
+
+def load_weights(reference):
+    """
+    Function to load a model from its storage reference (a manifest of a ModelStore, a .ckpt or a .npz file)
+    :return: the dictionary (or NpzFile) name -> tensor
+    """
+    if is_manifest(reference):
+        return get_store(os.path.dirname(os.path.dirname(reference))).load(reference)
+
+    if reference.endswith(CHECKPOINT_SUFFIX):
+        return load_checkpoint(reference)
+
+    return np.load(reference)
+
+
+# %% ///////////////////////////////////////////// Checkpoint ///////////////////////////////////////////////////////////
+# A model in a single uncompressed file that is memory-mapped, so the layers are read from the disk only when they are
+# used, and the pages are shared by all the threads and processes loading the same file:
+# | magic (8 B) | header length (8 B) | header | tensors |
+# The header is the json list of [name, dtype, shape, offset] of the tensors, each tensor starts at an offset
+# (from the start of the file) multiple of ALIGNMENT bytes.
+CHECKPOINT_SUFFIX = ".ckpt"
+CHECKPOINT_MAGIC = b"BFLCKPT1"
+CHECKPOINT_PREFIX = struct.Struct("!8sQ")
+ALIGNMENT = 64
+
+
+def save_checkpoint(filename, weights_dict):
+    """
+    Function to save a model in the checkpoint format
+    :param filename: path of the .ckpt file
+    :param weights_dict: dictionary (or NpzFile) name -> tensor
+    """
+    arrays = [(name, np.asarray(weights_dict[name], order="C")) for name in weights_dict.keys()]
+
+    # The offsets depend on the length of the header, which depends on the offsets: the header is given the space of
+    # the largest offsets
+    placeholder = json.dumps([[name, array.dtype.str, list(array.shape), 2 ** 63] for name, array in arrays])
+    offset = align(CHECKPOINT_PREFIX.size + len(placeholder))
+    layers = []
+    for name, array in arrays:
+        layers.append([name, array.dtype.str, list(array.shape), offset])
+        offset = align(offset + array.nbytes)
+
+    header = json.dumps(layers).encode()
+    header += b" " * (len(placeholder) - len(header))
+
+    def write(f):
+        f.write(CHECKPOINT_PREFIX.pack(CHECKPOINT_MAGIC, len(header)))
+        f.write(header)
+        for (_, array), (_, _, _, start) in zip(arrays, layers):
+            f.write(bytes(start - f.tell()))
+            f.write(memoryview(array).cast('B') if array.ndim else array.tobytes())
+
+    write_atomic(filename, write)
+
+
+def load_checkpoint(filename):
+    """
+    Function to open a model saved in the checkpoint format
+    :param filename: path of the .ckpt file
+    :return: dictionary name -> tensor, the tensors are read-only views of the memory-mapped file (no copy)
+    """
+    with open(filename, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, header_length = CHECKPOINT_PREFIX.unpack_from(data, 0)
+    if magic != CHECKPOINT_MAGIC:
+        raise ValueError(f"{filename} is not a checkpoint")
+    layers = json.loads(data[CHECKPOINT_PREFIX.size:CHECKPOINT_PREFIX.size + header_length])
+
+    # The arrays keep the mapping open, it is closed when they are all deleted
+    return {name: np.frombuffer(data, dtype=dtype, count=math.prod(shape), offset=offset).reshape(shape)
+            for name, dtype, shape, offset in layers}
+
+
+def convert_npz(filename, output=None):
+    """
+    Function to convert a model saved in a .npz file into the checkpoint format
+    :param filename: path of the .npz file
+    :param output: path of the .ckpt file (by default the same name with the .ckpt extension)
+    :return: the path of the .ckpt file
+    """
+    output = output or os.path.splitext(filename)[0] + CHECKPOINT_SUFFIX
+    with np.load(filename) as loaded_weights_dict:
+        save_checkpoint(output, loaded_weights_dict)
+
+    return output
+
+
+def align(offset):
+    return offset + (-offset % ALIGNMENT)
+
+
+# %% ///////////////////////////////////////// Cache of the decoded models ///////////////////////////////////////////
+# The same model is loaded several times per round by each node (evaluation of the updates and of the global model,
+# aggregation, hash, broadcast), the decoded models are kept in a cache shared by all the nodes of the process.
+# The storage references are unique (a new file, or a manifest named by its hash, for each model), so an entry is
+# never out of date. The tensors of the cache are read-only since they are shared.
+MODEL_CACHE_BYTES = 2 ** 30
+
+
+class CachedModel:
+    def __init__(self, reference, weights_dict=None, layer_hashes=None, copy=True):
+        """
+        :param reference: storage reference of the model
+        :param weights_dict: the tensors of the model if they are already in memory, else the model is loaded from its
+        reference
+        :param layer_hashes: hashes of the layers of the model if they are already known
+        :param copy: False if the tensors of weights_dict are owned by the cache (they are made read-only), True to
+        copy them
+        """
+        if weights_dict is None:
+            loaded_weights_dict = load_weights(reference)
+            weights_dict = {name: loaded_weights_dict[name] for name in loaded_weights_dict.keys()}
+        else:
+            weights_dict = {name: np.array(val) if copy else np.asarray(val) for name, val in weights_dict.items()}
+
+        for val in weights_dict.values():
+            if isinstance(val, np.ndarray):
+                val.flags.writeable = False
+
+        self.reference = reference
+        self.weights_dict = weights_dict
+        # Weights given to the model of the node (without the batch normalization layers and len_dataset)
+        self.weights = [val for name, val in weights_dict.items() if 'bn' not in name and 'len_dataset' not in name]
+        self.len_dataset = weights_dict.get("len_dataset")
+        self.nbytes = sum(np.asarray(val).nbytes for val in weights_dict.values())
+        self.hashes = layer_hashes
+        self.lock = threading.Lock()
+
+    def layer_hashes(self):
+        """
+        :return: the hashes of the layers of the model (as in the blocks), calculated once
+        """
+        with self.lock:
+            if self.hashes is None:
+                self.hashes = model_tree({name: val for name, val in self.weights_dict.items() if 'bn' not in name})
+            return self.hashes
+
+
+class ModelCache:
+    """
+    LRU cache of the decoded models (CachedModel) by storage reference, bounded by the number of bytes of the tensors.
+    """
+    def __init__(self, max_bytes=MODEL_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # storage reference -> CachedModel, from the least to the most recently used
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.loading = {}  # storage reference -> Event set when the model is loaded by another thread
+        self.lock = threading.Lock()
+
+    def get(self, reference):
+        """
+        Function to get a model, it is loaded if it is not in the cache (by a single thread if several threads want
+        the same model)
+        :param reference: storage reference of the model
+        :return: the CachedModel
+        """
+        while True:
+            with self.lock:
+                entry = self.entries.get(reference)
+                if entry is not None:
+                    self.entries.move_to_end(reference)
+                    self.hits += 1
+                    return entry
+
+                loaded = self.loading.get(reference)
+                if loaded is None:
+                    loaded = self.loading[reference] = threading.Event()
+                    self.misses += 1
+                    break
+
+            loaded.wait()
+
+        try:
+            entry = CachedModel(reference)
+            self.put(entry)
+        finally:
+            with self.lock:
+                del self.loading[reference]
+            loaded.set()
+
+        return entry
+
+    def add(self, reference, weights_dict, layer_hashes=None, copy=True):
+        """
+        Function to add a model that was just saved, so it is not read again from its file
+        :param copy: see CachedModel
+        """
+        self.put(CachedModel(reference, weights_dict, layer_hashes, copy))
+
+    def put(self, entry):
+        with self.lock:
+            if entry.nbytes > self.max_bytes:
+                return
+
+            previous = self.entries.pop(entry.reference, None)
+            if previous is not None:
+                self.size -= previous.nbytes
+
+            self.entries[entry.reference] = entry
+            self.size += entry.nbytes
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.nbytes
+
+    def invalidate(self, reference):
+        with self.lock:
+            entry = self.entries.pop(reference, None)
+            if entry is not None:
+                self.size -= entry.nbytes
+
+    def resize(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.nbytes
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "bytes": self.size}
+
+
+model_cache = ModelCache()
+
+
+if __name__ == "__main__":
+    # Conversion of .npz files: python model_store.py models/BFL/*.npz
+    for filename in sys.argv[1:]:
+        print(f"{filename} -> {convert_npz(filename)}")
@@ -1,32 +1,38 @@
-import socket
 import threading
-import json
 import os
-import base64
 from math import floor, ceil
 import random
 import time
 import uuid
+from concurrent.futures import Future
 
 from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives import serialization
 
-import hashlib
 import numpy as np
 from blockchain import Blockchain
+from chain_store import ChainLog
 from flowerclient import FlowerClient
-import pickle
 
 from flwr.server.strategy.aggregate import aggregate
 
 from protocols.pbft_protocol import PBFTProtocol
 from protocols.raft_protocol import RaftProtocol
-from going_modular.security import aggregate_shamir
+from going_modular.security import decrypt_shamir_node, decrypt_field, ShareAccumulator
+from going_modular.compression import encode_delta, apply_delta, cluster_seed, decompress_update, unpack_share
+from transport import ConnectionPool, start_server
+from round_events import round_events
+from model_hash import model_tree, tree_root
+from model_store import CHECKPOINT_SUFFIX, get_store, model_cache, save_checkpoint
+from signatures import SignatureVerifier, generate_private_key, key_type_of, message_digest, private_key_bytes, sign
 
 
 # Other functions to handle the communication between the nodes
-def get_keys(private_key_path, public_key_path):
+def get_keys(private_key_path, public_key_path, key_type="rsa"):
+    """
+    Function to load the keys of an entity, or generate them if they don't exist (or are not of key_type)
+    :param key_type: "rsa" or "ed25519" (see signatures.py)
+    """
     os.makedirs("keys/", exist_ok=True)
     if os.path.exists(private_key_path) and os.path.exists(public_key_path):
         with open(private_key_path, 'rb') as f:
@@ -42,65 +48,83 @@ def get_keys(private_key_path, public_key_path):
                 backend=default_backend()
             )
 
-    else:
-        # Generate new keys
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-            backend=default_backend()
-        )
-        public_key = private_key.public_key()
+        if key_type_of(private_key) == key_type:
+            return private_key, public_key
+
+    # Generate new keys
+    private_key = generate_private_key(key_type)
+    public_key = private_key.public_key()
 
-        # Save keys to files
-        with open(private_key_path, 'wb') as f:
-            f.write(private_key.private_bytes(
+    # Save keys to files
+    with open(private_key_path, 'wb') as f:
+        f.write(private_key_bytes(private_key))
+
+    with open(public_key_path, 'wb') as f:
+        f.write(
+            public_key.public_bytes(
                 encoding=serialization.Encoding.PEM,
-                format=serialization.PrivateFormat.TraditionalOpenSSL,
-                encryption_algorithm=serialization.NoEncryption()
-            ))
-
-        with open(public_key_path, 'wb') as f:
-            f.write(
-                public_key.public_bytes(
-                    encoding=serialization.Encoding.PEM,
-                    format=serialization.PublicFormat.SubjectPublicKeyInfo
-                )
+                format=serialization.PublicFormat.SubjectPublicKeyInfo
             )
+        )
 
     return private_key, public_key
 
 
-def start_server(host, port, handle_message, num_node):
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.bind((host, port))
-    server_socket.listen(5)
-    print(f"Node {num_node} listening on {host}:{port}")
-
-    while True:
-        client_socket, addr = server_socket.accept()
-        threading.Thread(target=handle_message, args=(client_socket,)).start()
-
-
 class Node:
     def __init__(self, id, host, port, consensus_protocol, test, save_results, coef_usefull=1.01, tolerance_ceil=0.1,
-                 ss_type="additif", m=3, **kwargs):
+                 ss_type="additif", m=3, server_mode="thread", broadcast_compression=None, update_compression=None,
+                 shamir_chunk_size=None, chain_storage=None, model_store=None, model_format="npz",
+                 model_cache_bytes=None, precompute_evaluation=False, key_type="rsa", pbft_window=8,
+                 pbft_batch_size=1, pbft_batch_delay=0.5, **kwargs):
         self.id = id
         self.host = host
         self.port = port
+        self.server_mode = server_mode
+        self.listening = False
         self.coef_usefull = coef_usefull
         self.tolerance_ceil = tolerance_ceil
 
         self.peers = {}
         self.clients = {}
+        self.pool = ConnectionPool()
         self.clusters = []
         self.cluster_weights = []
+        self.clusters_lock = threading.Lock()  # the shares of the clients of a cluster are received concurrently
 
         self.global_params_directory = ""
+        # Content-addressed store of the models (see model_store.ModelStore), or None to save each model in a .npz file
+        self.model_store = get_store(model_store) if model_store is not None else None
+        self.model_format = model_format  # "npz" or "ckpt" (memory-mapped checkpoint) for the models saved in files
+        if model_cache_bytes is not None:
+            # The cache of the decoded models is shared by all the nodes of the process
+            model_cache.resize(model_cache_bytes)
+
+        # Delta broadcast of the global model: codec parameters (see going_modular.compression.encode_delta)
+        # or None to always send the full model
+        self.broadcast_compression = broadcast_compression
+        self.model_views = {}  # version of the model known by clients (view_id -> weights)
+        self.client_views = {}  # last version acknowledged by each client (client_id -> view_id)
+        self.views_lock = threading.Lock()
+
+        # Compression of the updates of the clients (see going_modular.compression.compress_update) or None
+        self.update_compression = update_compression
+        self.update_bases = {}  # global model used as the reference of the updates of each cluster (pos -> block hash)
+
+        # Metrics of the models evaluated on the test set of the node (hash of the model -> Future of (loss, acc)),
+        # the global model is evaluated once for all the updates of a round
+        self.evaluations = {}
+        self.evaluations_lock = threading.Lock()
+        self.evaluation_lock = threading.Lock()  # the model of flower_client is shared by the threads
+        # Evaluation of the global model in the background as soon as its block is committed
+        self.precompute_evaluation = precompute_evaluation
 
         self.save_results = save_results
         private_key_path = f"keys/{id}_private_key.pem"
         public_key_path = f"keys/{id}_public_key.pem"
+        self.key_type = key_type
         self.get_keys(private_key_path, public_key_path)
+        # Verification of the signatures of the peers, with the cache of the signatures already verified
+        self.verifier = SignatureVerifier()
 
         x_test, y_test = test
 
@@ -113,85 +137,90 @@ class Node:
         self.ss_type = ss_type
         self.secret_shape = None
         self.m = m
+        self.shamir_chunk_size = shamir_chunk_size  # maximum number of weights reconstructed at once (None: no limit)
+
+        # Durable log of the chain (see chain_store.ChainLog),
+        # e.g. {"directory": "results/BFL/chains", "fsync": "batch"} or None to keep the chain only in memory.
+        # The chain of a node restarted with the same directory is reloaded
+        store = None
+        if chain_storage is not None:
+            store = ChainLog(os.path.join(chain_storage["directory"], id),
+                             **{key: value for key, value in chain_storage.items() if key != "directory"})
+
+        self.blockchain = Blockchain(store)
+        if self.blockchain.last_global_block is not None:
+            # Restarted node: the updates are evaluated against the last global model of the reloaded chain
+            self.global_params_directory = self.blockchain.last_global_block.storage_reference
 
-        self.blockchain = Blockchain()
         if consensus_protocol == "pbft":
-            self.consensus_protocol = PBFTProtocol(node=self, blockchain=self.blockchain)
+            # pbft_window: number of blocks in consensus at the same time,
+            # pbft_batch_size and pbft_batch_delay: updates of the clusters proposed together in one block
+            self.consensus_protocol = PBFTProtocol(node=self, blockchain=self.blockchain, window=pbft_window,
+                                                   batch_size=pbft_batch_size, batch_delay=pbft_batch_delay)
 
         elif consensus_protocol == "raft":
             self.consensus_protocol = RaftProtocol(node=self, blockchain=self.blockchain)
             threading.Thread(target=self.consensus_protocol.run).start()
 
     def start_server(self):
-        start_server(self.host, self.port, self.handle_message, self.id)
-
-    def handle_message(self, client_socket):
-        # First, read the length of the data
-        data_length_bytes = client_socket.recv(4)
-        if not data_length_bytes:
-            return  # No data received, possibly handle this case as an error or log it
-        data_length = int.from_bytes(data_length_bytes, byteorder='big')
-
-        # Now read exactly data_length bytes
-        data = b''
-        while len(data) < data_length:
-            packet = client_socket.recv(data_length - len(data))
-            if not packet:
-                break  # Connection closed, handle this case if necessary
-            data += packet
-
-        if len(data) < data_length:
-            # Log this situation as an error or handle it appropriately
-            print("Data was truncated or connection was closed prematurely.")
-            return
+        start_server(self.host, self.port, self.handle_message, self.id, mode=self.server_mode,
+                     on_listen=self.on_listen)
+
+    def on_listen(self):
+        self.listening = True
+        round_events.notify()
 
-        message = pickle.loads(data)
+    def handle_message(self, message):
         message_type = message.get("type")
 
         if message_type == "frag_weights":
             message_id = message.get("id")
-            weights = pickle.loads(message.get("value"))
+            weights = unpack_share(message.get("value"))
             self.secret_shape = message.get("list_shapes")
 
-            for pos, cluster in enumerate(self.clusters):
-                if message_id in cluster:
-                    if cluster[message_id] == 0:
-                        self.cluster_weights[pos].append(weights)
+            requests = []
+            # The model of flower_client is also used by the evaluations of the consensus
+            with self.clusters_lock, self.evaluation_lock:
+                for pos, cluster in enumerate(self.clusters):
+                    if message_id in cluster:
+                        if cluster[message_id] == 0:
+                            self.cluster_weights[pos].add(weights)
+                            self.update_bases[pos] = message.get("base_id")
 
-                        cluster[message_id] = 1
-                        cluster["count"] += 1
+                            cluster[message_id] = 1
+                            cluster["count"] += 1
 
-                    if cluster["count"] == cluster["tot"]:
-                        aggregated_weights = self.aggregation_cluster(pos)
+                        if cluster["count"] == cluster["tot"]:
+                            aggregated_weights = self.aggregation_cluster(pos)
 
-                        participants = [k for k in cluster.keys() if k not in ["count", "tot"]]
+                            participants = [k for k in cluster.keys() if k not in ["count", "tot"]]
 
-                        message = self.create_update_request(aggregated_weights, participants)
+                            requests.append(self.create_update_request(aggregated_weights, participants))
 
-                        self.consensus_protocol.handle_message(message)
+            # The consensus is started outside of the lock, the shares of the other clusters are not delayed
+            for request in requests:
+                self.consensus_protocol.handle_message(request)
 
-        else:
-            result = self.consensus_protocol.handle_message(message)
+        elif message_type == "global_model_ack":
+            self.acknowledge_global_model(message.get("id"), message.get("view_id"))
 
-            if result == "added":
-                
-                block = self.blockchain.blocks[-1]
-                model_type = block.model_type
+        else:
+            self.consensus_protocol.handle_message(message)
 
-                if model_type == "update":
-                    nb_updates = 0
-                    for block in self.blockchain.blocks[::-1]:
-                        if block.model_type == "update":
-                            nb_updates += 1
-                        else:
-                            break
+    def on_block_added(self, block):
+        # Called by the consensus protocol for each block added to the chain, in the order of the chain and outside of
+        # the lock of the consensus
+        model_type = block.model_type
 
-                elif model_type == "global_model" or model_type == "first_global_model":
+        if model_type == "global_model" or model_type == "first_global_model":
 
-                    print(f"updating GM {self.global_params_directory}")
-                    self.broadcast_model_to_clients()
+            print(f"updating GM {block.storage_reference}")
+            self.reset_evaluations()
+            if self.precompute_evaluation:
+                threading.Thread(target=self.model_metrics, args=(block.storage_reference, "global model"),
+                                 daemon=True).start()
 
-        client_socket.close()
+            self.broadcast_model_to_clients()
 
     def is_update_usefull(self, model_directory, participants): 
 
@@ -208,138 +237,243 @@ class Node:
 
     def get_weights(self, len_dataset=10):
         params_list = []
-        cnt = 0
-        for block in self.blockchain.blocks[::-1]:
-            if block.model_type == "update":
-                loaded_weights_dict = np.load(block.storage_reference)
-                loaded_weights = [val for name, val in loaded_weights_dict.items() if 'bn' not in name and 'len_dataset' not in name]
-
-                loaded_weights = (loaded_weights, loaded_weights_dict[f'len_dataset'])
-                params_list.append(loaded_weights)
-                cnt += 1
-            else:
-                break
+        for block in reversed(self.blockchain.updates_since_global):
+            model = self.load_model(block.storage_reference)
+            params_list.append((model.weights, model.len_dataset))
 
         if len(params_list) == 0:
             return None
 
         self.aggregated_params = aggregate(params_list)
 
-        self.flower_client.set_parameters(self.aggregated_params)
+        # The model of flower_client is also used by the evaluations (of the consensus and in the background)
+        with self.evaluation_lock:
+            self.flower_client.set_parameters(self.aggregated_params)
+            return self.get_model_params(len_dataset)
 
-        weights_dict = self.flower_client.get_dict_params({})
+    def get_model_params(self, len_dataset):
+        # The arrays of get_dict_params are views of the parameters of the model of the node, written in place by the
+        # next set_parameters: they are copied before being hashed or stored
+        weights_dict = {name: np.array(val) for name, val in self.flower_client.get_dict_params({}).items()}
         weights_dict['len_dataset'] = len_dataset
         return weights_dict
 
-    def is_global_valid(self, proposed_hash):
+    def is_global_valid(self, proposed_hash, proposed_layer_hashes=None):
         weights_dict = self.get_weights()
 
-        filename = f"models/BFL/{self.id}temp.npz"
-
-        with open(filename, "wb") as f:
-            np.savez(f, **weights_dict)
-
-        if proposed_hash == self.calculate_model_hash(filename): 
+        # The model is hashed in memory, without writing it in a file
+        layer_hashes = model_tree({name: val for name, val in weights_dict.items() if 'bn' not in name})
+        if proposed_hash == tree_root(layer_hashes): 
             return True
 
         else:
+            if proposed_layer_hashes is not None:
+                print(f"node: {self.id} global model rejected, layers different: "
+                      f"{[name for name in layer_hashes if layer_hashes[name] != proposed_layer_hashes.get(name)]}")
             return False
 
     def evaluate_model(self, model_directory, participants, write=True):
-        loaded_weights_dict = np.load(model_directory)
-        loaded_weights = [val for name, val in loaded_weights_dict.items() if 'bn' not in name and 'len_dataset' not in name]
-        test_metrics = self.flower_client.evaluate(loaded_weights, {'name': f'Node {self.id}_Clusters {participants}'})
-        print(f"In evaluate Model (node: {self.id}) \tTest Loss: {test_metrics['test_loss']:.4f}, "
-              f"\tAccuracy: {test_metrics['test_acc']:.2f}%")
+        test_loss, test_acc = self.model_metrics(model_directory, participants)
+        print(f"In evaluate Model (node: {self.id}) \tTest Loss: {test_loss:.4f}, "
+              f"\tAccuracy: {test_acc:.2f}%")
         if write: 
             with open(self.save_results + 'output.txt', 'a') as f:
                 f.write(f"node: {self.id} "
                         f"model: {model_directory} "
                         f"cluster: {participants} "
-                        f"loss: {test_metrics['test_loss']} "
-                        f"acc: {test_metrics['test_acc']} \n")
-
-        return test_metrics['test_loss'], test_metrics['test_acc']
-
-    def broadcast_model_to_clients(self):
-        for block in self.blockchain.blocks[::-1]: 
-            if block.model_type == "global_model" or block.model_type == "first_global_model":
-                block_model = block 
-                break 
-
-        loaded_weights_dict = np.load(block_model.storage_reference)
-        loaded_weights = [val for name, val in loaded_weights_dict.items() if 'bn' not in name and 'len_dataset' not in name]
-
-        for k, v in self.clients.items():
-            address = v.get('address')
-
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_socket.connect(('127.0.0.1', address[1]))
-
-            serialized_data = pickle.dumps(loaded_weights)
-            message = {"type": "global_model", "value": serialized_data}
-
-            serialized_message = pickle.dumps(message)
-
-            # Send the length of the message first
-            client_socket.send(len(serialized_message).to_bytes(4, byteorder='big'))
-            client_socket.send(serialized_message)
+                        f"loss: {test_loss} "
+                        f"acc: {test_acc} \n")
+
+        return test_loss, test_acc
+
+    def model_metrics(self, model_directory, participants):
+        """
+        Function to evaluate a model on the test set of the node, the metrics are kept by hash of the model
+        so a model is evaluated once (the other threads wanting the same model wait for its evaluation)
+        :return: the test loss and accuracy
+        """
+        model_hash = self.calculate_model_hash(model_directory)
+        with self.evaluations_lock:
+            evaluation = self.evaluations.get(model_hash)
+            to_evaluate = evaluation is None
+            if to_evaluate:
+                evaluation = self.evaluations[model_hash] = Future()
+
+        if to_evaluate:
+            try:
+                loaded_weights = self.load_model(model_directory).weights
+                with self.evaluation_lock:
+                    test_metrics = self.flower_client.evaluate(loaded_weights,
+                                                               {'name': f'Node {self.id}_Clusters {participants}'})
+                evaluation.set_result((test_metrics['test_loss'], test_metrics['test_acc']))
 
-            # Close the socket after sending
-            client_socket.close()
+            except Exception as e:
+                with self.evaluations_lock:
+                    self.evaluations.pop(model_hash, None)
+                evaluation.set_exception(e)
+
+        return evaluation.result()
+
+    def reset_evaluations(self):
+        # New global model: the metrics of the previous round are not used anymore
+        with self.evaluations_lock:
+            self.evaluations = {}
+
+    def broadcast_model_to_clients(self, client_ids=None):
+        block_model = self.blockchain.last_global_block
+
+        loaded_weights = self.load_model(block_model.storage_reference).weights
+
+        if client_ids is None:
+            client_ids = list(self.clients.keys())
+
+        start = time.time()
+        with self.views_lock:
+            # The clients are grouped by the version of the model they acknowledged,
+            # so the message of a group is computed and serialized once
+            groups = {}
+            for client_id in client_ids:
+                base_id = self.client_views.get(client_id) if self.broadcast_compression else None
+                groups.setdefault(base_id, []).append(client_id)
+
+            lossless = (self.broadcast_compression is None
+                        or (self.broadcast_compression.get("ratio") is None
+                            and self.broadcast_compression.get("quantization") is None))
+            bytes_sent = 0
+            for base_id, group in groups.items():
+                if base_id is None:
+                    # Unknown base: full transfer
+                    view_id = block_model.current_hash
+                    view = loaded_weights
+                    # The weights are sent as raw buffers by the transport (see transport.encode_message)
+                    message = {"type": "global_model", "value": loaded_weights, "view_id": view_id}
+                else:
+                    # With a lossy codec the clients get an approximation of the model, we keep it as their base
+                    # so the error of this round is sent in the next delta
+                    view_id = block_model.current_hash
+                    if not lossless:
+                        view_id += f"_{uuid.uuid4().hex[:8]}"
+                    delta = encode_delta(loaded_weights, self.model_views[base_id], **self.broadcast_compression)
+                    view = loaded_weights if lossless else apply_delta(self.model_views[base_id], delta)
+                    message = {"type": "global_model", "delta": delta, "base_id": base_id, "view_id": view_id}
+
+                self.model_views[view_id] = view
+                addresses = [('127.0.0.1', self.clients[client_id].get('address')[1]) for client_id in group]
+                bytes_sent += self.pool.broadcast(addresses, message) * len(addresses)
+
+            # Forget the versions no client can use as a base anymore
+            used_views = set(self.client_views.values()) | {block_model.current_hash}
+            self.model_views = {k: v for k, v in self.model_views.items()
+                                if k in used_views or k.startswith(block_model.current_hash)}
+
+        self.pool.flush([('127.0.0.1', self.clients[client_id].get('address')[1]) for client_id in client_ids])
+        with open(self.save_results + 'output.txt', 'a') as f:
+            f.write(f"broadcast node: {self.id} "
+                    f"block: {block_model.index} "
+                    f"clients: {len(client_ids)} "
+                    f"bytes: {bytes_sent} "
+                    f"time: {time.time() - start} \n")
+
+    def acknowledge_global_model(self, client_id, view_id):
+        """
+        A client acknowledges the version of the global model it uses, it will be the base of the next delta.
+        A client that could not rebuild the model (view_id None or unknown) gets the full model.
+        """
+        with self.views_lock:
+            if view_id is not None and view_id in self.model_views:
+                self.client_views[client_id] = view_id
+                return
+
+            self.client_views.pop(client_id, None)
+
+        self.broadcast_model_to_clients([client_id])
 
     def broadcast_message(self, message):
+        # The message is signed once for all the peers
+        signed_message = self.signed_message(message)
         for peer_id in self.peers:
-            self.send_message(peer_id, message)
+            self.send_signed_message(peer_id, signed_message)
 
     def send_message(self, peer_id, message):
-        if peer_id in self.peers:
-            peer_info = self.peers[peer_id]
-            peer_address = peer_info["address"]
+        self.send_signed_message(peer_id, self.signed_message(message))
 
-            signed_message = message.copy()
-            signed_message["signature"] = self.sign_message(signed_message)
-            signed_message["id"] = self.id
-
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-                    client_socket.connect(peer_address)
+    def signed_message(self, message):
+        signed_message = message.copy()
+        signed_message["signature"] = self.sign_message(signed_message)
+        signed_message["id"] = self.id
+        return signed_message
 
-                    serialized_message = pickle.dumps(signed_message)
-
-                    # Send the length of the message first
-                    client_socket.send(len(serialized_message).to_bytes(4, byteorder='big'))
-                    client_socket.send(serialized_message)
-
-            except ConnectionRefusedError:
-                pass
+    def send_signed_message(self, peer_id, signed_message):
+        if peer_id in self.peers:
+            peer_address = self.peers[peer_id]["address"]
 
-            except Exception as e:
-                pass
+            # The message is queued on the long-lived connection to the peer (an unreachable peer is skipped)
+            self.pool.send(peer_address, signed_message)
         else:
             print(f"Peer {peer_id} not found.")
 
     def calculate_model_hash(self, filename): 
-        loaded_weights_dict = np.load(filename)
-        loaded_weights = [val for name, val in loaded_weights_dict.items() if 'bn' not in name and 'len_dataset' not in name]
-        loaded_weights = (loaded_weights, loaded_weights_dict[f'len_dataset'])
-
-        hash_model = hashlib.sha256()
-        hash_model.update(str(loaded_weights).encode('utf-8'))
-        hash_model = hash_model.hexdigest()
+        # Root of the Merkle tree of the model (see model_hash.py), the same as in Blockchain.is_valid_block
+        return tree_root(self.calculate_layer_hashes(filename))
+
+    def calculate_layer_hashes(self, filename):
+        # The hashes of a model are calculated once by the process (see model_store.CachedModel)
+        return self.load_model(filename).layer_hashes()
+
+    def load_model(self, storage_reference):
+        # A manifest of the model store, a checkpoint or a .npz file, read and hashed once by the process
+        # (see model_store.ModelCache)
+        return model_cache.get(storage_reference)
+
+    def save_model(self, weights_dict, filename):
+        """
+        Function to save a model in the model store, or in filename if the node has no store
+        :param weights_dict: the tensors of the model (see get_model_params), kept read-only by the cache of the models
+        so they must not be views of the parameters of the model of the node
+        :return: the storage reference of the model and the hashes of its layers
+        """
+        layer_hashes = None
+        if self.model_store is not None:
+            filename, layer_hashes = self.model_store.put(weights_dict)
 
-        return hash_model
+        else:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            if self.model_format == "ckpt":
+                filename = os.path.splitext(filename)[0] + CHECKPOINT_SUFFIX
+                save_checkpoint(filename, weights_dict)
+            else:
+                with open(filename, "wb") as f:
+                    np.savez(f, **weights_dict)
+
+        # The model is kept in the cache, so it is not read again from its file
+        model_cache.add(filename, weights_dict, layer_hashes, copy=False)
+
+        return filename, self.calculate_layer_hashes(filename)
+
+    def verify_model_layers(self, block, filename=None):
+        """
+        Function to verify the layers of a model against the hashes stored in its block
+        :param block: the block of the model
+        :param filename: the file to verify (by default the storage reference of the block)
+        :return: the list of the names of the layers that don't match (empty if the model is the one of the block)
+        """
+        if block.layer_hashes is None:
+            # Block without the hashes of the layers: only the whole model can be verified
+            layer_hashes = self.calculate_layer_hashes(filename or block.storage_reference)
+            return [] if tree_root(layer_hashes) == block.calculated_hash else list(layer_hashes)
+
+        layer_hashes = self.calculate_layer_hashes(filename or block.storage_reference)
+        altered = [name for name in layer_hashes if layer_hashes[name] != block.layer_hashes.get(name)]
+
+        return altered + [name for name in block.layer_hashes if name not in layer_hashes]
    
     def create_first_global_model_request(self):
-        weights_dict = self.flower_client.get_dict_params({})
-        weights_dict['len_dataset'] = 0
+        with self.evaluation_lock:
+            weights_dict = self.get_model_params(0)
         model_type = "first_global_model"
         
         unique_id = f"{int(time.time())}_{uuid.uuid4().hex[:8]}"
-        filename = f"models/BFL/m0_{unique_id}.npz"
-        os.makedirs("models/BFL/", exist_ok=True)
-        with open(filename, "wb") as f:
-            np.savez(f, **weights_dict)
+        filename, layer_hashes = self.save_model(weights_dict, f"models/BFL/m0_{unique_id}.npz")
 
         message = {
             "id": self.id,
@@ -347,14 +481,13 @@ class Node:
             "content": {
                 "storage_reference": filename,
                 "model_type": model_type,
-                "calculated_hash": self.calculate_model_hash(filename),
+                "calculated_hash": tree_root(layer_hashes),
+                "layer_hashes": layer_hashes,
                 "participants": ["1", "2"]
             }
         }
 
-        time.sleep(10)
-
-        self.consensus_protocol.handle_message(message)
+        return self.consensus_protocol.handle_message(message)
 
     def create_global_model(self): 
         weights_dict = self.get_weights()
@@ -367,38 +500,33 @@ class Node:
 
         unique_id = f"{int(time.time())}_{uuid.uuid4().hex[:8]}"
         filename = f"models/BFL/m{self.blockchain.len_chain}_{unique_id}.npz"
+        filename, layer_hashes = self.save_model(weights_dict, filename)
         # self.global_params_directory = filename
 
-        with open(filename, "wb") as f:
-            np.savez(f, **weights_dict)
-
         message = {
             "id": self.id,
             "type": "request", 
             "content": {
                 "storage_reference": filename,
                 "model_type": model_type,
-                "calculated_hash": self.calculate_model_hash(filename), 
+                "calculated_hash": tree_root(layer_hashes),
+                "layer_hashes": layer_hashes,
                 "participants": ["1", "2"]
             }
         }
 
-        self.consensus_protocol.handle_message(message)
+        return self.consensus_protocol.handle_message(message)
 
     def create_update_request(self, weights, participants):
 
         self.flower_client.set_parameters(weights)
 
-        weights_dict = self.flower_client.get_dict_params({})
-        weights_dict['len_dataset'] = 10
+        weights_dict = self.get_model_params(10)
         model_type = "update"
 
         unique_id = f"{int(time.time())}_{uuid.uuid4().hex[:8]}"
         filename = f"models/BFL/m{self.blockchain.len_chain}_{unique_id}.npz"
-
-
-        with open(filename, "wb") as f:
-            np.savez(f, **weights_dict)
+        filename, layer_hashes = self.save_model(weights_dict, filename)
 
         message = {
             "id": self.id,
@@ -406,7 +534,8 @@ class Node:
             "content": {
                 "storage_reference": filename,
                 "model_type": model_type,
-                "calculated_hash": self.calculate_model_hash(filename),
+                "calculated_hash": tree_root(layer_hashes),
+                "layer_hashes": layer_hashes,
                 "participants": participants
             }
         }
@@ -414,14 +543,26 @@ class Node:
         return message
 
     def aggregation_cluster(self, pos):
-        if self.ss_type == "additif":
-            aggregated_weights = aggregate(
-                [(self.cluster_weights[pos][i], 10) for i in range(len(self.cluster_weights[pos]))]
-            )
+        # The shares of the clients were summed as they were received
+        accumulator = self.cluster_weights[pos]
+        if self.ss_type in ["additif", "additif_seed"]:
+            # mean of the secrets (same weight for each client)
+            aggregated_weights = [layer / accumulator.count for layer in accumulator.result()]
+
+        elif self.ss_type in ["additif_field", "shamir_field"]:
+            # exact reconstruction in the prime field (self.secret_shape is the information to decode the secret)
+            aggregated_weights = decrypt_field(accumulator.result(), self.secret_shape, self.ss_type, self.m,
+                                               accumulator.count)
 
         else:
             # shamir secret sharing
-            aggregated_weights = aggregate_shamir(self.cluster_weights[pos], self.secret_shape, self.m)
+            aggregated_weights = decrypt_shamir_node(accumulator.result(), self.secret_shape, self.m,
+                                                     self.shamir_chunk_size)
+
+        base_id = self.update_bases.pop(pos, None)
+        if base_id is not None:
+            # The clients shared their compressed updates, so we get the mean of the updates
+            aggregated_weights = self.decompress_cluster_update(pos, base_id, aggregated_weights)
 
         self.flower_client.set_parameters(aggregated_weights)
 
@@ -436,46 +577,52 @@ class Node:
                     f"loss: {test_metrics['test_loss']} "
                     f"acc: {test_metrics['test_acc']} \n")
 
-        self.cluster_weights[pos] = []
+        self.cluster_weights[pos].reset()
         for k, v in self.clusters[pos].items():
             if k != "tot":
                 self.clusters[pos][k] = 0
 
         return aggregated_weights
 
+    def decompress_cluster_update(self, pos, base_id, aggregated_values):
+        """
+        Function to rebuild the model of a cluster from the mean of the compressed updates of its clients
+        :param pos: position of the cluster
+        :param base_id: hash of the block of the global model used as the reference of the updates
+        :param aggregated_values: mean of the fixed-point vectors of the clients
+        :return: the list of tensors of the model of the cluster
+        """
+        block_model = self.blockchain.get_block_by_hash(base_id)
+        if block_model is None:
+            raise ValueError(f"Global model {base_id} not found in the blockchain")
+
+        loaded_weights = self.load_model(block_model.storage_reference).weights
+
+        participants = [k for k in self.clusters[pos].keys() if k not in ["count", "tot"]]
+        seed = cluster_seed(participants, base_id)
+
+        return decompress_update(aggregated_values, loaded_weights, seed, self.update_compression.get("ratio"),
+                                 self.update_compression.get("frac_bits", 16))
+
     def get_keys(self, private_key_path, public_key_path):
-        self.private_key, self.public_key = get_keys(private_key_path, public_key_path)
+        self.private_key, self.public_key = get_keys(private_key_path, public_key_path, self.key_type)
 
     def sign_message(self, message):
-        signature = self.private_key.sign(
-            json.dumps(message).encode(),
-            padding.PSS(
-                mgf=padding.MGF1(hashes.SHA256()),
-                salt_length=padding.PSS.MAX_LENGTH
-            ),
-            hashes.SHA256()
-        )
-        return base64.b64encode(signature).decode()
+        # Signature of the digest of the message (see signatures.message_digest)
+        return sign(self.private_key, message_digest(message, self.id))
 
-    def verify_signature(self, signature, message, public_key):
+    def verify_signature(self, signature, message, public_key, sender):
         try:
-            signature_binary = base64.b64decode(signature)
-
-            public_key.verify(
-                signature_binary,
-                json.dumps(message).encode(),
-                padding.PSS(
-                    mgf=padding.MGF1(hashes.SHA256()),
-                    salt_length=padding.PSS.MAX_LENGTH
-                ),
-                hashes.SHA256()
-            )
+            digest = message_digest(message, sender)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Signature verification error: malformed {message.get('type')}: {e}")
+            return False
 
+        if self.verifier.verify(public_key, signature, digest):
             return True
 
-        except Exception as e:
-            print(f"Signature verification error: {e}")
-            return False
+        print(f"Signature verification error: invalid signature of {message.get('type')} from {sender}")
+        return False
 
     def add_peer(self, peer_id, peer_address):
         with open(f"keys/{peer_id}_public_key.pem", 'rb') as f:
@@ -521,4 +668,4 @@ class Node:
         self.clusters[-1]["tot"] = len(self.clusters[-1])
         self.clusters[-1]["count"] = 0
 
-        self.cluster_weights.append([])
+        self.cluster_weights.append(ShareAccumulator(self.ss_type))
@@ -1,172 +1,518 @@
 import logging
-import time
+import threading
+from collections import deque
 
 from block import Block
+from model_hash import verify_tree
 from protocols.consensus_protocol import ConsensusProtocol
+from round_events import round_events
+
+
+# The primary of the view gives a sequence number to each request and proposes it (pre-prepare) as a block whose
+# index is the sequence number. The requests of the other nodes are sent to the primary.
+# Several sequence numbers are in flight at the same time: the primary proposes the sequence numbers up to the
+# high watermark (last executed + window) and the nodes accept the messages between the watermarks. The messages of
+# the next window (a node behind the others) are kept until the window moves, the messages further are dropped.
+# A proposal is prepared with a quorum of prepares (the pre-prepare counts as the prepare of the primary), then each
+# node votes its usefulness in its commit. With a quorum of useful commits the proposal is committed, and it is
+# rejected once a quorum of useful commits is not possible anymore.
+# The decided proposals are executed in the order of the sequence numbers: a committed proposal is added to the chain
+# as a block whose index and previous hash are the ones of the chain, so all the nodes build the same chain.
+# The view doesn't change (no view change if the primary fails).
+# The primary gathers the updates received within batch_delay seconds (up to batch_size) in one proposal: its fields
+# are the lists (tuples in the Block) of the fields of the updates (and its layer_hashes the layer hashes of each
+# storage reference), the nodes vote the usefulness of each update in the same commit and each update is committed or
+# rejected on its own.
+BATCH_TYPE = "update_batch"
+
+
+def quorum_size(n_nodes):
+    """
+    Function to compute the size of the quorums of PBFT
+    :param n_nodes: number of nodes
+    :return: 2f+1 with n = 3f+1 nodes, (n+f)//2+1 in general so two quorums have a correct node in common
+    """
+    f = (n_nodes - 1) // 3
+    return (n_nodes + f) // 2 + 1
+
+
+def request_count(proposal):
+    return len(proposal.storage_reference) if proposal.model_type == BATCH_TYPE else 1
+
+
+def batch_requests(proposal):
+    """
+    Function to get the requests of a proposal
+    :param proposal: Block proposed by the primary
+    :return: list of the requests as Blocks (the proposal itself if it is not a batch)
+    """
+    if proposal.model_type != BATCH_TYPE:
+        return [proposal]
+
+    if (not isinstance(proposal.storage_reference, tuple) or not isinstance(proposal.calculated_hash, tuple)
+            or not len(proposal.storage_reference) == len(proposal.calculated_hash) == len(proposal.participants)):
+        raise ValueError(f"Batch {proposal.current_hash}: fields are not lists of the same length")
+
+    layer_hashes = proposal.layer_hashes or {}
+    return [Block(proposal.index, "update", storage_reference, calculated_hash, participants, "",
+                  layer_hashes.get(storage_reference))
+            for storage_reference, calculated_hash, participants in zip(proposal.storage_reference,
+                                                                        proposal.calculated_hash,
+                                                                        proposal.participants)]
 
 
 class PBFTProtocol(ConsensusProtocol):
-    def __init__(self, node, blockchain):
+    def __init__(self, node, blockchain, window=8, batch_size=1, batch_delay=0.5):
+        """
+        :param window: number of sequence numbers in flight (between the low and the high watermarks)
+        :param batch_size: maximum number of updates in a proposal (1: no batch)
+        :param batch_delay: maximum time (seconds) an update waits for the other updates of its batch
+        """
         self.node = node
         self.node_id = self.node.id
 
-        self.prepare_counts = {}
-        self.commit_counts = {}
         self.model_usefullness = {}
+        self.blocks = {}  # hash -> Block of the messages, their content is checked once per block
+        self.decided = set()  # storage references of the requests executed (added to the chain or rejected)
 
         self.blockchain = blockchain
 
+        self.view = 0
+        self.window = window
+        self.low = blockchain.len_chain - 1  # last sequence number executed (low watermark)
+        self.next_sequence = self.low + 1  # next sequence number given by the primary
+        self.log = {}  # sequence number -> state of the proposal (see entry)
+        self.requests = deque()  # requests (or lists of updates) received by the primary above the high watermark
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.batch = []  # updates received by the primary for the next batch
+        self.batch_timer = None
+        # messages received in the window above the high watermark, one per type, sender and sequence number
+        self.deferred = {}
+        self.lock = threading.RLock()
+        # Blocks added to the chain whose on_block_added is not called yet: it is called after the lock is released
+        # (the broadcast of a global model to the clients doesn't stall the consensus), in the order of the chain
+        self.added = deque()
+        self.added_lock = threading.Lock()
+
+    @property
+    def n_nodes(self):
+        return len(self.node.peers) + 1
+
+    @property
+    def quorum(self):
+        return quorum_size(self.n_nodes)
+
+    def primary(self, view=None):
+        nodes = sorted([self.node_id] + list(self.node.peers))
+        return nodes[(self.view if view is None else view) % len(nodes)]
+
+    def in_window(self, sequence):
+        return self.low < sequence <= self.low + self.window
+
     def handle_message(self, message):
         message_type = message.get("type")
 
-        if message_type == "request":
-            self.request(message["content"])
-            return 
+        if message_type == "request" and message.get("id") == self.node_id:
+            return self.request(message["content"])
 
-        if message["id"] not in self.node.peers: 
-            return  
+        if message["id"] not in self.node.peers:
+            return
 
         public_key = self.node.peers[message["id"]]["public_key"]
         msg = {"type": message["type"], "content": message["content"]}
-        is_valid_signature = self.node.verify_signature(message["signature"], msg, public_key)
+        is_valid_signature = self.node.verify_signature(message["signature"], msg, public_key, message["id"])
 
-        if not is_valid_signature: 
+        if not is_valid_signature:
             logging.warning("Not valid signature: %s", message)
-            return 
+            return
+
+        logging.info("Valid signature: %s", is_valid_signature)
+
+        if message_type == "request":
+            # Request of another node sent to the primary
+            return self.request(message["content"])
+
+        # Only the hash of the block is signed, the content of the message must be the block of this hash
+        block = self.checked_block(message["content"])
+        if block is None:
+            logging.warning("Content of the message doesn't match the hash of the block: %s", message)
+            return
+
+        if message_type not in ["pre-prepare", "prepare", "commit"]:
+            logging.warning("Unknown message type: %s", message_type)
+            return
+
+        with self.lock:
+            prepared = self.dispatch(message_type, message["id"], block, message["content"].get("view", 0),
+                                     message["content"].get("usefull"))
+
+        # The usefulness of the prepared proposals is evaluated outside of the lock
+        for sequence in prepared:
+            self.send_commit(sequence)
+
+        self.notify_added()
+        return "handled"
+
+    def dispatch(self, message_type, sender, block, view, usefull):
+        """
+        Function to handle a message of the consensus (with the lock)
+        :return: list of the sequence numbers prepared by the message
+        """
+        if view != self.view:
+            logging.warning("Node %s: message of view %s in view %s", self.node_id, view, self.view)
+            return []
+
+        sequence = block.index
+        if sequence <= self.low:
+            return []
 
-        logging.info("Valid signature: %s", is_valid_signature)    
+        if not self.in_window(sequence):
+            if sequence > self.low + 2 * self.window:
+                # The messages are accepted up to one window above the high watermark, so a peer can't fill the memory
+                logging.warning("Node %s: message %s of %s for the sequence number %s dropped (above %s)",
+                                self.node_id, message_type, sender, sequence, self.low + 2 * self.window)
+                return []
+
+            # Above the high watermark: handled once the previous sequence numbers are executed
+            self.deferred[(message_type, sender, sequence)] = (message_type, sender, block, view, usefull)
+            return []
 
         if message_type == "pre-prepare":
-            response = self.pre_prepare(message["content"])
+            return self.pre_prepare(sender, block)
         elif message_type == "prepare":
-            response = self.prepare(message["content"])
-        elif message_type == "commit":
-            response = self.commit(message['id'], message["content"])
+            return self.prepare(sender, block)
         else:
-            logging.warning("Unknown message type: %s", message_type)
+            return self.commit(sender, block, usefull)
+
+    def entry(self, sequence):
+        return self.log.setdefault(sequence, {
+            "block": None,  # proposal accepted with the pre-prepare of the primary
+            "prepares": {},  # hash -> nodes whose prepare was received
+            "commits": {},  # hash -> {node: usefull}
+            "prepared": False,
+            "decision": None  # "committed" or "rejected"
+        })
+
+    def checked_block(self, content):
+        """
+        Function to check that the content of a message is the block of its hash (once per block)
+        :param content: content of the message (dictionary of Block.to_dict)
+        :return: the Block, or None if the content doesn't match its hash
+        """
+        block_hash = content.get("current_hash")
+        block = self.blocks.get(block_hash)
+        if block is not None:
+            return block
+
+        try:
+            block = Block.from_dict(content)
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        if block.current_hash != block_hash:
+            return None
 
-        return response
+        # The hashes of the layers are not part of the hash of the block, they are committed by calculated_hash
+        try:
+            requests = batch_requests(block)
+        except (TypeError, ValueError):
+            return None
+
+        for request in requests:
+            if request.layer_hashes is not None and not verify_tree(request.layer_hashes, request.calculated_hash):
+                return None
+
+        self.blocks[block_hash] = block
+        return block
 
     def request(self, content):
-        block = self.create_block_from_request(content)
-        message = {"type": "pre-prepare", "content": block.to_dict()}
-        self.node.broadcast_message(message)
+        if self.primary() != self.node_id:
+            self.node.send_message(self.primary(), {"type": "request", "content": content})
+            return "forwarded"
+
+        with self.lock:
+            if content.get("model_type") == "update" and self.batch_size > 1:
+                self.batch.append(content)
+                if len(self.batch) < self.batch_size:
+                    if self.batch_timer is None:
+                        self.batch_timer = threading.Timer(self.batch_delay, self.flush_batch)
+                        self.batch_timer.daemon = True
+                        self.batch_timer.start()
+                    return "batched"
+
+                self.close_batch()
+            else:
+                # The updates received before are proposed first
+                self.close_batch()
+                self.requests.append(content)
 
+            prepared = self.propose()
+
+        for sequence in prepared:
+            self.send_commit(sequence)
+
+        self.notify_added()
         return "requested"
 
-    def pre_prepare(self, message):
-        logging.info("Node %s received pre-prepare for block: \n%s", self.node_id, message)
+    def close_batch(self):
+        if self.batch_timer is not None:
+            self.batch_timer.cancel()
+            self.batch_timer = None
+
+        if self.batch:
+            self.requests.append(self.batch)
+            self.batch = []
 
-        block = Block(message["index"], message["model_type"], message["storage_reference"], message["calculated_hash"], message["participants"],
-                      message["previous_hash"])
+    def flush_batch(self):
+        # End of batch_delay: the updates of the batch are proposed
+        with self.lock:
+            self.close_batch()
+            prepared = self.propose()
 
-        self.prepare_counts[message["current_hash"]] = 0
+        for sequence in prepared:
+            self.send_commit(sequence)
 
-        message = {"type": "prepare", "content": block.to_dict()}
+        self.notify_added()
+
+    def propose(self):
+        # The primary proposes the requests waiting while the sequence numbers are below the high watermark
+        prepared = []
+        while self.requests and self.in_window(self.next_sequence):
+            block = self.create_block_from_request(self.requests.popleft(), self.next_sequence)
+            self.next_sequence += 1
+            self.blocks[block.current_hash] = block
+
+            entry = self.entry(block.index)
+            entry["block"] = block
+            entry["prepares"].setdefault(block.current_hash, set()).add(self.node_id)
+
+            message = {"type": "pre-prepare", "content": {**block.to_dict(), "view": self.view}}
+            self.node.broadcast_message(message)
+
+            prepared += self.check_prepared(block.index)
+
+        return prepared
+
+    def pre_prepare(self, sender, block):
+        logging.info("Node %s received pre-prepare for block: \n%s", self.node_id, block)
+
+        if sender != self.primary():
+            logging.warning("Node %s: pre-prepare of %s which is not the primary", self.node_id, sender)
+            return []
+
+        entry = self.entry(block.index)
+        if entry["block"] is not None:
+            if entry["block"].current_hash != block.current_hash:
+                logging.warning("Node %s: two proposals for the sequence number %s", self.node_id, block.index)
+            return []
+
+        entry["block"] = block
+        # The pre-prepare is the prepare of the primary
+        entry["prepares"].setdefault(block.current_hash, set()).update([sender, self.node_id])
+
+        message = {"type": "prepare", "content": {**block.to_dict(), "view": self.view}}
         self.node.broadcast_message(message)
 
-        return "pre-prepared"
+        return self.check_prepared(block.index)
 
-    def prepare(self, message):
-        logging.info("Node %s received prepare for block %s", self.node_id, message)
-        block_hash = message["current_hash"]
-        if block_hash not in self.prepare_counts: 
-            self.prepare_counts[block_hash] = 0
-        self.prepare_counts[block_hash] += 1
+    def prepare(self, sender, block):
+        logging.info("Node %s received prepare for block %s", self.node_id, block.current_hash)
+        self.entry(block.index)["prepares"].setdefault(block.current_hash, set()).add(sender)
 
-        if self.is_prepared(block_hash): 
-            if message["model_type"] == "update": 
-                if message["storage_reference"] not in self.model_usefullness: 
-                    self.model_usefullness[message["storage_reference"]] = self.node.is_update_usefull(message["storage_reference"], message["participants"])
+        return self.check_prepared(block.index)
 
-                message["usefull"] = self.model_usefullness[message["storage_reference"]]
+    def check_prepared(self, sequence):
+        entry = self.log[sequence]
+        if entry["block"] is None or entry["prepared"]:
+            return []
 
-                if block_hash not in self.commit_counts: 
-                    self.commit_counts[block_hash] = {"count": 0, "senders": []}
+        if len(entry["prepares"].get(entry["block"].current_hash, ())) < self.quorum:
+            logging.info("Node %s waiting for more prepares for block %s", self.node_id, entry["block"].current_hash)
+            return []
 
-                if message["usefull"] == True and self.node_id not in self.commit_counts[block_hash]["senders"]:
-                    self.commit_counts[block_hash]["count"] += 1
-                    self.commit_counts[block_hash]["senders"].append(self.node_id)
-            else:
-                message["usefull"] = True
+        entry["prepared"] = True
+        return [sequence]
 
-                if block_hash not in self.commit_counts: 
-                    self.commit_counts[block_hash] = {"count": 0, "senders": []}
+    def send_commit(self, sequence):
+        # Vote of this node on the usefulness of a prepared proposal (of each update of a batch)
+        with self.lock:
+            entry = self.log.get(sequence)
+            if entry is None:
+                return
+            block = entry["block"]
 
-                if message["usefull"] == True and self.node_id not in self.commit_counts[block_hash]["senders"]:
-                    self.commit_counts[block_hash]["count"] += 1
-                    self.commit_counts[block_hash]["senders"].append(self.node_id)
+        votes_of_requests = []
+        for request in batch_requests(block):
+            if request.storage_reference not in self.model_usefullness:
+                # The model must be the one of the hashes of the request, then an update must improve the global model
+                self.model_usefullness[request.storage_reference] = self.is_model_valid(request) and (
+                    request.model_type != "update"
+                    or self.node.is_update_usefull(request.storage_reference, list(request.participants)))
+            votes_of_requests.append(self.model_usefullness[request.storage_reference])
 
-            with open("results/BFL/output.txt", "a") as file:
-                file.write(f"node: {self.node_id} model: {message['storage_reference']} message['usefull']: {message['usefull']} commit_counts: {self.commit_counts[block_hash]} \n")
+        usefull = votes_of_requests if block.model_type == BATCH_TYPE else votes_of_requests[0]
 
-            time.sleep(10)
+        with self.lock:
+            if sequence not in self.log:
+                return
 
-            commit_message = {"type": "commit", "content": message}
-            self.node.broadcast_message(commit_message)
-            logging.info("Node %s prepared block to %s", self.node_id, self.node.peers)
-            return "prepared"
-        else:
-            logging.info("Node %s waiting for more prepares for block %s", self.node_id, block_hash)
-            return "waiting"
-
-    def commit(self, sender, message):
-        logging.info("Node %s received commit for block %s", self.node_id, message)
-        block_hash = message["current_hash"]
-
-        if message["model_type"] == "update": 
-            if block_hash not in self.commit_counts: 
-                self.commit_counts[block_hash] = {"count": 0, "senders": []}
-
-            if sender not in self.commit_counts[block_hash]["senders"] and message["usefull"] == True: 
-                self.commit_counts[block_hash]["count"] += 1
-                self.commit_counts[block_hash]["senders"].append(sender)
-        else: 
-            if block_hash not in self.commit_counts: 
-                self.commit_counts[block_hash] = {"count": 0, "senders": []}
-
-            if sender not in self.commit_counts[block_hash]["senders"]: 
-                self.commit_counts[block_hash]["count"] += 1
-                self.commit_counts[block_hash]["senders"].append(sender)
-
-        block = Block(
-            message["index"], 
-            message["model_type"],
-            message["storage_reference"], 
-            message["calculated_hash"], 
-            message["participants"],
-            message["previous_hash"]
-        )
-
-        is_global_model = message["model_type"] in ["first_global_model", "global_model"]
+            votes = self.log[sequence]["commits"].setdefault(block.current_hash, {})
+            votes[self.node_id] = self.votes_of(block, usefull)
 
-        with open("results/BFL/output.txt", "a") as file:
-            file.write(f"node: {self.node_id} model: {message['storage_reference']} sender: {sender} message['usefull']: {message['usefull']} commit_counts: {self.commit_counts[block_hash]} \n")
+            with open("results/BFL/output.txt", "a") as file:
+                file.write(f"node: {self.node_id} model: {block.storage_reference} usefull: {usefull} "
+                           f"commits: {votes} \n")
 
-        if is_global_model or self.can_commit(block_hash):
-            logging.info("Node %s committing block %s", self.node_id, block_hash)
+            message = {"type": "commit", "content": {**block.to_dict(), "view": self.view, "usefull": usefull}}
+            self.node.broadcast_message(message)
+            logging.info("Node %s prepared block to %s", self.node_id, self.node.peers)
 
-            if self.validate_block(message):
-                
-                # il faut améliorer cette condition
-                if self.blockchain.blocks[-1].index + 1 == block.index:
-                    self.blockchain.add_block(block)
+            self.check_decided(sequence)
 
-                if message["model_type"] == "first_global_model" and self.node.global_params_directory == "": 
-                    self.node.global_params_directory = message["storage_reference"]
+        self.notify_added()
 
-                if message["model_type"] == "global_model": 
-                    self.node.global_params_directory = message["storage_reference"]
+    def is_model_valid(self, request):
+        """
+        Function to verify the model of a request layer by layer against the hashes of its layers
+        :return: False if the model can't be read or if a layer doesn't match
+        """
+        try:
+            altered = self.node.verify_model_layers(request)
+        except (OSError, KeyError, ValueError) as e:
+            logging.warning("Node %s: model %s can't be verified: %s", self.node_id, request.storage_reference, e)
+            return False
+
+        if altered:
+            logging.warning("Node %s: layers of %s different from the request: %s", self.node_id,
+                            request.storage_reference, altered)
+        return not altered
 
-                logging.info("Node %s committed block %s", self.node_id, block_hash)
+    def commit(self, sender, block, usefull):
+        logging.info("Node %s received commit for block %s", self.node_id, block.current_hash)
+        votes = self.entry(block.index)["commits"].setdefault(block.current_hash, {})
+        votes[sender] = self.votes_of(block, usefull)
 
-                return "added"
+        with open("results/BFL/output.txt", "a") as file:
+            file.write(f"node: {self.node_id} model: {block.storage_reference} sender: {sender} usefull: {usefull} "
+                       f"commits: {votes} \n")
+
+        self.check_decided(block.index)
+        return []
+
+    @staticmethod
+    def votes_of(block, usefull):
+        # Tuple of the votes of a commit on the updates of the proposal (a malformed vote is not useful)
+        if block.model_type != BATCH_TYPE:
+            return (usefull is True,)
+
+        n_requests = request_count(block)
+        if not isinstance(usefull, list) or len(usefull) != n_requests:
+            return (False,) * n_requests
+
+        return tuple(vote is True for vote in usefull)
+
+    def check_decided(self, sequence):
+        entry = self.log[sequence]
+        if not entry["prepared"] or entry["decision"] is not None:
+            return
+
+        votes = list(entry["commits"].get(entry["block"].current_hash, {}).values())
+        decision = []
+        for position in range(request_count(entry["block"])):
+            n_usefull = sum(vote[position] for vote in votes)
+            if n_usefull >= self.quorum:
+                decision.append(True)
+            elif len(votes) - n_usefull > self.n_nodes - self.quorum:
+                # A quorum of useful commits is not possible anymore
+                decision.append(False)
             else:
-                logging.warning("Invalid block. Discarding commit")
-                return "invalid"
-        else:
-            logging.info("Node %s waiting for more commits for block %s", self.node_id, block_hash)
-            return "waiting"
+                logging.info("Node %s waiting for more commits for block %s", self.node_id,
+                             entry["block"].current_hash)
+                return
+
+        # committed (True) or rejected (False) for each request
+        entry["decision"] = decision
+        self.execute()
+
+    def execute(self):
+        # Execution of the decided proposals in the order of the sequence numbers
+        low = self.low
+        while self.log.get(self.low + 1, {}).get("decision") is not None:
+            entry = self.log.pop(self.low + 1)
+            self.low += 1
+            for request, committed in zip(batch_requests(entry["block"]), entry["decision"]):
+                if committed:
+                    self.add_block(request)
+                else:
+                    logging.info("Node %s rejected block %s", self.node_id, request.current_hash)
+
+                self.decided.add(request.storage_reference)
+
+        if self.low == low:
+            return
+
+        round_events.notify()
+        self.blocks = {block_hash: block for block_hash, block in self.blocks.items() if block.index > self.low}
+
+        # The window moved: messages and requests above the previous high watermark
+        deferred, self.deferred = list(self.deferred.values()), {}
+        prepared = []
+        for message in deferred:
+            prepared += self.dispatch(*message)
+        if self.primary() == self.node_id:
+            prepared += self.propose()
+
+        for sequence in prepared:
+            # The usefulness of a proposal prepared here is evaluated in another thread (the lock is held)
+            threading.Thread(target=self.send_commit, args=(sequence,), daemon=True).start()
+
+    def add_block(self, proposal):
+        last_block = self.blockchain.blocks[-1]
+        block = Block(last_block.index + 1, proposal.model_type, proposal.storage_reference,
+                      proposal.calculated_hash, proposal.participants, last_block.current_hash,
+                      proposal.layer_hashes)
+
+        if not self.validate_block(block.to_dict()):
+            logging.warning("Invalid block. Discarding commit")
+            return
+
+        logging.info("Node %s committing block %s", self.node_id, block.current_hash)
+        self.blockchain.add_block(block)
+
+        if block.model_type == "first_global_model" and self.node.global_params_directory == "":
+            self.node.global_params_directory = block.storage_reference
+
+        if block.model_type == "global_model":
+            self.node.global_params_directory = block.storage_reference
+
+        logging.info("Node %s committed block %s", self.node_id, block.current_hash)
+        self.added.append(block)
+
+    def notify_added(self):
+        """
+        Function to call on_block_added of the node for the blocks added to the chain, called without the lock.
+        A single thread calls it at a time, the other threads leave the blocks they added to it.
+        """
+        while True:
+            if not self.added_lock.acquire(blocking=False):
+                return
+
+            try:
+                while True:
+                    with self.lock:
+                        if not self.added:
+                            break
+                        block = self.added.popleft()
+
+                    self.node.on_block_added(block)
+            finally:
+                self.added_lock.release()
+
+            # A block added after the last check and before the release
+            with self.lock:
+                if not self.added:
+                    return
 
     def validate_block(self, block_data):
         """
@@ -179,6 +525,11 @@ class PBFTProtocol(ConsensusProtocol):
                 or "calculated_hash" not in block_data or "previous_hash" not in block_data):
             return False
 
+        # Verify that the hashes of the layers are the ones committed by calculated_hash
+        if block_data.get("layer_hashes") is not None and not verify_tree(block_data["layer_hashes"],
+                                                                         block_data["calculated_hash"]):
+            return False
+
         # Verify that the index is correctly incremented
         if block_data["index"] != self.blockchain.blocks[-1].index + 1:
             return False
@@ -187,27 +538,30 @@ class PBFTProtocol(ConsensusProtocol):
         previous_block = self.blockchain.blocks[-1] if self.blockchain.blocks else None
         if previous_block and block_data["previous_hash"] != previous_block.current_hash:
             return False
-        
+
         return True
 
-    def create_block_from_request(self, content):
-        previous_blocks = self.blockchain.blocks
-        index_of_new_block = len(previous_blocks)
+    def create_block_from_request(self, content, sequence):
+        if isinstance(content, list):
+            if len(content) > 1:
+                return self.create_batch_from_requests(content, sequence)
+            content = content[0]
+
         model_type = content.get("model_type")
         storage_reference = content.get("storage_reference")
         calculated_hash = content.get("calculated_hash")
         participants = content.get("participants")
-        previous_hash_of_last_block = previous_blocks[-1].current_hash
+        layer_hashes = content.get("layer_hashes")
 
-        # create a new block from the client's request
-        new_block = Block(index_of_new_block, model_type, storage_reference, calculated_hash, participants,
-                          previous_hash_of_last_block)
+        # create the proposal of the client's request, its index is the sequence number (the block of the chain is
+        # created when the proposal is executed)
+        new_block = Block(sequence, model_type, storage_reference, calculated_hash, participants, "", layer_hashes)
 
         return new_block
-    
-    def is_prepared(self, id):
-        return self.prepare_counts[id] >= 1
 
-    def can_commit(self, id):
-        print(self.commit_counts[id])
-        return self.commit_counts[id]["count"] >= 2
\ No newline at end of file
+    def create_batch_from_requests(self, contents, sequence):
+        # Proposal of several updates: lists of their fields, and the hashes of the layers of each storage reference
+        return Block(sequence, BATCH_TYPE, [content.get("storage_reference") for content in contents],
+                     [content.get("calculated_hash") for content in contents],
+                     [content.get("participants") for content in contents], "",
+                     {content.get("storage_reference"): content.get("layer_hashes") for content in contents})
@@ -0,0 +1,41 @@
+import threading
+import time
+
+
+class RoundEvents:
+    """
+    Events of the nodes and of the clients (server listening, share received, block committed or rejected, global
+    model received) on which main_bfl advances the rounds, instead of waiting a fixed time at each step.
+    The entities call notify after each event and the driver waits for a condition on their state, so a round takes
+    the time of its computations and messages. The timeout only guards against a failure (a message lost, a block
+    that is never decided): the round continues after it, as after the fixed waits before.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+
+    def notify(self):
+        with self.condition:
+            self.condition.notify_all()
+
+    def wait_until(self, predicate, timeout, description):
+        """
+        Function to wait until a condition on the state of the nodes and clients is true
+        :param predicate: function without arguments, evaluated after each event
+        :param timeout: maximum time (seconds) to wait
+        :param description: description of the condition for the message of a timeout
+        :return: True if the condition is true, False after the timeout
+        """
+        start = time.time()
+        with self.condition:
+            done = self.condition.wait_for(predicate, timeout=timeout)
+
+        if not done:
+            print(f"Timeout ({timeout} s) waiting for {description}, the round continues")
+        else:
+            print(f"Waited {time.time() - start:.2f} s for {description}")
+
+        return done
+
+
+# Events of the entities of the process (the nodes and the clients of main_bfl run in the same process)
+round_events = RoundEvents()
@@ -0,0 +1,181 @@
+import base64
+import hashlib
+import json
+import struct
+import threading
+from collections import OrderedDict
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, padding, rsa
+
+
+# %% ///////////////////////////////////////////// Keys /////////////////////////////////////////////////////////////////
+# "rsa": RSA-2048 with PSS (signature ~0.6 ms), "ed25519": Ed25519 (signature ~0.05 ms, 64 bytes)
+KEY_TYPES = ["rsa", "ed25519"]
+
+
+def generate_private_key(key_type="rsa"):
+    if key_type == "rsa":
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+
+    elif key_type == "ed25519":
+        return ed25519.Ed25519PrivateKey.generate()
+
+    raise ValueError(f"key_type must be one of {KEY_TYPES}, not {key_type}")
+
+
+def key_type_of(key):
+    return "ed25519" if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)) else "rsa"
+
+
+def private_key_bytes(private_key):
+    # The RSA keys are saved in the same format as before, Ed25519 keys only exist in PKCS8
+    return private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=(serialization.PrivateFormat.PKCS8 if key_type_of(private_key) == "ed25519"
+                else serialization.PrivateFormat.TraditionalOpenSSL),
+        encryption_algorithm=serialization.NoEncryption()
+    )
+
+
+# %% ////////////////////////////////////////// Signatures //////////////////////////////////////////////////////////////
+def sign(private_key, data):
+    """
+    Function to sign data with a RSA or Ed25519 private key
+    :return: the signature in base64
+    """
+    if key_type_of(private_key) == "ed25519":
+        signature = private_key.sign(data)
+    else:
+        signature = private_key.sign(
+            data,
+            padding.PSS(
+                mgf=padding.MGF1(hashes.SHA256()),
+                salt_length=padding.PSS.MAX_LENGTH
+            ),
+            hashes.SHA256()
+        )
+
+    return base64.b64encode(signature).decode()
+
+
+def verify(public_key, signature, data):
+    """
+    Function to verify a signature (base64) of data, raises InvalidSignature if it is not valid
+    """
+    signature_binary = base64.b64decode(signature)
+    if key_type_of(public_key) == "ed25519":
+        public_key.verify(signature_binary, data)
+    else:
+        public_key.verify(
+            signature_binary,
+            data,
+            padding.PSS(
+                mgf=padding.MGF1(hashes.SHA256()),
+                salt_length=padding.PSS.MAX_LENGTH
+            ),
+            hashes.SHA256()
+        )
+
+
+# %% ////////////////////////////////////////// Digests /////////////////////////////////////////////////////////////////
+# The signature of a message is the signature of a fixed-size digest instead of the json of the whole message.
+# For the PBFT messages the digest is made of the hash of the block (which commits to its content, the content of the
+# message is checked against it by the receiver), the type of the message, the sender, the view, the sequence number
+# and the vote (usefull) of the commits, so the cost doesn't depend on the size of the block (participants, layers).
+# The commit of a batch of updates has a vote for each update, they follow the fixed part (one byte per update).
+# The other messages (Raft) are signed with the canonical json of the message (sorted keys, compact).
+PBFT_MESSAGE_TYPES = {"pre-prepare": 1, "prepare": 2, "commit": 3}
+DIGEST_STRUCT = struct.Struct("!8sB32sQQB")  # domain, type, hash of the block, view, sequence, vote
+VOTES = {False: 1, True: 2}  # 0 when there is no vote
+
+
+def message_digest(message, sender):
+    """
+    Function to compute the digest of a message signed by its sender
+    :param message: the message without its signature and id (type and content)
+    :param sender: id of the sender
+    :return: the digest (32 bytes)
+    Raises KeyError, TypeError or ValueError if the fields of a PBFT message can't be packed in the digest
+    """
+    content = message.get("content")
+    message_type = PBFT_MESSAGE_TYPES.get(message.get("type"))
+    if message_type is not None and isinstance(content, dict) and "current_hash" in content:
+        block_hash = bytes.fromhex(content["current_hash"])
+        view, sequence = content.get("view", 0), content.get("sequence", content["index"])
+        if len(block_hash) != 32:
+            raise ValueError(f"hash of the block of {len(block_hash)} bytes instead of 32")
+        for field in (view, sequence):
+            if not isinstance(field, int) or not 0 <= field < 2 ** 64:
+                raise ValueError(f"view and sequence must be integers between 0 and 2**64 - 1, not {field!r}")
+
+        usefull = content.get("usefull")
+        votes = usefull if isinstance(usefull, list) else []
+        data = DIGEST_STRUCT.pack(b"BFL-PBFT", message_type, block_hash, view, sequence,
+                                  0 if isinstance(usefull, list) else VOTES.get(usefull, 0))
+        data += bytes(VOTES.get(vote, 0) for vote in votes)
+    else:
+        data = b"BFL-JSON" + json.dumps(message, sort_keys=True, separators=(",", ":")).encode()
+
+    return hashlib.sha256(data + sender.encode()).digest()
+
+
+class SignatureVerifier:
+    """
+    Verification of the signatures of the messages received, with a cache of the verified signatures (a message
+    received again, for example sent again by a peer or relayed, is not verified again).
+    The messages of a peer are verified in their order of reception by the thread of its connection (a prepare must
+    not be handled before its pre-prepare), the connections of the peers are verified in parallel.
+    """
+    def __init__(self, cache_size=65536):
+        self.cache_size = cache_size
+        self.verified = OrderedDict()  # digest of (public key, signature, data) of the verified signatures
+        self.fingerprints = {}  # id of the public key -> (public key, hash of the public key)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def fingerprint(self, public_key):
+        # The public key is kept with its fingerprint, so its id is not reused by another key
+        with self.lock:
+            known = self.fingerprints.get(id(public_key))
+        if known is not None:
+            return known[1]
+
+        fingerprint = hashlib.sha256(public_key.public_bytes(
+            encoding=serialization.Encoding.DER,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )).digest()
+        with self.lock:
+            self.fingerprints[id(public_key)] = (public_key, fingerprint)
+        return fingerprint
+
+    def verify(self, public_key, signature, data):
+        """
+        Function to verify a signature
+        :param public_key: public key of the sender
+        :param signature: the signature in base64
+        :param data: the signed bytes
+        :return: True if the signature is valid
+        """
+        digest = hashlib.sha256(self.fingerprint(public_key) + signature.encode() + data).digest()
+        with self.lock:
+            if digest in self.verified:
+                self.verified.move_to_end(digest)
+                self.hits += 1
+                return True
+            self.misses += 1
+
+        try:
+            verify(public_key, signature, data)
+        except (InvalidSignature, ValueError):
+            return False
+
+        with self.lock:
+            self.verified[digest] = True
+            if len(self.verified) > self.cache_size:
+                self.verified.popitem(last=False)
+
+        return True
@@ -0,0 +1,46 @@
+import os
+import tempfile
+
+import numpy as np
+
+from model_hash import CHUNK_SIZE, hash_model, hash_model_file
+
+
+# %%
+def model_weights():
+    # Model whose largest layer spans several chunks of the Merkle tree
+    rng = np.random.default_rng(0)
+    return {
+        "conv1.weight": rng.standard_normal((32, 3, 3, 3)).astype(np.float32),
+        "fc1.weight": rng.standard_normal((3 * CHUNK_SIZE // 4 + 17,)).astype(np.float32),
+        "fc1.bias": rng.standard_normal(10).astype(np.float32),
+        "len_dataset": np.array(10)
+    }
+
+
+def test_interior_weight_changes_hash():
+    """
+    The change of a single weight in the middle of a layer (elided by the repr of the arrays) must change the hash
+    of the model, in memory and in a .npz file
+    """
+    weights = model_weights()
+    modified_weights = dict(weights)
+    modified_weights["fc1.weight"] = weights["fc1.weight"].copy()
+    modified_weights["fc1.weight"][weights["fc1.weight"].size // 2] += 1e-3
+
+    assert hash_model(weights) == hash_model(model_weights())
+    assert hash_model(weights) != hash_model(modified_weights)
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "model.npz")
+        modified_filename = os.path.join(directory, "modified.npz")
+        np.savez(filename, **weights)
+        np.savez(modified_filename, **modified_weights)
+
+        assert hash_model_file(filename) == hash_model(weights)
+        assert hash_model_file(filename) != hash_model_file(modified_filename)
+
+
+if __name__ == '__main__':
+    test_interior_weight_changes_hash()
+    print("test_model_hash: OK")
@@ -0,0 +1,37 @@
+from signatures import SignatureVerifier, generate_private_key, message_digest, sign
+
+
+# %%
+def commit_message(**fields):
+    content = {"index": 3, "current_hash": "ab" * 32, "view": 0, "usefull": True}
+    content.update(fields)
+    return {"type": "commit", "content": content}
+
+
+def test_digest_signed_and_verified():
+    key = generate_private_key("ed25519")
+    digest = message_digest(commit_message(), "n1")
+    assert SignatureVerifier().verify(key.public_key(), sign(key, digest), digest)
+    assert message_digest(commit_message(usefull=False), "n1") != digest
+    assert message_digest(commit_message(), "n2") != digest
+
+
+def test_malformed_fields_rejected():
+    """
+    A PBFT message whose view, sequence or hash doesn't fit in the digest raises ValueError (a malformed message for
+    Node.verify_signature), not struct.error
+    """
+    for fields in [{"view": -1}, {"view": 2 ** 64}, {"index": -1}, {"index": 2 ** 70}, {"sequence": 2 ** 70},
+                   {"view": "0"}, {"current_hash": "ab" * 40}]:
+        try:
+            message_digest(commit_message(**fields), "n1")
+        except ValueError:
+            continue
+
+        raise AssertionError(f"message with {fields} not rejected")
+
+
+if __name__ == '__main__':
+    test_digest_signed_and_verified()
+    test_malformed_fields_rejected()
+    print("test_signatures: OK")
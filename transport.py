@@ -0,0 +1,452 @@
+import asyncio
+import logging
+import pickle
+import queue
+import socket
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# %% ///////////////////////////////////////////// Framing ////////////////////////////////////////////////////////////
+# A frame is the length of the payload (8 bytes) followed by the payload:
+# | header length (4 B) | number of tensors (4 B) | length of each tensor (8 B each) | header | tensors |
+# The header is the pickle of the message where each numpy array is replaced by a reference to its buffer
+# (pickle protocol 5), the tensors are the raw bytes of these arrays, each one aligned on ALIGNMENT bytes.
+# So the weights are neither copied in a pickle on the sender side nor on the receiver side.
+LENGTH_STRUCT = struct.Struct("!Q")
+PREFIX_STRUCT = struct.Struct("!II")
+ALIGNMENT = 64
+MAX_IOV = 512  # Maximum number of buffers given to one sendmsg call
+
+
+def encode_message(message):
+    """
+    Serialize a message (a dictionary) before sending it on a connection.
+    The numpy arrays of the message are referenced, not copied, so they must not be modified until the message is sent.
+    :param message: the message to serialize
+    :return: the payload of the frame as a list of buffers
+    """
+    pickle_buffers = []
+    header = pickle.dumps(message, protocol=5, buffer_callback=pickle_buffers.append)
+    tensors = [buffer.raw() for buffer in pickle_buffers]
+
+    prefix = (PREFIX_STRUCT.pack(len(header), len(tensors))
+              + struct.pack(f"!{len(tensors)}Q", *[tensor.nbytes for tensor in tensors]))
+
+    payload = [prefix, header]
+    offset = len(prefix) + len(header)
+    for tensor in tensors:
+        padding = -offset % ALIGNMENT
+        if padding:
+            payload.append(bytes(padding))
+            offset += padding
+
+        payload.append(tensor)
+        offset += tensor.nbytes
+
+    return payload
+
+
+def decode_message(payload):
+    """
+    Deserialize the payload of a frame received on a connection.
+    The numpy arrays of the message are views on the payload (no copy), they are writable if the payload is.
+    :param payload: the payload of the frame (bytearray)
+    :return: the message (a dictionary)
+    """
+    view = memoryview(payload)
+    header_length, n_tensors = PREFIX_STRUCT.unpack_from(view, 0)
+    lengths = struct.unpack_from(f"!{n_tensors}Q", view, PREFIX_STRUCT.size)
+
+    offset = PREFIX_STRUCT.size + 8 * n_tensors
+    header = view[offset:offset + header_length]
+    offset += header_length
+
+    tensors = []
+    for length in lengths:
+        offset += -offset % ALIGNMENT
+        tensors.append(view[offset:offset + length])
+        offset += length
+
+    return pickle.loads(header, buffers=tensors)
+
+
+def payload_size(payload):
+    return sum(memoryview(buffer).nbytes for buffer in payload)
+
+
+def send_buffers(sock, buffers):
+    """
+    Send a list of buffers with as few system calls as possible (scatter/gather with sendmsg when available)
+    """
+    views = [memoryview(buffer).cast('B') for buffer in buffers if memoryview(buffer).nbytes]
+    if not hasattr(sock, "sendmsg"):
+        for view in views:
+            sock.sendall(view)
+        return
+
+    first = 0  # index of the first buffer not completely sent
+    while first < len(views):
+        sent = sock.sendmsg(views[first:first + MAX_IOV])
+        # Skip what was sent, sendmsg can stop in the middle of a buffer
+        while sent:
+            if sent >= views[first].nbytes:
+                sent -= views[first].nbytes
+                first += 1
+            else:
+                views[first] = views[first][sent:]
+                sent = 0
+
+
+def send_frame(sock, payload):
+    """
+    Send one frame on the socket: the length of the payload (8 bytes) followed by the payload
+    :param sock: the connected socket
+    :param payload: the serialized message (list of buffers)
+    """
+    send_buffers(sock, [LENGTH_STRUCT.pack(payload_size(payload)), *payload])
+
+
+class FrameReader:
+    """
+    Reader of the frames of a connection shared by the nodes and the clients.
+    The fixed-size fields are read in a small buffer reused for every frame and the tensors of a frame are read with
+    recv_into in one buffer allocated at its final size, so the payload is never reallocated or copied.
+    The tensors are decoded while they arrive: the header is unpickled first and receives each tensor when
+    it needs it.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.scratch = bytearray(max(LENGTH_STRUCT.size, PREFIX_STRUCT.size))
+        self.scratch_view = memoryview(self.scratch)
+
+    def recv_into(self, view):
+        """
+        Fill the view with the next bytes of the connection
+        :return: False if the connection was closed before the view was full
+        """
+        received = 0
+        while received < view.nbytes:
+            n_received = self.sock.recv_into(view[received:])
+            if not n_received:
+                return False
+            received += n_received
+
+        return True
+
+    def recv_exactly(self, view):
+        if not self.recv_into(view):
+            raise ConnectionError("Data was truncated or connection was closed prematurely.")
+
+    def read_frame(self):
+        """
+        Read and decode one frame
+        :return: the message or None if the connection was closed between two frames
+        """
+        if not self.recv_into(self.scratch_view[:LENGTH_STRUCT.size]):
+            return None
+
+        data_length = LENGTH_STRUCT.unpack_from(self.scratch)[0]
+
+        self.recv_exactly(self.scratch_view[:PREFIX_STRUCT.size])
+        header_length, n_tensors = PREFIX_STRUCT.unpack_from(self.scratch)
+
+        metadata = bytearray(8 * n_tensors + header_length)
+        self.recv_exactly(memoryview(metadata))
+        lengths = struct.unpack_from(f"!{n_tensors}Q", metadata)
+        header = memoryview(metadata)[8 * n_tensors:]
+
+        offset = PREFIX_STRUCT.size + len(metadata)
+        tensors_region = bytearray(data_length - offset)
+        region_view = memoryview(tensors_region)
+
+        def receive_tensors():
+            position = 0
+            for length in lengths:
+                # The padding is read in the region too, it keeps the tensors aligned in memory
+                padding = -(offset + position) % ALIGNMENT
+                self.recv_exactly(region_view[position:position + padding + length])
+                position += padding
+                yield region_view[position:position + length]
+                position += length
+
+        return pickle.loads(header, buffers=receive_tensors())
+
+
+# %% ///////////////////////////////////////////// Server /////////////////////////////////////////////////////////////
+def serve_connection(client_socket, handle_message):
+    """
+    Read the frames of a connection until the peer closes it and give each decoded message to handle_message.
+    A connection is kept open by the sender (see ConnectionPool) so it can carry any number of messages.
+    """
+    reader = FrameReader(client_socket)
+    try:
+        while True:
+            message = reader.read_frame()
+            if message is None:
+                break
+
+            dispatch_message(handle_message, message)
+
+    except (OSError, pickle.UnpicklingError) as e:
+        print(f"Connection error: {e}")
+
+    finally:
+        client_socket.close()
+
+
+def start_server(host, port, handle_message, num_node, mode="thread", max_workers=8, on_listen=None):
+    """
+    Start the server of an entity and give each received message to handle_message
+    :param mode: "thread" (one thread per connection) or "asyncio" (one event loop and a bounded pool of workers)
+    :param max_workers: number of workers used to handle the messages in asyncio mode
+    :param on_listen: function called without arguments once the server accepts connections, or None
+    """
+    if mode == "asyncio":
+        asyncio.run(start_server_async(host, port, handle_message, num_node, max_workers, on_listen))
+        return
+
+    elif mode != "thread":
+        raise ValueError("Server mode not recognized")
+
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind((host, port))
+    server_socket.listen(128)
+    print(f"Node {num_node} listening on {host}:{port}")
+    if on_listen is not None:
+        on_listen()
+
+    while True:
+        client_socket, addr = server_socket.accept()
+        # One thread per connection (so per peer), not per message
+        threading.Thread(target=serve_connection, args=(client_socket, handle_message), daemon=True).start()
+
+
+async def recv_exact_async(loop, sock, n_bytes):
+    """
+    Read exactly n_bytes from the socket with recv_into in a buffer allocated once (used by the asyncio server)
+    :return: the bytearray read or None if the connection was closed before the end
+    """
+    buffer = bytearray(n_bytes)
+    view = memoryview(buffer)
+    received = 0
+    while received < n_bytes:
+        n_received = await loop.sock_recv_into(sock, view[received:])
+        if not n_received:
+            return None
+        received += n_received
+
+    return buffer
+
+
+async def serve_connection_async(client_socket, handle_message, executor, semaphore):
+    """
+    Coroutine reading the frames of a connection.
+    The messages of a connection are handled in order by the workers of the executor (the CPU-heavy steps such as
+    the evaluations, the aggregations or the signature checks don't block the event loop). While a message is
+    handled, the next frames are not read, so a peer sending faster than we can handle is slowed down by TCP.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            data_length_bytes = await recv_exact_async(loop, client_socket, LENGTH_STRUCT.size)
+            if data_length_bytes is None:
+                break  # The peer closed the connection between two frames
+
+            data_length = LENGTH_STRUCT.unpack(data_length_bytes)[0]
+            data = await recv_exact_async(loop, client_socket, data_length)
+            if data is None:
+                print("Data was truncated or connection was closed prematurely.")
+                break
+
+            # Bound the number of messages handled at the same time by all the connections
+            async with semaphore:
+                await loop.run_in_executor(executor, dispatch_payload, handle_message, data)
+
+    except OSError as e:
+        print(f"Connection error: {e}")
+
+    finally:
+        client_socket.close()
+
+
+def dispatch_message(handle_message, message):
+    # An error in the handling of one message must not close the connection of the peer
+    try:
+        handle_message(message)
+
+    except Exception:
+        logging.exception("Error while handling a message")
+
+
+def dispatch_payload(handle_message, payload):
+    dispatch_message(handle_message, decode_message(payload))
+
+
+async def start_server_async(host, port, handle_message, num_node, max_workers=8, on_listen=None):
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{num_node}_worker")
+    semaphore = asyncio.Semaphore(max_workers)
+
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind((host, port))
+    server_socket.listen(128)
+    server_socket.setblocking(False)
+    print(f"Node {num_node} listening on {host}:{port} (asyncio)")
+    if on_listen is not None:
+        on_listen()
+
+    connections = set()
+    while True:
+        client_socket, addr = await loop.sock_accept(server_socket)
+        client_socket.setblocking(False)
+        task = loop.create_task(serve_connection_async(client_socket, handle_message, executor, semaphore))
+        # Keep a reference on the task until the connection is closed
+        connections.add(task)
+        task.add_done_callback(connections.discard)
+
+
+# %% ///////////////////////////////////////////// Connection pool ////////////////////////////////////////////////////
+class PeerConnection:
+    """
+    Long-lived connection to one peer with its own send queue.
+    The frames put in the queue are sent in order by a dedicated thread, so any number of threads can share
+    the connection without waiting for the network.
+    """
+    def __init__(self, address, connect_timeout=5.0):
+        self.address = address
+        self.connect_timeout = connect_timeout
+
+        self.sock = None
+        self.queue = queue.Queue()
+
+        self.messages_sent = 0
+        self.bytes_sent = 0
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def send(self, payload):
+        self.queue.put(payload)
+
+    def connect(self):
+        self.sock = socket.create_connection(self.address, timeout=self.connect_timeout)
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def disconnect(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def send_payload(self, payload):
+        # A connection closed by the peer is only detected on the next send, so we try once with a new one
+        for attempt in range(2):
+            try:
+                if self.sock is None:
+                    self.connect()
+
+                send_frame(self.sock, payload)
+                self.messages_sent += 1
+                self.bytes_sent += payload_size(payload) + LENGTH_STRUCT.size
+                return True
+
+            except OSError:
+                self.disconnect()
+
+        return False
+
+    def run(self):
+        while True:
+            payload = self.queue.get()
+            try:
+                if payload is None:
+                    break
+
+                if not self.send_payload(payload):
+                    print(f"Message to {self.address} dropped (peer unreachable).")
+
+            finally:
+                self.queue.task_done()
+
+        self.disconnect()
+
+    def flush(self):
+        """
+        Wait until every frame of the queue has been sent
+        """
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+class ConnectionPool:
+    """
+    Pool of the connections of an entity (Node or Client) to its peers, with one PeerConnection per address.
+    """
+    def __init__(self, connect_timeout=5.0):
+        self.connect_timeout = connect_timeout
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    def get_connection(self, address):
+        address = tuple(address)
+        with self.lock:
+            if address not in self.connections:
+                self.connections[address] = PeerConnection(address, self.connect_timeout)
+
+            return self.connections[address]
+
+    def send(self, address, message):
+        """
+        Serialize the message and put it in the send queue of the peer
+        :param address: (host, port) of the peer
+        :param message: the message to send
+        :return: the size of the serialized message
+        """
+        payload = encode_message(message)
+        self.get_connection(address).send(payload)
+        return payload_size(payload)
+
+    def broadcast(self, addresses, message):
+        """
+        Serialize the message once and put it in the send queue of each peer
+        :return: the size of the serialized message
+        """
+        payload = encode_message(message)
+        for address in addresses:
+            self.get_connection(address).send(payload)
+        return payload_size(payload)
+
+    def flush(self, addresses=None):
+        """
+        Wait until the messages to the given peers (all the peers by default) are sent
+        """
+        if addresses is None:
+            connections = list(self.connections.values())
+        else:
+            connections = [self.get_connection(address) for address in addresses]
+
+        for connection in connections:
+            connection.flush()
+
+    def close(self):
+        with self.lock:
+            connections = list(self.connections.values())
+            self.connections = {}
+
+        for connection in connections:
+            connection.close()
+
+    @property
+    def bytes_sent(self):
+        return sum(connection.bytes_sent for connection in list(self.connections.values()))
+
+    @property
+    def messages_sent(self):
+        return sum(connection.messages_sent for connection in list(self.connections.values()))